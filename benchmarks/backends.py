@@ -0,0 +1,93 @@
+'''Compare the throughput and round trip latency of the PIPE, QUEUE and ring buffer backends.
+
+    $ python -m benchmarks.backends --messages 20000
+'''
+import argparse
+import multiprocessing
+import statistics
+import time
+
+from pymulproc import factory, mpq_protocol
+
+BACKENDS = {
+    'pipe': factory.PipeCommunication,
+    'queue': factory.QueueCommunication,
+    # Replies are addressed to the parent's mailbox so that they never end up in the shared queue the child reads
+    'queue_routed': lambda **kwargs: factory.QueueCommunication(routed=True, max_peers=2, **kwargs),
+    'ring': factory.RingBufferCommunication,
+}
+
+
+def echo(comm_factory, messages):
+    '''Send back every message addressed to us'''
+    child = comm_factory.child()
+    pid = multiprocessing.current_process().pid
+    for _ in range(messages):
+        message = False
+        while not message:  # On the plain QUEUE our own replies have to be skipped
+            message = child.receive(block=True, func=lambda x: x.recipient_pid == pid)
+        child.send(mpq_protocol.REQ_FINISHED, recipient_pid=message.sender_pid, data=message.data)
+
+
+def consume(comm_factory, messages):
+    '''Receive all messages and acknowledge the last one'''
+    child = comm_factory.child()
+    for _ in range(messages):
+        message = child.receive(block=True)
+    child.send(mpq_protocol.REQ_FINISHED, recipient_pid=message.sender_pid)
+
+
+def ping_pong(backend, messages, payload):
+    '''Return the round trip time of each message sent to a child process that echoes it back'''
+    comm_factory = BACKENDS[backend]()
+    parent = comm_factory.parent()
+    child_process = multiprocessing.Process(target=echo, args=(comm_factory, messages))
+    child_process.start()
+    latencies = []
+    for _ in range(messages):
+        start = time.perf_counter()
+        parent.send(mpq_protocol.REQ_DO, recipient_pid=child_process.pid, data=payload)
+        # Until the child registers its mailbox, requests go through the shared queue the parent may wake up on too
+        while not parent.receive(block=True, func=lambda x: x.recipient_pid == parent.pid):
+            pass
+        latencies.append(time.perf_counter() - start)
+    child_process.join()
+    return latencies
+
+
+def stream(backend, messages, payload, **options):
+    '''Return the messages per second sent to a child process that just consumes them. 'options' are given to the
+    factory of the backend
+    '''
+    comm_factory = BACKENDS[backend](**options)
+    parent = comm_factory.parent()
+    child_process = multiprocessing.Process(target=consume, args=(comm_factory, messages))
+    child_process.start()
+    start = time.perf_counter()
+    for _ in range(messages):
+        parent.send(mpq_protocol.REQ_DO, data=payload)
+    while not parent.receive(block=True, func=lambda x: x.recipient_pid == parent.pid):
+        pass
+    elapsed = time.perf_counter() - start
+    child_process.join()
+    return messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--payload', type=int, default=64, help='bytes of data carried by each message')
+    parser.add_argument('--backends', nargs='+', choices=sorted(BACKENDS), default=list(BACKENDS))
+    args = parser.parse_args()
+
+    payload = b'x' * args.payload
+    print(f"{'backend':<14}{'msgs/s':>12}{'p50 us':>10}{'p99 us':>10}")
+    for backend in args.backends:
+        throughput = stream(backend, args.messages, payload)
+        latencies = ping_pong(backend, args.messages, payload)
+        percentiles = statistics.quantiles(latencies, n=100)
+        print(f"{backend:<14}{throughput:>12,.0f}{percentiles[49] * 1e6:>10.1f}{percentiles[98] * 1e6:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
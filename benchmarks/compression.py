@@ -0,0 +1,124 @@
+'''Find the payload size from which compressing messages pays off on the PIPE and QUEUE backends.
+
+    $ python -m benchmarks.compression --json results.json
+
+Messages are streamed to a child process that just consumes them, with no compression and then with every codec
+available - lz4 and zstd only if installed - compressing payloads of any size. Two kinds of payload are sent: JSON-like
+structures of text and numbers, which compress well, and random bytes, which do not compress at all and show what
+trying costs. The crossover of a codec is the smallest payload size from which its throughput in bytes per second
+beats sending the payload as it is, for such backend and kind of payload.
+'''
+import argparse
+import os
+import sys
+
+from benchmarks import backends, report
+from pymulproc import compression, mpq_protocol
+
+PAYLOAD_SIZES = (256, 1024, 4096, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024)
+KINDS = ('json', 'random')
+BYTES_BUDGET = 16 * 1024 * 1024
+MIN_MESSAGES = 4
+
+BACKENDS = ('pipe', 'queue', 'queue_routed')
+
+
+def codecs():
+    '''Return the names of the compressors that can be used here'''
+    available = []
+    for name in compression.COMPRESSORS:
+        try:
+            compression.get_compressor(name)
+        except ImportError:
+            continue
+        available.append(name)
+    return available
+
+
+def build_payload(kind, size):
+    '''Return a payload of about 'size' bytes once pickled'''
+    if kind == 'random':
+        return os.urandom(size)
+    row = {'id': 0, 'name': 'customer', 'country': 'ES', 'balance': 1234.5, 'tags': ['new', 'premium']}
+    rows = max(1, size // 32)  # about the bytes each row takes once pickled
+    return [{**row, 'id': value, 'balance': value * 1.5} for value in range(rows)]
+
+
+def measure(backend, codec, kind, size, messages):
+    '''Run one stream and return its results as a dictionary'''
+    payload = build_payload(kind, size)
+    plain = len(mpq_protocol.Message(mpq_protocol.REQ_DO, 1, None, payload).encode())
+    compressor = compression.get_compressor(codec)
+    frame = len(mpq_protocol.Message(mpq_protocol.REQ_DO, 1, None, payload).encode(compressor=compressor, threshold=0))
+    messages = max(MIN_MESSAGES, min(messages, BYTES_BUDGET // plain))
+    throughput = backends.stream(backend, messages, payload, compression=codec, compression_threshold=0)
+    return {
+        'backend': backend,
+        'codec': codec or 'none',
+        'kind': kind,
+        'payload': plain,
+        'frame': frame,
+        'ratio': plain / frame,
+        'messages': messages,
+        'msgs_per_s': throughput,
+        'mb_per_s': throughput * plain / 1e6,
+    }
+
+
+def crossovers(results):
+    '''Return the smallest payload size from which each codec beats no compression at every larger size measured, per
+    backend and kind of payload. None means it does not beat it even at the largest size
+    '''
+    plain = {(result['backend'], result['kind'], result['payload']): result['mb_per_s']
+             for result in results if result['codec'] == 'none'}
+    outcomes = {}
+    for result in results:
+        if result['codec'] != 'none':
+            wins = result['mb_per_s'] > plain[(result['backend'], result['kind'], result['payload'])]
+            key = (result['backend'], result['kind'], result['codec'])
+            outcomes.setdefault(key, []).append((result['payload'], wins))
+    summary = []
+    for (backend, kind, codec), runs in sorted(outcomes.items()):
+        crossover = None
+        for size, wins in sorted(runs, reverse=True):
+            if not wins:
+                break
+            crossover = size
+        summary.append({'backend': backend, 'kind': kind, 'codec': codec, 'crossover': crossover})
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000, help='messages per run for small payloads')
+    parser.add_argument('--payloads', type=int, nargs='+', default=PAYLOAD_SIZES, help='sizes in bytes')
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=KINDS)
+    parser.add_argument('--codecs', nargs='+', choices=sorted(compression.COMPRESSORS), default=codecs())
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--json', metavar='PATH', help="write the results as JSON into PATH - '-' for stdout")
+    args = parser.parse_args()
+
+    print(f"{'backend':<14}{'kind':<8}{'codec':<6}{'payload':>10}{'ratio':>8}{'msgs/s':>12}{'MB/s':>10}",
+          file=sys.stderr)
+    results = []
+    for backend in args.backends:
+        for kind in args.kinds:
+            for size in args.payloads:
+                for codec in [None] + args.codecs:
+                    result = measure(backend, codec, kind, size, args.messages)
+                    results.append(result)
+                    print(f"{backend:<14}{kind:<8}{result['codec']:<6}{result['payload']:>10}{result['ratio']:>8.2f}"
+                          f"{result['msgs_per_s']:>12,.0f}{result['mb_per_s']:>10.1f}", file=sys.stderr)
+
+    print(f"\n{'backend':<14}{'kind':<8}{'codec':<6}{'crossover':>10}", file=sys.stderr)
+    summary = crossovers(results)
+    for crossover in summary:
+        size = crossover['crossover'] if crossover['crossover'] is not None else 'never'
+        print(f"{crossover['backend']:<14}{crossover['kind']:<8}{crossover['codec']:<6}{size:>10}", file=sys.stderr)
+
+    if args.json:
+        report.write(args.json, results, crossovers=summary)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+'''Compare the round trip latency of children left to the scheduler with children pinned by each placement policy.
+
+    $ python -m benchmarks.placement --children 2 8 --json results.json
+
+Rounds of one message addressed to each child are sent, as in the fan_out scenario of benchmarks.suite, and each child
+replies to the parent. With a policy the parent takes the first CPU set of the plan and the children the rest, so with
+'compact' everybody shares a NUMA node while with 'spread' replies cross nodes. On a single node machine the policies
+only differ from no pinning in that processes never migrate between CPUs.
+'''
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from benchmarks import report, suite
+from pymulproc import placement
+
+PAYLOAD_SIZES = (16, 64 * 1024)
+CHILDREN = (1, 4)
+POLICIES = ('none', ) + placement.POLICIES
+
+
+def fan_out(backend, messages, payload, children, policy):
+    '''Return the latency of each message of benchmarks.suite's fan out, with the parent and children pinned as the
+    policy says
+    '''
+    affinity = os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else None
+    cpus = placement.plan(children + 1, policy) if policy != 'none' else [None] * (children + 1)
+    if cpus[0] is not None:
+        placement.pin(cpus[0])
+    try:
+        return suite.fan_out(backend, messages, payload, children, cpus[1:])
+    finally:
+        if affinity is not None:
+            placement.pin(affinity)
+
+
+def measure(backend, policy, messages, payload, children):
+    '''Run one fan out and return its results as a dictionary'''
+    start = time.perf_counter()
+    latencies = fan_out(backend, messages, payload, children, policy)
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [latencies[0]] * 99
+    return {
+        'backend': backend,
+        'policy': policy,
+        'payload': len(payload),
+        'children': children,
+        'messages': len(latencies),
+        'msgs_per_s': len(latencies) / (time.perf_counter() - start),
+        'p50_us': percentiles[49] * 1e6,
+        'p99_us': percentiles[98] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000, help='messages per run')
+    parser.add_argument('--payloads', type=int, nargs='+', default=PAYLOAD_SIZES, help='sizes in bytes')
+    parser.add_argument('--children', type=int, nargs='+', default=CHILDREN)
+    parser.add_argument('--policies', nargs='+', choices=POLICIES, default=POLICIES)
+    parser.add_argument('--backends', nargs='+', choices=sorted(suite.FAN_OUT_BACKENDS),
+                        default=['pipe', 'queue_routed'])
+    parser.add_argument('--json', metavar='PATH', help="write the results as JSON into PATH - '-' for stdout")
+    args = parser.parse_args()
+
+    nodes = placement.topology()
+    print(f"NUMA nodes: {len(nodes)} - CPUs: {', '.join(str(len(node)) for node in nodes)}", file=sys.stderr)
+    print(f"{'backend':<14}{'policy':<10}{'payload':>10}{'children':>9}{'msgs/s':>12}{'p50 us':>10}{'p99 us':>10}",
+          file=sys.stderr)
+    results = []
+    for backend in args.backends:
+        for size in args.payloads:
+            payload = b'x' * size
+            for children in args.children:
+                for policy in args.policies:
+                    result = measure(backend, policy, args.messages, payload, children)
+                    results.append(result)
+                    print(f"{backend:<14}{policy:<10}{size:>10}{children:>9}{result['msgs_per_s']:>12,.0f}"
+                          f"{result['p50_us']:>10.1f}{result['p99_us']:>10.1f}", file=sys.stderr)
+
+    if args.json:
+        report.write(args.json, results, nodes=nodes)
+
+
+if __name__ == '__main__':
+    main()
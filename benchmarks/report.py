@@ -0,0 +1,21 @@
+'''JSON report shared by the benchmark scripts'''
+import contextlib
+import json
+import multiprocessing
+import platform
+import sys
+
+
+def write(path, results, **extra):
+    '''Write the results, along with the machine they were measured on and any 'extra' entries, as JSON into 'path' -
+    '-' for stdout
+    '''
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': multiprocessing.cpu_count(),
+        **extra,
+        'results': results,
+    }
+    with (open(path, 'w') if path != '-' else contextlib.nullcontext(sys.stdout)) as output:
+        json.dump(report, output, indent=2)
@@ -0,0 +1,103 @@
+'''Compare the latency of short jobs run on a new process each - cold - with jobs handed to pre-warmed workers.
+
+    $ python -m benchmarks.startup --jobs 50 --preload json decimal --json results.json
+
+For each start method available a cold job starts a child from a PipeCommunication of that context, which imports the
+modules to preload, creates its peer, runs the job and replies, so it pays the whole start up of a process. Warm jobs
+are submitted to a pool.WorkerPool of the same context once it has warmed up, so they only pay for a round trip through
+its QUEUEs. Latency is measured from the start of the job - or its submission - until its result arrives.
+'''
+import argparse
+import importlib
+import multiprocessing
+import statistics
+import sys
+import time
+
+from benchmarks import report
+from pymulproc import factory, mpq_protocol, pool
+
+PRELOAD = ('json', )
+
+
+def job(value):
+    '''The work of every job: short enough for start up to be all that matters'''
+    return value * 2
+
+
+def cold_job(comm_factory, preload, value):
+    '''Run a single job in a new process and send its result back'''
+    for module in preload:
+        importlib.import_module(module)
+    child = comm_factory.child()
+    child.send(mpq_protocol.REQ_FINISHED, data=job(value))
+
+
+def cold(method, jobs, preload):
+    '''Return the latency of each job run on a new process'''
+    latencies = []
+    for value in range(jobs):
+        start = time.perf_counter()
+        comm_factory = factory.PipeCommunication(context=method)
+        parent = comm_factory.parent()
+        process = comm_factory.Process(target=cold_job, args=(comm_factory, preload, value))
+        process.start()
+        assert parent.receive(block=True).data == value * 2
+        latencies.append(time.perf_counter() - start)
+        process.join()
+    return latencies
+
+
+def warm(method, jobs, preload):
+    '''Return the latency of each job submitted to a warmed up worker, and the seconds warming up took'''
+    start = time.perf_counter()
+    with pool.WorkerPool(processes=1, context=method, preload=preload) as workers:
+        workers.warm_up()
+        warm_up = time.perf_counter() - start
+        latencies = []
+        for value in range(jobs):
+            start = time.perf_counter()
+            assert workers.submit(job, value).result() == value * 2
+            latencies.append(time.perf_counter() - start)
+    return latencies, warm_up
+
+
+def summarize(method, mode, latencies, warm_up=None):
+    '''Return the results of a run as a dictionary'''
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [latencies[0]] * 99
+    return {
+        'method': method,
+        'mode': mode,
+        'jobs': len(latencies),
+        'p50_us': percentiles[49] * 1e6,
+        'p99_us': percentiles[98] * 1e6,
+        'warm_up_ms': warm_up * 1e3 if warm_up is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=50, help='jobs per run')
+    parser.add_argument('--methods', nargs='+', choices=multiprocessing.get_all_start_methods(),
+                        default=multiprocessing.get_all_start_methods())
+    parser.add_argument('--preload', nargs='*', default=PRELOAD, help='modules every worker imports')
+    parser.add_argument('--json', metavar='PATH', help="write the results as JSON into PATH - '-' for stdout")
+    args = parser.parse_args()
+
+    print(f"{'method':<12}{'mode':<6}{'jobs':>6}{'p50 us':>12}{'p99 us':>12}{'warm up ms':>12}", file=sys.stderr)
+    results = []
+    for method in args.methods:
+        cold_latencies = cold(method, args.jobs, args.preload)
+        warm_latencies, warm_up = warm(method, args.jobs, args.preload)
+        for result in (summarize(method, 'cold', cold_latencies), summarize(method, 'warm', warm_latencies, warm_up)):
+            results.append(result)
+            warm_up_ms = f"{result['warm_up_ms']:.1f}" if result['warm_up_ms'] is not None else '-'
+            print(f"{method:<12}{result['mode']:<6}{result['jobs']:>6}{result['p50_us']:>12,.1f}"
+                  f"{result['p99_us']:>12,.1f}{warm_up_ms:>12}", file=sys.stderr)
+
+    if args.json:
+        report.write(args.json, results, preload=list(args.preload))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+'''Measure the PIPE and QUEUE backends across scenarios, payload sizes and number of children.
+
+    $ python -m benchmarks.suite --json results.json
+
+Three scenarios are run for each backend and payload size:
+
+1) ping_pong: round trip of messages sent to a child process that echoes them back.
+2) stream: messages sent one after another to a child process that just consumes them.
+3) fan_out: rounds of one message addressed to each of N children, which reply to the parent. On the plain QUEUE
+   backend every message goes through the shared queue, so this shows what requeuing messages that are not for us
+   costs as the number of children grows.
+
+CPU per message adds up the user and system time of the parent and of all children and divides it by the number of
+messages exchanged. Larger payloads send fewer messages so that no run moves much more than BYTES_BUDGET bytes.
+'''
+import argparse
+import multiprocessing
+import statistics
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks import backends, report
+from pymulproc import factory, mpq_protocol, placement, ringbuffer
+
+PAYLOAD_SIZES = (16, 1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024)
+CHILDREN = (1, 2, 4, 8)
+SCENARIOS = ('ping_pong', 'stream', 'fan_out')
+BYTES_BUDGET = 256 * 1024 * 1024
+MIN_MESSAGES = 4
+# Encoded messages larger than half a ring do not fit in it
+MAX_PAYLOAD = {'ring': ringbuffer.DEFAULT_CAPACITY // 2 - 1024}
+
+FAN_OUT_BACKENDS = {
+    'pipe': lambda children: factory.PipeHub(max_children=children),
+    'queue': lambda children: factory.QueueCommunication(),
+    'queue_routed': lambda children: factory.QueueCommunication(routed=True, max_peers=children + 1),
+}
+
+
+def cpu_time():
+    '''Return the CPU seconds spent so far by this process and by the children it has waited for'''
+    if not resource:
+        return time.process_time()
+    return sum(usage.ru_utime + usage.ru_stime
+               for usage in (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)))
+
+
+def serve(comm_factory, parent_pid):
+    '''Reply to the parent every message addressed to us until asked to die'''
+    child = comm_factory.child()
+    pid = multiprocessing.current_process().pid
+    child.send(mpq_protocol.REQ_TEST_CHILD, recipient_pid=parent_pid)
+    while True:
+        message = child.receive(block=True, func=lambda x: x.recipient_pid == pid)
+        if not message:
+            continue
+        if message.request == mpq_protocol.REQ_DIE:
+            break
+        child.send(mpq_protocol.REQ_FINISHED, recipient_pid=parent_pid, data=message.data)
+
+
+def fan_out(backend, messages, payload, children, cpus=None):
+    '''Return the latency of each message sent in rounds of one addressed to each child, from the start of its round
+    until the reply arrives. Children are pinned to the given CPU sets - one per child - if any
+    '''
+    comm_factory = FAN_OUT_BACKENDS[backend](children)
+    parent = comm_factory.parent()
+    for_parent = lambda x: x.recipient_pid == parent.pid
+    processes = [multiprocessing.Process(target=placement.bootstrap, args=(cpu_set, serve, (comm_factory, parent.pid)))
+                 for cpu_set in cpus or [None] * children]
+    for process in processes:
+        process.start()
+    for _ in processes:  # Wait for all children to be registered before addressing them
+        while not parent.receive(block=True, func=for_parent):
+            pass
+
+    latencies = []
+    for _ in range(max(1, messages // children)):
+        start = time.perf_counter()
+        for process in processes:
+            parent.send(mpq_protocol.REQ_DO, recipient_pid=process.pid, data=payload)
+        for _ in processes:
+            while not parent.receive(block=True, func=for_parent):
+                pass
+            latencies.append(time.perf_counter() - start)
+
+    for process in processes:
+        parent.send(mpq_protocol.REQ_DIE, recipient_pid=process.pid)
+    for process in processes:
+        process.join()
+    return latencies
+
+
+def measure(scenario, backend, messages, payload, children=1):
+    '''Run a scenario and return its results as a dictionary'''
+    cpu_start = cpu_time()
+    start = time.perf_counter()
+    if scenario == 'ping_pong':
+        latencies = backends.ping_pong(backend, messages, payload)
+        throughput = len(latencies) / sum(latencies)
+    elif scenario == 'stream':
+        latencies = []
+        throughput = backends.stream(backend, messages, payload)
+    else:
+        latencies = fan_out(backend, messages, payload, children)
+        messages = len(latencies)
+        throughput = messages / (time.perf_counter() - start)
+    cpu = cpu_time() - cpu_start
+
+    result = {
+        'scenario': scenario,
+        'backend': backend,
+        'payload': len(payload),
+        'children': children,
+        'messages': messages,
+        'msgs_per_s': throughput,
+        'p50_us': None,
+        'p99_us': None,
+        'cpu_us_per_msg': cpu / messages * 1e6,
+    }
+    if len(latencies) > 1:
+        percentiles = statistics.quantiles(latencies, n=100)
+        result.update(p50_us=percentiles[49] * 1e6, p99_us=percentiles[98] * 1e6)
+    return result
+
+
+def run(scenarios, backend_names, payload_sizes, children, messages):
+    '''Yield the results of every combination of scenario, backend, payload size and - for fan_out - children'''
+    for size in payload_sizes:
+        payload = b'x' * size
+        count = max(MIN_MESSAGES, min(messages, BYTES_BUDGET // size))
+        for scenario in scenarios:
+            names = FAN_OUT_BACKENDS if scenario == 'fan_out' else backends.BACKENDS
+            for backend in backend_names:
+                if backend not in names or size > MAX_PAYLOAD.get(backend, size):
+                    continue
+                for count_children in (children if scenario == 'fan_out' else (1, )):
+                    yield measure(scenario, backend, count, payload, count_children)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000, help='messages per run for small payloads')
+    parser.add_argument('--payloads', type=int, nargs='+', default=PAYLOAD_SIZES, help='sizes in bytes')
+    parser.add_argument('--children', type=int, nargs='+', default=CHILDREN, help='children in fan_out')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--backends', nargs='+', choices=sorted({*backends.BACKENDS, *FAN_OUT_BACKENDS}),
+                        default=['pipe', 'queue', 'queue_routed'])
+    parser.add_argument('--json', metavar='PATH', help="write the results as JSON into PATH - '-' for stdout")
+    args = parser.parse_args()
+
+    print(f"{'scenario':<10}{'backend':<14}{'payload':>10}{'children':>9}{'msgs/s':>12}{'p50 us':>10}"
+          f"{'p99 us':>10}{'cpu us/msg':>12}", file=sys.stderr)
+    results = []
+    for result in run(args.scenarios, args.backends, args.payloads, args.children, args.messages):
+        results.append(result)
+        p50, p99 = (f'{result[key]:.1f}' if result[key] is not None else '-' for key in ('p50_us', 'p99_us'))
+        print(f"{result['scenario']:<10}{result['backend']:<14}{result['payload']:>10}{result['children']:>9}"
+              f"{result['msgs_per_s']:>12,.0f}{p50:>10}{p99:>10}{result['cpu_us_per_msg']:>12.1f}", file=sys.stderr)
+
+    if args.json:
+        report.write(args.json, results)
+
+
+if __name__ == '__main__':
+    main()
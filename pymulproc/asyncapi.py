@@ -0,0 +1,230 @@
+import asyncio
+import select
+import time
+
+from pymulproc import backpressure, mpq_protocol, pipeapi, queuepi, streams
+
+_waiters = {}  # (event loop, file descriptor) -> futures waiting for such file descriptor to become readable
+FRAME_HEADER = 4  # bytes multiprocessing.connection prepends to every frame of less than 2 GB
+INLINE_WRITE = getattr(select, 'PIPE_BUF', 512)  # bytes a PIPE found writable is sure to take without blocking
+
+
+def _wake_up(loop, fd):
+    loop.remove_reader(fd)
+    for future in _waiters.pop((loop, fd), ()):
+        if not future.done():
+            future.set_result(None)
+
+
+async def wait_readable(fds, timeout=None):
+    '''Sleep until any of the file descriptors becomes readable or the timeout expires, in which case False is
+    returned. Many coroutines may wait on the same file descriptor at once within the same event loop
+    '''
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    for fd in fds:
+        waiters = _waiters.setdefault((loop, fd), set())
+        if not waiters:
+            loop.add_reader(fd, _wake_up, loop, fd)
+        waiters.add(future)
+    try:
+        await asyncio.wait_for(future, timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        for fd in fds:
+            waiters = _waiters.get((loop, fd))
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del _waiters[(loop, fd)]
+                    loop.remove_reader(fd)
+
+
+def writable(fd):
+    '''Tell whether the file descriptor has room for PIPE_BUF bytes, so that writing as many does not block
+    '''
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        poller.register(fd, select.POLLOUT)
+        return bool(poller.poll(0))
+    return bool(select.select([], [fd], [], 0)[1])
+
+
+class AsyncCommunicationApi:
+    '''Mixin turning 'send', 'send_many', 'flush', 'receive', 'receive_many' and 'send_stream' of a peer into
+    coroutines, and 'receive_stream' into an asynchronous iterator. Instead of blocking or polling, 'receive' registers
+    the file descriptors the peer reads from with the running event loop and sleeps until any of them becomes readable.
+    It relies on 'add_reader', which is not available on Windows' proactor event loop
+    '''
+
+    async def receive(self, **kwargs):
+        '''Coroutine counterpart of the synchronous 'receive' with the same parameters
+        '''
+        block = kwargs.pop('block', 'timeout' in kwargs)
+        timeout = kwargs.pop('timeout', None)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            await self.flush()
+            message = super().receive(**kwargs)
+            if message or not block:
+                return message
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if remaining == 0 or not await wait_readable([reader.fileno() for reader in self.readers()], remaining):
+                return False
+
+    async def receive_many(self, max_items, **kwargs):
+        '''Coroutine counterpart of the synchronous 'receive_many' with the same parameters
+        '''
+        messages = []
+        message = await self.receive(**kwargs)
+        kwargs = {'func': kwargs['func']} if 'func' in kwargs else {}
+        while message:
+            messages.append(message)
+            if len(messages) >= max_items:
+                break
+            message = super().receive(**kwargs)
+        return messages
+
+    async def buffer(self, message):
+        '''Coroutine counterpart of the synchronous 'buffer'
+        '''
+        if not self.outbox:
+            self.outbox_since = time.monotonic()
+        self.outbox.append(message)
+        if len(self.outbox) >= self.batch_size or time.monotonic() - self.outbox_since >= self.linger:
+            await self.flush()
+        return message
+
+    async def flush(self):
+        '''Coroutine counterpart of the synchronous 'flush'
+        '''
+        if self.outbox:
+            outbox, self.outbox = self.outbox, []
+            await self.send_many(outbox)
+
+    async def send_stream(self, source, recipient_pid=None, **kwargs):
+        '''Coroutine counterpart of the synchronous 'send_stream' with the same parameters
+        '''
+        return await streams.send_async(self, source, recipient_pid, **kwargs)
+
+    def receive_stream(self, timeout=None):
+        '''Return an asynchronous iterator over the chunks of the next stream sent to this end - see the synchronous
+        'receive_stream'
+        '''
+        return streams.receive_async(self, timeout)
+
+
+class AsyncPipeCommunicationApi(AsyncCommunicationApi, pipeapi.PipeCommunicationApi):
+    '''Class that implements the CommunicationApi interface for PIPE communication with coroutines
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writing = None  # lock taking the writes down the PIPE in turns, created within the event loop
+
+    async def send(self, request, sender_pid=None, recipient_pid=None, data=None, headers=None):
+        '''sends a message down the PIPE without blocking the event loop - see 'transmit'
+        '''
+        message = mpq_protocol.Message(request, self.pid, recipient_pid, data, headers)
+        if self.batch_size > 1:
+            return await self.buffer(message)
+        await self.transmit(self.conn, self.encode(message))
+        return message
+
+    async def send_many(self, messages):
+        '''Coroutine counterpart of the synchronous 'send_many'
+        '''
+        messages = [self.as_message(message) for message in messages]
+        for frame, count in self.coalesce(messages):
+            await self.transmit(self.conn, frame, count)
+        return messages
+
+    async def transmit(self, conn, frame, messages=1):
+        '''writes a frame carrying the given amount of messages down the PIPE straight away if it is small enough to fit
+        in the room the PIPE is known to have. Otherwise it is written on a thread of the event loop's executor, as a
+        full PIPE or a large frame would block the loop. Writes are done one at a time, in the order they were asked
+        '''
+        if self.writing is None:
+            self.writing = asyncio.Lock()
+        async with self.writing:
+            if len(frame) + FRAME_HEADER <= INLINE_WRITE and writable(conn.fileno()):
+                self.write(conn, frame, messages)
+            else:
+                await asyncio.get_running_loop().run_in_executor(None, self.write, conn, frame, messages)
+
+
+class AsyncQueueCommunicationApi(AsyncCommunicationApi, queuepi.QueueCommunicationApi):
+    '''Class that implements the CommunicationApi interface for JOINED QUEUE communication with coroutines
+    '''
+
+    async def send(self, request, sender_pid=None, recipient_pid=None, data=None, priority=None, headers=None):
+        '''puts a message in the JOINED QUEUE as the backpressure policy of the peer dictates - see 'enqueue'
+        '''
+        message = self.build_message(request, sender_pid, recipient_pid, data, headers)
+        lane = self.lane_of(request, priority)
+        if self.batch_size > 1 and lane == len(self.lanes) - 1:
+            return await self.buffer(message)
+        await self.enqueue(self.route(recipient_pid, lane), self.encode(message))
+        return message
+
+    async def send_many(self, messages):
+        '''Coroutine counterpart of the synchronous 'send_many'
+        '''
+        messages = [self.as_message(message) for message in messages]
+        for conn, frame, count in self.coalesce(messages):
+            await self.enqueue(conn, frame, count)
+        return messages
+
+    async def try_send(self, request, sender_pid=None, recipient_pid=None, data=None, priority=None, headers=None):
+        '''Coroutine counterpart of the synchronous 'try_send', which flushes the outbox first
+        '''
+        await self.flush()
+        return super().try_send(request, sender_pid, recipient_pid, data, priority, headers)
+
+    async def enqueue(self, conn, frame, messages=1):
+        '''puts a frame into the given QUEUE straight away if there is room for it. Otherwise the backpressure policy
+        of the peer - which may wait for room - runs on a thread of the event loop's executor, so that the loop goes on
+        meanwhile. Return the status of the operation
+        '''
+        if backpressure.try_put(conn, frame) == backpressure.SEND_OK:
+            self.sent(conn, frame, messages)
+            return backpressure.SEND_OK
+        return await asyncio.get_running_loop().run_in_executor(None, self.put, conn, frame, messages)
+
+
+class PipeParent(AsyncPipeCommunicationApi):
+    '''Class that will instantiate the parent process' peer - It's async PIPE communication end
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.peer = mpq_protocol.PARENT_COMM_INTERFACE
+
+
+class PipeChild(AsyncPipeCommunicationApi):
+    '''Class that will instantiate the child process' peer - It's async PIPE communication end
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.peer = mpq_protocol.CHILD_COMM_INTERFACE
+
+
+class QueueParent(AsyncQueueCommunicationApi):
+    '''Class that will instantiate the parent process' peer - It's async QUEUE-based communication end
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.peer = mpq_protocol.PARENT_COMM_INTERFACE
+
+
+class QueueChild(AsyncQueueCommunicationApi):
+    '''Class that will instantiate the child process' peer - It's async QUEUE-based communication end
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.peer = mpq_protocol.CHILD_COMM_INTERFACE
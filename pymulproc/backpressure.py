@@ -0,0 +1,214 @@
+import queue
+import threading
+import time
+
+from pymulproc import deadletter, errors
+from pymulproc import mpq_protocol
+
+SEND_OK = 'OK'  # the message was put in the queue
+SEND_FULL = 'FULL'  # the queue was full and the message was not put in it
+SEND_DROPPED = 'DROPPED'  # the queue was full and either the message or an older one was discarded to make room
+
+BACKOFF_START = 0.001  # seconds slept after the first failed attempt of the exponential backoff
+BACKOFF_MAX = 0.1  # the exponential backoff never sleeps longer than this between attempts
+BACKOFF_DEADLINE = 1  # seconds the exponential backoff keeps retrying for by default
+WATERMARK_POLL = 0.01  # seconds between the depth samples of a queue above its high watermark
+
+
+def _give_up(peer, frame, ex=None):
+    raise errors.QueuesCommunicationError(f"Process {peer.pid} tried unsuccessfully to put the following "
+                                          f"{mpq_protocol.read_header(frame)[:3]} in the queue") from ex
+
+
+def try_put(conn, frame):
+    '''Put the frame in the queue only if there is room for it straight away
+    '''
+    try:
+        conn.put(frame, block=False)
+    except queue.Full:
+        return SEND_FULL
+    return SEND_OK
+
+
+class Retry:
+    '''Try to put the message 'loops' times, waiting 'timeout' seconds each, before raising an exception. This is how
+    the QUEUE-based peers have always behaved
+    '''
+
+    def __init__(self, timeout, loops):
+        self.timeout = timeout
+        self.loops = loops
+
+    def put(self, peer, conn, frame):
+        loops = self.loops
+        while True:
+            try:
+                conn.put(frame, timeout=self.timeout)
+                return SEND_OK
+            except queue.Full as ex:
+                loops -= 1
+                if not loops:
+                    _give_up(peer, frame, ex)
+                if peer.metrics:
+                    peer.metrics.count('retries')
+
+
+class Block:
+    '''Wait for room in the queue until the deadline - in seconds - expires and raise an exception afterwards. None
+    means waiting for ever
+    '''
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+
+    def put(self, peer, conn, frame):
+        try:
+            conn.put(frame, timeout=self.deadline)
+        except queue.Full as ex:
+            _give_up(peer, frame, ex)
+        return SEND_OK
+
+
+class Backoff:
+    '''Retry putting the message sleeping twice as long after each failed attempt, from 'start' up to 'maximum'
+    seconds, and raise an exception once 'deadline' seconds have passed
+    '''
+
+    def __init__(self, deadline=BACKOFF_DEADLINE, start=BACKOFF_START, maximum=BACKOFF_MAX):
+        self.deadline = deadline
+        self.start = start
+        self.maximum = maximum
+
+    def put(self, peer, conn, frame):
+        deadline = time.monotonic() + self.deadline
+        delay = self.start
+        while try_put(conn, frame) == SEND_FULL:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                _give_up(peer, frame)
+            if peer.metrics:
+                peer.metrics.count('retries')
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.maximum)
+        return SEND_OK
+
+
+class DropNewest:
+    '''Discard the message being sent if the queue is full. 'on_drop', if given, is called with the discarded frame,
+    which also goes into the peer's dead letter channel
+    '''
+
+    def __init__(self, on_drop=None):
+        self.on_drop = on_drop
+
+    def put(self, peer, conn, frame):
+        if try_put(conn, frame) == SEND_OK:
+            return SEND_OK
+        if self.on_drop:
+            self.on_drop(frame)
+        peer.dead_letter(frame, deadletter.DROPPED)
+        return SEND_DROPPED
+
+
+class DropOldest(DropNewest):
+    '''Discard the oldest messages in the queue until there is room for the one being sent. 'on_drop', if given, is
+    called with each discarded frame
+    '''
+
+    def put(self, peer, conn, frame):
+        status = SEND_OK
+        while try_put(conn, frame) == SEND_FULL:
+            try:
+                oldest = conn.get(block=False)
+            except queue.Empty:  # Someone else made room in the meantime
+                continue
+            conn.task_done()
+            status = SEND_DROPPED
+            if self.on_drop:
+                self.on_drop(oldest)
+            peer.dead_letter(oldest, deadletter.DROPPED)
+        return status
+
+
+POLICIES = {
+    'block': Block,
+    'backoff': Backoff,
+    'drop_newest': DropNewest,
+    'drop_oldest': DropOldest,
+}
+
+
+def get_policy(policy):
+    '''Return a policy with default settings for the given name. Policy instances are returned as they are
+    '''
+    if isinstance(policy, str):
+        try:
+            return POLICIES[policy]()
+        except KeyError as ex:
+            raise ValueError(f"Unknown backpressure policy {policy!r}. Choose among {sorted(POLICIES)}") from ex
+    return policy
+
+
+class Watermarks:
+    '''Call 'on_high' once the number of messages in a queue reaches 'high' and 'on_low' once it falls back to 'low'
+    or below. Each callback gets the peer and the depth of the queue. Depth is sampled on every message put and on
+    every message fetched by a peer sharing the watermarks, which needs 'Queue.qsize', not available on macOS, where
+    watermarks are never triggered.
+
+    Producers throttled by 'on_high' may put nothing else until 'on_low' fires, while the queue is drained by other
+    processes. So, as long as a queue is above the high watermark, a thread of the process that saw it getting there
+    samples its depth every 'interval' seconds and fires 'on_low' - from that thread - once it has fallen
+    '''
+
+    def __init__(self, high, low, on_high=None, on_low=None, interval=WATERMARK_POLL):
+        self.high = high
+        self.low = low
+        self.on_high = on_high
+        self.on_low = on_low
+        self.interval = interval
+        self.above = {}  # id => (peer, queue) of the queues whose depth reached the high watermark and have not fallen
+        self.lock = threading.Lock()
+        self.poller = None
+
+    def __getstate__(self):
+        return self.high, self.low, self.on_high, self.on_low, self.interval
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def check(self, peer, conn, filling=True):
+        '''Fire the callback of the watermark the depth of the queue has just crossed, if any. Only the low watermark
+        can be crossed while the queue is not 'filling'
+        '''
+        try:
+            depth = conn.qsize()
+        except NotImplementedError:
+            return
+        key = id(conn)
+        with self.lock:
+            high = filling and key not in self.above and depth >= self.high
+            low = not high and key in self.above and depth <= self.low
+            if high:
+                self.above[key] = (peer, conn)
+                if not self.poller or not self.poller.is_alive():  # Threads do not survive a fork
+                    self.poller = threading.Thread(target=self.poll, daemon=True)
+                    self.poller.start()
+            elif low:
+                del self.above[key]
+        if high and self.on_high:
+            self.on_high(peer, depth)
+        elif low and self.on_low:
+            self.on_low(peer, depth)
+
+    def poll(self):
+        '''Sample the depth of the queues above the high watermark every 'interval' seconds until none is left
+        '''
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                watched = list(self.above.values())
+                if not watched:
+                    self.poller = None
+                    return
+            for peer, conn in watched:
+                self.check(peer, conn, filling=False)
@@ -0,0 +1,143 @@
+import abc
+import lzma
+import zlib
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from pymulproc import errors
+
+COMPRESSION_THRESHOLD = 4096  # payloads smaller than this amount of bytes are never compressed
+
+
+class Compressor(abc.ABC):
+    '''Compress the payload of a frame and decompress it back. 'codec' identifies the compressor in the 'compression'
+    header of the frame, so that the receiving end needs no configuration to decompress it
+    '''
+
+    codec = None
+    name = None
+
+    @abc.abstractmethod
+    def compress(self, payload):
+        '''Return the payload compressed
+        '''
+        pass
+
+    @abc.abstractmethod
+    def decompress(self, payload):
+        '''Return the payload a compressed one was made from
+        '''
+        pass
+
+
+class ZlibCompressor(Compressor):
+    '''zlib from the standard library. Low levels trade ratio for speed
+    '''
+
+    codec = 1
+    name = 'zlib'
+
+    def __init__(self, level=1):
+        self.level = level
+
+    def compress(self, payload):
+        return zlib.compress(payload, self.level)
+
+    def decompress(self, payload):
+        return zlib.decompress(payload)
+
+
+class LzmaCompressor(Compressor):
+    '''lzma from the standard library: the best ratio and by far the slowest
+    '''
+
+    codec = 2
+    name = 'lzma'
+
+    def __init__(self, preset=0):
+        self.preset = preset
+
+    def compress(self, payload):
+        return lzma.compress(payload, preset=self.preset)
+
+    def decompress(self, payload):
+        return lzma.decompress(payload)
+
+
+class Lz4Compressor(Compressor):
+    '''LZ4 frames, fast enough to pay off on local links. It needs the 'lz4' package
+    '''
+
+    codec = 3
+    name = 'lz4'
+
+    def __init__(self, level=0):
+        if lz4 is None:
+            raise ImportError("The lz4 compressor needs the 'lz4' package to be installed")
+        self.level = level
+
+    def compress(self, payload):
+        return lz4.frame.compress(payload, compression_level=self.level)
+
+    def decompress(self, payload):
+        return lz4.frame.decompress(payload)
+
+
+class ZstdCompressor(Compressor):
+    '''Zstandard, with a better ratio than zlib at a higher speed. It needs the 'zstandard' package
+    '''
+
+    codec = 4
+    name = 'zstd'
+
+    def __init__(self, level=3):
+        if zstandard is None:
+            raise ImportError("The zstd compressor needs the 'zstandard' package to be installed")
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, payload):
+        return self.compressor.compress(payload)
+
+    def decompress(self, payload):
+        return self.decompressor.decompress(payload)
+
+
+COMPRESSORS = {compressor.name: compressor for compressor in (ZlibCompressor, LzmaCompressor, Lz4Compressor,
+                                                               ZstdCompressor)}
+CODECS = {compressor.codec: compressor for compressor in COMPRESSORS.values()}
+_decompressors = {}  # codec => compressor instance used to decompress the payloads flagged with it
+
+
+def get_compressor(compressor):
+    '''Return a compressor given its name. Compressor instances are returned as they are and None means no
+    compression
+    '''
+    if compressor is None or isinstance(compressor, Compressor):
+        return compressor
+    try:
+        return COMPRESSORS[compressor]()
+    except KeyError as ex:
+        raise ValueError(f"Unknown compressor {compressor!r}. Choose among {sorted(COMPRESSORS)}") from ex
+
+
+def decompress(codec, payload):
+    '''Decompress a payload flagged with the given codec
+    '''
+    if codec not in _decompressors:
+        try:
+            _decompressors[codec] = CODECS[codec]()
+        except KeyError as ex:
+            raise errors.ProtocolError(f"Unknown compression codec {codec}") from ex
+        except ImportError as ex:
+            raise errors.ProtocolError(f"Payload compressed with {CODECS[codec].name!r}, which is not installed") \
+                from ex
+    return _decompressors[codec].decompress(payload)
@@ -0,0 +1,58 @@
+import multiprocessing
+import queue
+
+from pymulproc import mpq_protocol, serializers
+
+EXPIRED = 'expired'  # the deadline of the message passed before it was received
+DROPPED = 'dropped'  # the message was discarded by a backpressure policy
+DEAD_RECIPIENT = 'dead_recipient'  # the recipient of the message died - see supervisor.Supervisor
+REASONS = (EXPIRED, DROPPED, DEAD_RECIPIENT)
+
+MAX_SIZE = 1024  # dead letters kept at most. Any other is discarded until the channel is read
+
+
+class DeadLetterChannel:
+    '''Queue shared by all peers of a factory where the frames of the messages that could not be delivered end up,
+    along with the reason why, so that they can be inspected later on. It is bounded: once 'max_size' dead letters are
+    waiting any new one is discarded. Payloads sent through shared memory are released as their message is
+    dead-lettered, so only the handle to their segment is kept
+    '''
+
+    def __init__(self, max_size=MAX_SIZE, context=multiprocessing):
+        self.queue = context.Queue(max_size)
+
+    def put(self, frame, reason):
+        '''Keep the frame of a message that could not be delivered
+        '''
+        try:
+            self.queue.put((reason, bytes(frame)), block=False)
+        except queue.Full:
+            pass
+
+    def get(self, timeout=0):
+        '''Return the next dead letter as a (reason, frame) tuple - or None if there is none after 'timeout' seconds
+        '''
+        try:
+            return self.queue.get(timeout=timeout) if timeout else self.queue.get(block=False)
+        except queue.Empty:
+            return None
+
+    def messages(self, serializer=None, timeout=0):
+        '''Take out every dead letter waiting and return them as (reason, message) tuples, their data deserialized with
+        the given serializer. Only the first one is waited for, 'timeout' seconds at most
+        '''
+        serializer = serializers.get_serializer(serializer)
+        letters = []
+        letter = self.get(timeout)
+        while letter:
+            reason, frame = letter
+            letters.append((reason, mpq_protocol.Message.decode(frame, serializer)))
+            letter = self.get()
+        return letters
+
+
+def get_channel(channel, context=multiprocessing):
+    '''Return a new dead letter channel - of the given multiprocessing context - if True is given. Channels are returned
+    as they are and None means no channel
+    '''
+    return DeadLetterChannel(context=context) if channel is True else channel
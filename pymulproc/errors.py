@@ -1,3 +1,33 @@
 class QueuesCommunicationError(Exception):
     '''Exception thrown when the multiprocessing communication error between processes fails for a reason
     '''
+
+
+class ProtocolError(Exception):
+    '''Exception thrown when a message can not be packed into or unpacked from its wire format
+    '''
+
+
+class RingBufferCommunicationError(Exception):
+    '''Exception thrown when a record can not be written into a shared memory ring
+    '''
+
+
+class PipeHubCommunicationError(Exception):
+    '''Exception thrown when a message can not be routed to any of the PIPEs of a hub
+    '''
+
+
+class SocketCommunicationError(Exception):
+    '''Exception thrown when a message can not be sent to or received from a socket connected peer
+    '''
+
+
+class StreamCommunicationError(Exception):
+    '''Exception thrown when a stream is not taken by the other end in time
+    '''
+
+
+class WorkerPoolError(Exception):
+    '''Exception thrown when the outcome of a task is lost: its message was dead-lettered or its worker died
+    '''
@@ -1,40 +1,236 @@
 import multiprocessing
+import multiprocessing.connection
 
-from pymulproc import interfaces, pipeapi, queuepi
+from pymulproc import asyncapi, deadletter, interfaces, pipeapi, queuepi, ringapi, ringbuffer, routing, shm, socketapi
+from pymulproc import metrics, serializers
 
 
-class PipeCommunication():
+def get_context(context):
+    '''Return the multiprocessing context of the given start method - 'fork', 'forkserver' or 'spawn'. Contexts are
+    returned as they are and None means the default one
+    '''
+    return multiprocessing.get_context(context) if context is None or isinstance(context, str) else context
+
+
+class CommunicationFactory():
+    '''Base class of all factories that keeps the options passed to the factory which are meant for the peers it
+    creates, such as 'batch_size', 'linger', 'shm_threshold', 'backpressure', 'metrics', 'serializer' or 'compression'.
+    Those passed to 'parent' or 'child' take precedence.
+
+    All multiprocessing primitives are created from 'context' - a start method or a multiprocessing context, the
+    default one if not given - and so should the processes using them be: see 'Process'.
+    '''
+
+    PEER_OPTIONS = ('batch_size', 'linger', 'shm_threshold', 'backpressure', 'watermarks', 'metrics',
+                    'serializer', 'compression', 'compression_threshold', 'ttl', 'dead_letters')
+
+    def __init__(self, **kwargs):
+        self.context = get_context(kwargs.get('context', None))
+        self.peer_options = {key: kwargs[key] for key in self.PEER_OPTIONS if key in kwargs}
+        if self.peer_options.get('shm_threshold', None) is not None:
+            shm.check_serializer(serializers.get_serializer(self.peer_options.get('serializer', None)))
+            shm.prepare()
+        # A single channel shared by all peers - created here so that children inherit it
+        self.dead_letters = deadletter.get_channel(self.peer_options.get('dead_letters', None), self.context)
+        if self.dead_letters:
+            self.peer_options['dead_letters'] = self.dead_letters
+
+    def peer_kwargs(self, **kwargs):
+        '''Return the factory's peer options updated with the ones given. Metrics given to the factory are cloned, so
+        that each peer keeps its own
+        '''
+        options = {**self.peer_options, **kwargs}
+        if 'metrics' not in kwargs and isinstance(options.get('metrics'), metrics.PeerMetrics):
+            options['metrics'] = options['metrics'].clone()
+        return options
+
+    def Process(self, *args, **kwargs):
+        '''Return a process of the factory's context, with the same parameters as multiprocessing.Process
+        '''
+        return self.context.Process(*args, **kwargs)
+
+
+class PipeCommunication(CommunicationFactory):
     '''Class Factory used to create PIPE-based connection peers
     '''
 
-    def __init__(self):
-        self.parent_conn, self.child_conn = multiprocessing.Pipe()
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.parent_conn, self.child_conn = self.context.Pipe()
 
     def parent(self, **kwargs):
         '''it will create the parent process's connection peer
         '''
-        return pipeapi.Parent(self.parent_conn, **kwargs)
+        return pipeapi.Parent(self.parent_conn, **self.peer_kwargs(**kwargs))
 
     def child(self, **kwargs):
         '''it will create the child process's connection peer
         '''
-        return pipeapi.Child(self.child_conn, **kwargs)
+        return pipeapi.Child(self.child_conn, **self.peer_kwargs(**kwargs))
 
 
-class QueueCommunication():
+class QueueCommunication(CommunicationFactory):
     '''Class Factory used to create QUEUE-based connection peers
+
+    If 'routed' is passed as True, every peer created by the factory is given its own mailbox - up to 'max_peers', as
+    many as CPUs this process may run on plus the parent by default - so that messages addressed to a registered PID
+    are delivered straight to it. Messages with no recipient, or addressed to a process that is not registered, still
+    go through the shared queue. Slots of processes that are gone are reclaimed once all are taken, and peers finding
+    none free go without a mailbox. Each mailbox holds a PIPE per lane, so 'max_peers' is better sized to the number
+    of processes talking at once.
+
+    If 'lanes' is greater than 1, the shared queue and each mailbox are split into such amount of priority lanes.
+    Control requests - REQ_DIE and REQ_FINISHED - go into the first lane and any other into the last one unless a
+    'priority' is passed to 'send'.
+
+    If a 'distribution' - routing.ROUND_ROBIN or routing.LEAST_LOADED - is given, which implies routed mode, each child
+    gets its own work inbox. Messages the parent sends with no recipient are dispatched into the inboxes, in turns or
+    to the child with less work waiting, instead of into the shared queue all children contend on. Idle children steal
+    work from their siblings. Messages with no recipient in a higher priority lane still go through the shared queue,
+    so that they overtake the work waiting in the inboxes.
     '''
 
     def __init__(self, **kwargs):
+        super().__init__(**kwargs)
         max_size = kwargs.get('max_size', 0)
-        self.queue = multiprocessing.JoinableQueue(max_size)
+        self.lanes = [self.context.JoinableQueue(max_size) for _ in range(kwargs.get('lanes', 1))]
+        self.queue = self.lanes[-1]
+        self.router = None
+        distribution = kwargs.get('distribution', None)
+        if kwargs.get('routed', False) or distribution:
+            self.router = routing.MailboxRouter(kwargs.get('max_peers', None), max_size,
+                                                len(self.lanes), distribution, self.context)
+
+    def parent(self, **kwargs):
+        '''it will create the parent process's connection peer
+        '''
+        return queuepi.Parent(self.queue, **self.peer_kwargs(router=self.router, lanes=self.lanes, **kwargs))
+
+    def child(self, **kwargs):
+        '''it will create the child process's connection peer. In routed mode it must be called from within the child
+        process itself as the peer is registered under the PID of the process creating it
+        '''
+        return queuepi.Child(self.queue, **self.peer_kwargs(router=self.router, lanes=self.lanes, worker=True,
+                                                            **kwargs))
+
+
+class PipeHub(CommunicationFactory):
+    '''Class Factory used to create PIPE-based connection peers in a 1 to N pattern: each child - up to 'max_children'
+    - gets its own duplex PIPE to the parent, which fans in from all of them and routes each message it sends to the
+    PIPE of its recipient, or to every PIPE when there is no recipient
+    '''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        pipes = [self.context.Pipe() for _ in range(kwargs.get('max_children', None) or routing.default_max_peers())]
+        self.parent_conns = [parent_conn for parent_conn, _ in pipes]
+        self.child_conns = [child_conn for _, child_conn in pipes]
+        self.registry = routing.PeerRegistry(len(pipes), self.context)
+
+    def parent(self, **kwargs):
+        '''it will create the parent process's connection peer, the hub itself
+        '''
+        return pipeapi.HubParent(self.parent_conns, **self.peer_kwargs(registry=self.registry, **kwargs))
+
+    def child(self, **kwargs):
+        '''it will create the child process's connection peer on the first PIPE free. It must be called from within the
+        child process itself as the PIPE is registered under the PID of the process creating it
+        '''
+        slot = self.registry.register(multiprocessing.current_process().pid)
+        return pipeapi.Child(self.child_conns[slot], **self.peer_kwargs(**kwargs))
+
+
+class AsyncPipeCommunication(PipeCommunication):
+    '''Class Factory used to create PIPE-based connection peers whose 'send' and 'receive' are coroutines, so that a
+    single event loop can drive many connections without blocking or polling
+    '''
+
+    def parent(self, **kwargs):
+        '''it will create the parent process's connection peer
+        '''
+        return asyncapi.PipeParent(self.parent_conn, **self.peer_kwargs(**kwargs))
+
+    def child(self, **kwargs):
+        '''it will create the child process's connection peer
+        '''
+        return asyncapi.PipeChild(self.child_conn, **self.peer_kwargs(**kwargs))
+
+
+class AsyncQueueCommunication(QueueCommunication):
+    '''Class Factory used to create QUEUE-based connection peers whose 'send' and 'receive' are coroutines
+    '''
+
+    def parent(self, **kwargs):
+        '''it will create the parent process's connection peer
+        '''
+        return asyncapi.QueueParent(self.queue, **self.peer_kwargs(router=self.router, lanes=self.lanes, **kwargs))
+
+    def child(self, **kwargs):
+        '''it will create the child process's connection peer. In routed mode it must be called from within the child
+        process itself as the peer is registered under the PID of the process creating it
+        '''
+        return asyncapi.QueueChild(self.queue, **self.peer_kwargs(router=self.router, lanes=self.lanes, worker=True,
+                                                                  **kwargs))
+
+
+class RingBufferCommunication(CommunicationFactory):
+    '''Class Factory used to create peers communicating through a pair of shared memory rings - one per direction -
+    for same-host, latency-sensitive 1 to 1 conversations.
+
+    'capacity' is the size in bytes of each ring. A single encoded message may take half of it at most. If
+    'multi_producer' is passed as True, many children can send to the parent through the same child end. Only one
+    process may receive on each end though. 'timeout' is the amount of seconds 'send' waits for room in a full ring
+    before throwing an exception, None meaning waiting for ever.
+    '''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.parent_conn, self.child_conn = ringbuffer.RingPipe(kwargs.get('capacity', ringbuffer.DEFAULT_CAPACITY),
+                                                                kwargs.get('multi_producer', False),
+                                                                kwargs.get('timeout', None), self.context)
 
     def parent(self, **kwargs):
         '''it will create the parent process's connection peer
         '''
-        return queuepi.Parent(self.queue, **kwargs)
+        return ringapi.Parent(self.parent_conn, **self.peer_kwargs(**kwargs))
 
     def child(self, **kwargs):
         '''it will create the child process's connection peer
         '''
-        return queuepi.Child(self.queue, **kwargs)
+        return ringapi.Child(self.child_conn, **self.peer_kwargs(**kwargs))
+
+
+class SocketCommunication(CommunicationFactory):
+    '''Class Factory used to create peers connected through sockets, so that children may run on other hosts. The
+    parent listens on 'address' - a (host, port) tuple or the path of a Unix socket, see multiprocessing.connection -
+    and each child connects to it. Children on other hosts create their own factory with the same 'address',
+    'family' and 'authkey'.
+
+    'authkey' should always be given when listening on a network interface: connections failing to authenticate with
+    it are refused. By default the parent listens on an ephemeral port of localhost, in which case 'parent' must be
+    called before starting the children so that they learn the port.
+    '''
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.address = kwargs.get('address', ('localhost', 0))
+        self.family = kwargs.get('family', None)
+        self.authkey = kwargs.get('authkey', None)
+        self.listener = None
+
+    def __getstate__(self):
+        return {**self.__dict__, 'listener': None}
+
+    def parent(self, **kwargs):
+        '''it will create the parent process's connection peer, listening on the address of the factory
+        '''
+        if not self.listener:
+            self.listener = multiprocessing.connection.Listener(self.address, self.family)  # The peer authenticates
+            self.address = self.listener.address
+        return socketapi.Parent(self.listener, **self.peer_kwargs(authkey=self.authkey, **kwargs))
+
+    def child(self, **kwargs):
+        '''it will create the child process's connection peer, connected to the parent. Peers created within the same
+        process share their connection
+        '''
+        return socketapi.Child(self.address, **self.peer_kwargs(family=self.family, authkey=self.authkey, **kwargs))
@@ -1,16 +1,63 @@
 import abc
+import collections
 import multiprocessing
+import multiprocessing.connection
+import time
+
+from pymulproc import compression, deadletter, metrics, mpq_protocol, serializers, shm, streams
+
+BATCH_SIZE = 1  # number of messages 'send' buffers before flushing them as a single frame. 1 disables buffering
+BATCH_LINGER = 0.005  # max seconds a buffered message waits for the batch to fill before being flushed
 
 
 class CommunicationApiInterface(abc.ABC):
     '''Define the interface that each end wil handler to communicate with each other
+
+    If 'batch_size' is greater than 1, 'send' buffers messages and flushes them as a single frame once such amount is
+    reached or the first buffered message has been waiting for more than 'linger' seconds. The linger window is only
+    checked when 'send' or 'receive' are called, so 'flush' should be called once the last message has been sent.
+
+    If 'shm_threshold' is given, buffers - bytes, bytearray, memoryview or numpy arrays - of at least such amount of
+    bytes are sent through shared memory and received as zero-copy views. It needs the pickle serializer. See 'shm'
+    module.
+
+    'serializer' turns the data of each message into bytes and back: pickle by default, 'raw' bytes, 'json' or
+    'msgpack' - given by name or as a serializers.Serializer instance. Both ends must use the same one. See
+    'serializers' module.
+
+    If a 'compression' codec is given - 'zlib', 'lzma', 'lz4' or 'zstd' by name or as a compression.Compressor
+    instance - payloads of at least 'compression_threshold' bytes are compressed, as long as that makes them smaller.
+    The receiving end decompresses them whatever its own settings. See 'compression' module.
+
+    If 'metrics' is passed as True - or as a metrics.PeerMetrics instance - the peer keeps counters and histograms of
+    its traffic, returned by 'stats'. See 'metrics' module.
+
+    If a 'ttl' is given every message sent carries a 'deadline' header that many seconds ahead, unless it already has
+    one. Messages whose deadline has passed are never received: they are put into the 'dead_letters' channel - a
+    deadletter.DeadLetterChannel shared by the peers of a factory - if any, and dropped. So are messages discarded by
+    a backpressure policy. See 'deadletter' module.
     '''
-    def __init__(self, conn):
+    def __init__(self, conn, **kwargs):
         self.conn = conn
         self.pid = multiprocessing.current_process().pid
+        self.batch_size = kwargs.get('batch_size', BATCH_SIZE)
+        self.linger = kwargs.get('linger', BATCH_LINGER)
+        self.shm_threshold = kwargs.get('shm_threshold', None)
+        self.outbox = []
+        self.outbox_since = None
+        self.pending = collections.deque()  # messages already taken out of a batch frame but not yet received
+        self.metrics = metrics.get_metrics(kwargs.get('metrics', None))
+        self.serializer = serializers.get_serializer(kwargs.get('serializer', None))
+        if self.shm_threshold is not None:
+            shm.check_serializer(self.serializer)
+            shm.prepare()
+        self.compressor = compression.get_compressor(kwargs.get('compression', None))
+        self.compression_threshold = kwargs.get('compression_threshold', compression.COMPRESSION_THRESHOLD)
+        self.ttl = kwargs.get('ttl', None)
+        self.dead_letters = deadletter.get_channel(kwargs.get('dead_letters', None))
 
     @abc.abstractmethod
-    def send(self, request, sender_pid=None, recipient_pid=None, data=None):
+    def send(self, request, sender_pid=None, recipient_pid=None, data=None, headers=None):
         ''''send' method to be implemented at each end and used to send information down the PIPE or to a
         Joined Queue, respectively
 
@@ -18,6 +65,7 @@ class CommunicationApiInterface(abc.ABC):
         :param sender_pid: pid of the sender process
         :param recipient_pid: pid of the process to which the request is addressed to
         :param data: extra data to be passed on
+        :param headers: optional headers of the message - see mpq_protocol.HEADER_FIELDS
         '''
         pass
 
@@ -25,5 +73,207 @@ class CommunicationApiInterface(abc.ABC):
     def receive(self, **kwargs):
         ''''send' method to be implemented at each end and used to catch or fetch information from the PIPE or a Joined
         Queue, respectively.
+
+        :param block: if True wait until a message is available
+        :param timeout: maximum amount of seconds to wait for a message. None means waiting for ever
+        '''
+        pass
+
+    @abc.abstractmethod
+    def send_many(self, messages):
+        '''Send several messages at once coalescing them into as few frames as possible
+
+        :param messages: iterable of sequences with the same structure as 'send' parameters: request, sender pid,
+        recipient pid and data. Trailing elements may be omitted. Messages may also be given as mpq_protocol.Message
+        instances, which keep their headers.
+        '''
+        pass
+
+    def receive_many(self, max_items, **kwargs):
+        '''Receive up to 'max_items' messages. Only the first one is waited for as indicated by 'block' and 'timeout' -
+        see 'receive'. The rest are only returned if they are ready straight away.
+        '''
+        messages = []
+        message = self.receive(**kwargs)
+        kwargs = {'func': kwargs['func']} if 'func' in kwargs else {}
+        while message:
+            messages.append(message)
+            if len(messages) >= max_items:
+                break
+            message = self.receive(**kwargs)
+        return messages
+
+    def send_stream(self, source, recipient_pid=None, **kwargs):
+        '''Send a bytes-like object, a file object or any iterable as a stream of bounded chunks, so that neither end
+        holds all of it at once. Only 'window' chunks - streams.WINDOW by default - may be in flight before the
+        receiver takes them. It returns once the whole stream has been taken. See streams.send for other parameters
+        '''
+        return streams.send(self, source, recipient_pid, **kwargs)
+
+    def receive_stream(self, timeout=None):
+        '''Return an iterator over the chunks of the next stream sent to this end. It should be consumed to the end:
+        the sender waits until it is. Messages other than the stream's arriving in between are received afterwards
+        '''
+        return streams.receive(self, timeout)
+
+    def max_chunk_size(self):
+        '''Return the largest chunk of a stream this end can send, None meaning that its transport sets no limit
+        '''
+        return None
+
+    def many_receivers(self):
+        '''Tell whether a message sent with no recipient may be taken by - or delivered to - any of many processes,
+        rather than by the only one at the other end
+        '''
+        return False
+
+    def buffer(self, message):
+        '''Add a message to the outbox and flush it if the batch is full or has been waiting for too long
+        '''
+        if not self.outbox:
+            self.outbox_since = time.monotonic()
+        self.outbox.append(message)
+        if len(self.outbox) >= self.batch_size or time.monotonic() - self.outbox_since >= self.linger:
+            self.flush()
+        return message
+
+    def flush(self):
+        '''Send all messages waiting in the outbox
+        '''
+        if self.outbox:
+            outbox, self.outbox = self.outbox, []
+            self.send_many(outbox)
+
+    def stats(self):
+        '''Return a snapshot of the metrics of the peer, which is empty if they are disabled
+        '''
+        return self.metrics.snapshot() if self.metrics else {}
+
+    def build_message(self, request, sender_pid=None, recipient_pid=None, data=None, headers=None):
+        '''Return the message to be sent with this process as sender unless other PID is given
+        '''
+        return mpq_protocol.Message(request, self.pid if not sender_pid else sender_pid, recipient_pid, data, headers)
+
+    def as_message(self, message):
+        '''Return the message to be sent out of one of the items passed to 'send_many'
+        '''
+        if isinstance(message, mpq_protocol.Message):
+            return self.build_message(*message, headers=message.headers)
+        return self.build_message(*message)
+
+    def encode(self, message, broadcast=False):
+        '''Return the frame of the message as it is put down the wire. Frames to be 'broadcast' to many recipients
+        keep their payload inline, as a shared memory segment is released by the first recipient attaching to it.
+        Peers keeping metrics stamp the time in a 'sent_at' header, so that receivers can tell how long it travelled
+        '''
+        stamps = {}
+        if self.ttl is not None and message.deadline is None:
+            stamps['deadline'] = time.time() + self.ttl
+        if self.metrics and message.sent_at is None:
+            stamps['sent_at'] = time.time()
+        if stamps and message.request != mpq_protocol.REQ_BATCH:
+            message = mpq_protocol.Message(message.request, message.sender_pid, message.recipient_pid, message.data,
+                                           {**message.headers, **stamps})
+        if self.shm_threshold is not None and not broadcast:
+            data = shm.export(message.data, self.shm_threshold)
+            if data is not message.data:
+                message = mpq_protocol.Message(message.request, message.sender_pid, message.recipient_pid, data,
+                                               message.headers)
+        try:
+            return message.encode(self.serializer, self.compressor, self.compression_threshold)
+        except Exception:
+            shm.release(message.data)
+            raise
+
+    def decode(self, frame):
+        '''Return the message carried by the frame. Its payload is not usable until the message is loaded
+        '''
+        return mpq_protocol.Message.decode(frame, self.serializer)
+
+    def view(self, frame):
+        '''Return the message carried by the frame with its data left serialized until accessed, to check it before
+        loading it - see mpq_protocol.MessageView
+        '''
+        return mpq_protocol.MessageView(frame, self.serializer)
+
+    def load(self, message):
+        '''Turn the payload of a message received into what the sender put in it. It should only be called once the
+        message has been accepted: payloads sent through shared memory are released from it at this point
+        '''
+        message.data = shm.attach(message.data)
+        if self.metrics and message.sent_at is not None:
+            self.metrics.observe('transit_latency', max(0, time.time() - message.sent_at))
+        return message
+
+    def build_batch(self, frames):
+        '''Return the message carrying the given encoded messages as a single frame
+        '''
+        return self.build_message(mpq_protocol.REQ_BATCH, data=frames)
+
+    def unpack(self, frame):
+        '''Decode the frame and return its message if it is not a batch. Otherwise keep all the messages it carries as
+        pending and return the first of them. False is returned if the message - or all of them - had expired
+        '''
+        if self.expire(frame):
+            return False
+        message = self.decode(frame)
+        if self.metrics:
+            self.metrics.received(len(message.data) if message.request == mpq_protocol.REQ_BATCH else 1, len(frame))
+        if message.request != mpq_protocol.REQ_BATCH:
+            return self.load(message)
+        self.pending.extend(self.load(self.decode(item)) for item in message.data if not self.expire(item))
+        return self.pending.popleft() if self.pending else False
+
+    def expire(self, frame):
+        '''Dead-letter the frame if the deadline of its message has passed. Return whether it had
+        '''
+        if not mpq_protocol.expired(mpq_protocol.read_headers(frame)):
+            return False
+        self.dead_letter(frame, deadletter.EXPIRED)
+        return True
+
+    def dead_letter(self, frame, reason):
+        '''Put the frame of a message that could not be delivered into the dead letter channel, if any, and release
+        the shared memory segments it refers to, as nobody is ever going to attach to them
+        '''
+        if self.metrics:
+            self.metrics.count('dead_lettered')
+        if self.dead_letters:
+            self.dead_letters.put(frame, reason)
+        if self.serializer.codec == serializers.PICKLE.codec:  # No other serializer can carry shared memory handles
+            self.release(frame)
+
+    def release(self, frame):
+        '''Unlink the shared memory segments of the message carried by the frame - or of those carried by a batch one
+        '''
+        message = self.decode(frame)
+        if message.request != mpq_protocol.REQ_BATCH:
+            shm.release(message.data)
+            return
+        for item in message.data:
+            shm.release(self.decode(item).data)
+
+    @abc.abstractmethod
+    def readers(self):
+        '''Return the connection objects that become readable when a message arrives for this end, so that they can be
+        passed on to multiprocessing.connection.wait
         '''
         pass
+
+
+def wait_any(peers, timeout=None):
+    '''Sleep until at least one of the peers has a message ready to be received or the timeout expires. The list of
+    peers ready is returned, in the same order they were passed, which is empty if the timeout expired.
+
+    For QUEUE-based peers being ready means that a message sits at the front of a queue the peer reads from, which
+    'receive' may still reject if it does not meet its 'func' criteria.
+    '''
+    readers = {}
+    for peer in peers:
+        for reader in peer.readers():
+            readers.setdefault(reader, []).append(peer)
+    # Messages already unpacked from a batch frame are ready straight away
+    ready_peers = {id(peer) for peer in peers if peer.pending}
+    ready = multiprocessing.connection.wait(list(readers), 0 if ready_peers else timeout)
+    ready_peers.update(id(peer) for reader in ready for peer in readers[reader])
+    return [peer for peer in peers if id(peer) in ready_peers]
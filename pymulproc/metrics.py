@@ -0,0 +1,136 @@
+import bisect
+import functools
+import time
+
+LATENCY_BOUNDS = tuple(1e-6 * 2 ** exponent for exponent in range(24))  # seconds, from 1 microsecond to ~8 seconds
+DEPTH_BOUNDS = tuple(2 ** exponent for exponent in range(21))  # messages, from 1 to ~1 million
+DEPTH_SAMPLE_RATE = 64  # the depth of a queue is sampled once every such amount of frames put into it
+
+COUNTERS = ('messages_sent', 'frames_sent', 'bytes_sent', 'messages_received', 'bytes_received', 'requeued',
+            'retries', 'stolen', 'dead_lettered')
+
+
+class Histogram:
+    '''Count the values observed that fall into each bucket - that is those smaller or equal to each bound and bigger
+    than the previous one - plus their sum
+    '''
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last bucket takes the values bigger than any bound
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def snapshot(self):
+        return {'count': sum(self.counts), 'sum': self.sum,
+                'buckets': list(zip(self.bounds + (float('inf'), ), self.counts))}
+
+
+class PeerMetrics:
+    '''Counters and histograms of a peer. 'hook', if given, is called with the name and value of every observation as
+    it happens - such as ('bytes_sent', 120) or ('send_latency', 0.00002) - so that they can be forwarded elsewhere.
+
+    'send_latency' and 'receive_latency' are how long calls to 'send' and 'receive' take, while 'transit_latency' is
+    the time messages spend from being encoded by a sender keeping metrics until received. The latter relies on the
+    clocks of both ends, which only agree on the same host
+    '''
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.histograms = {
+            'send_latency': Histogram(LATENCY_BOUNDS),
+            'receive_latency': Histogram(LATENCY_BOUNDS),
+            'transit_latency': Histogram(LATENCY_BOUNDS),
+            'queue_depth': Histogram(DEPTH_BOUNDS),
+        }
+
+    def clone(self):
+        '''Return new metrics, with nothing counted yet, calling the same hook
+        '''
+        return PeerMetrics(self.hook)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+        if self.hook:
+            self.hook(name, value)
+
+    def observe(self, name, value):
+        self.histograms[name].observe(value)
+        if self.hook:
+            self.hook(name, value)
+
+    def sent(self, messages, nbytes):
+        '''Record a frame carrying the given amount of messages and bytes has been sent
+        '''
+        self.count('messages_sent', messages)
+        self.count('frames_sent')
+        self.count('bytes_sent', nbytes)
+
+    def depth_due(self):
+        '''Tell whether the depth of the queue the last frame was sent to should be sampled
+        '''
+        return self.counters['frames_sent'] % DEPTH_SAMPLE_RATE == 1
+
+    def received(self, messages, nbytes):
+        '''Record the given amount of messages and bytes has been received
+        '''
+        self.count('messages_received', messages)
+        self.count('bytes_received', nbytes)
+
+    def snapshot(self):
+        return {**self.counters, **{name: histogram.snapshot() for name, histogram in self.histograms.items()}}
+
+
+def get_metrics(metrics):
+    '''Return the metrics of a peer given its 'metrics' option: True for new ones, the instance itself, or None
+    when disabled
+    '''
+    if metrics is True:
+        return PeerMetrics()
+    return metrics or None
+
+
+def timed(histogram):
+    '''Decorate a 'send' or 'receive' method of a peer to observe how long the call takes in the given histogram, if
+    the peer has metrics enabled. Receives returning nothing are not observed
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not self.metrics:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            if result:
+                self.metrics.observe(histogram, time.perf_counter() - start)
+            return result
+        return wrapper
+    return decorator
+
+
+def prometheus(stats, prefix='pymulproc', **labels):
+    '''Render a stats snapshot in the Prometheus text exposition format. Labels - such as pid='1234' - are added to
+    every sample
+    '''
+    def sample(name, value, **extra):
+        tags = ','.join(f'{key}="{label}"' for key, label in {**labels, **extra}.items())
+        return f'{prefix}_{name}{{{tags}}} {value}' if tags else f'{prefix}_{name} {value}'
+
+    lines = []
+    for name, value in stats.items():
+        if not isinstance(value, dict):
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            lines.append(sample(f'{name}_total', value))
+            continue
+        lines.append(f'# TYPE {prefix}_{name} histogram')
+        cumulative = 0
+        for bound, count in value['buckets']:
+            cumulative += count
+            lines.append(sample(f'{name}_bucket', cumulative, le='+Inf' if bound == float('inf') else repr(bound)))
+        lines.append(sample(f'{name}_sum', value['sum']))
+        lines.append(sample(f'{name}_count', value['count']))
+    return '\n'.join(lines) + '\n'
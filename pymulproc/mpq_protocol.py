@@ -1,3 +1,7 @@
+import struct
+import time
+
+from pymulproc import compression, errors, serializers
 
 PARENT_COMM_INTERFACE = 1
 CHILD_COMM_INTERFACE = 2
@@ -5,9 +9,18 @@ CHILD_COMM_INTERFACE = 2
 REQ_DO = 'DO'  # Request sent by a 'peer' to the other 'peer' to indicate that a task should be done
 REQ_FINISHED = 'FINISHED'  # Request sent by a 'peer' to indicate that it's done with whatever was to be done
 REQ_DIE = 'DIE'  # Request sent by a 'peer' to the other 'peer' to indicate that it should terminate
+REQ_BATCH = 'BATCH'  # Frame carrying a list of encoded messages as data, which are unpacked on arrival
+REQ_PUBLISH = 'PUBLISH'  # Message published on a topic, delivered to every peer subscribed to it
+REQ_STREAM = 'STREAM'  # Chunk of a stream of data, identified by its sender and its 'stream_id' header
+REQ_STREAM_END = 'STREAM_END'  # Last message of a stream, carrying no data. Its 'sequence' header is the chunk count
+REQ_STREAM_ACK = 'STREAM_ACK'  # Sent back by the receiver of a stream with the amount of its messages taken so far
+REQ_HEARTBEAT = 'HEARTBEAT'  # Sent by a supervised 'peer' every now and then to tell that it is alive
 REQ_TEST_PARENT = "I'M PARENT PROCESS"  # Requests to be ignored
 REQ_TEST_CHILD = "I'M CHILD PROCESS"  # Requests to be ignored
 
+# Requests that go ahead of any other where priorities are supported
+CONTROL_REQUESTS = (REQ_DIE, REQ_FINISHED, REQ_HEARTBEAT)
+
 
 S_PID_OFFSET = 1  # offset where the PID of the sender process is located in the message
 R_PID_OFFSET = S_PID_OFFSET + 1  # offset where the PID of the recipient process is located in the message
@@ -25,3 +38,276 @@ R_PID_OFFSET = S_PID_OFFSET + 1  # offset where the PID of the recipient process
 # +------------------------+
 # +    Data                + # (Any Python data structured)
 # +------------------------+
+
+# Wire format of the message above. A fixed size header is packed with 'struct' and followed by the request - only
+# when it is not one of the standard ones, which travel as a one byte code instead - and the serialized data. The
+# upper four bits of the flags hold the codec of the serializer used - pickle by default. See 'serializers' module.
+# Optional headers - such as the topic of a published message - go between the request and the payload when the
+# FLAG_HEADERS flag is set: their total length followed by a code, a length and a value for each of them
+# +----------------+------+--------------+-------+-----+
+# | headers length | code | value length | value | ... |
+# | H              | B    | B            | ...   |     |
+# +----------------+------+--------------+-------+-----+
+# +---------+------+------------+-------+------------+---------------+----------------+--------------+---------+
+# | version | verb | verb length| flags | sender pid | recipient pid | payload length | custom verb  | payload |
+# | B       | B    | B          | B     | i          | i             | I              | verb length  | ...     |
+# +---------+------+------------+-------+------------+---------------+----------------+--------------+---------+
+WIRE_VERSION = 1
+HEADER = struct.Struct('!BBBBiiI')
+
+CUSTOM_VERB = 0  # verb code of any request not listed below. The request itself follows the header
+VERB_CODES = {
+    REQ_DO: 1,
+    REQ_FINISHED: 2,
+    REQ_DIE: 3,
+    REQ_BATCH: 4,
+    REQ_TEST_PARENT: 5,
+    REQ_TEST_CHILD: 6,
+    REQ_PUBLISH: 7,
+    REQ_STREAM: 8,
+    REQ_STREAM_END: 9,
+    REQ_STREAM_ACK: 10,
+    REQ_HEARTBEAT: 11,
+}
+VERBS = {code: verb for verb, code in VERB_CODES.items()}
+
+FLAG_SENDER = 0x01  # the sender pid field is set
+FLAG_RECIPIENT = 0x02  # the recipient pid field is set
+FLAG_HEADERS = 0x04  # optional headers follow the request
+FLAGS_OFFSET = 3  # offset of the flags within the header
+RECIPIENT_OFFSET = 8  # offset of the recipient pid within the header
+CODEC_SHIFT = 4  # bits the codec of the payload is shifted to the left within the flags
+
+PICKLE_PROTOCOL = serializers.PICKLE_PROTOCOL
+
+HEADERS_LENGTH = struct.Struct('!H')
+HEADER_ENTRY = struct.Struct('!BB')
+# Optional headers: name => (code, type of the value)
+HEADER_FIELDS = {
+    'topic': (1, str),
+    'correlation_id': (2, int),
+    'stream_id': (3, int),
+    'sequence': (4, int),
+    'compression': (5, int),
+    'deadline': (6, float),  # time.time() after which the message is no longer wanted
+    'sent_at': (7, float),  # time.time() at which the message was encoded, stamped by peers keeping metrics
+}
+HEADER_NAMES = {code: (name, kind) for name, (code, kind) in HEADER_FIELDS.items()}
+NUMBERS = {int: struct.Struct('!q'), float: struct.Struct('!d')}
+
+
+def pack_headers(headers):
+    '''Return the optional headers packed as they travel after the request
+    '''
+    entries = []
+    for name, value in headers.items():
+        try:
+            code, kind = HEADER_FIELDS[name]
+        except KeyError as ex:
+            raise errors.ProtocolError(f"Unknown header {name!r}") from ex
+        value = value.encode() if kind is str else NUMBERS[kind].pack(value)
+        if len(value) > 0xFF:
+            raise errors.ProtocolError(f"Header {name!r} is longer than {0xFF} bytes")
+        entries.append(HEADER_ENTRY.pack(code, len(value)) + value)
+    entries = b''.join(entries)
+    return HEADERS_LENGTH.pack(len(entries)) + entries
+
+
+class Message:
+    '''Message exchanged between two peers. Its fields can be accessed by name or, as the original list based
+    structure, by position using the offsets above.
+
+    Optional headers, such as 'topic' or 'correlation_id', are kept apart in 'headers' so that the message keeps its
+    length of 4.
+    '''
+
+    __slots__ = ('request', 'sender_pid', 'recipient_pid', 'data', 'headers')
+
+    def __init__(self, request, sender_pid=None, recipient_pid=None, data=None, headers=None):
+        self.request = request
+        self.sender_pid = sender_pid
+        self.recipient_pid = recipient_pid
+        self.data = data
+        self.headers = headers or {}
+
+    @property
+    def topic(self):
+        return self.headers.get('topic')
+
+    @property
+    def correlation_id(self):
+        return self.headers.get('correlation_id')
+
+    @property
+    def stream_id(self):
+        return self.headers.get('stream_id')
+
+    @property
+    def deadline(self):
+        return self.headers.get('deadline')
+
+    @property
+    def sent_at(self):
+        return self.headers.get('sent_at')
+
+    def expired(self, now=None):
+        return expired(self.headers, now)
+
+    def __getitem__(self, index):
+        return (self.request, self.sender_pid, self.recipient_pid, self.data)[index]
+
+    def __len__(self):
+        return 4
+
+    def __iter__(self):
+        return iter((self.request, self.sender_pid, self.recipient_pid, self.data))
+
+    def __eq__(self, other):
+        if isinstance(other, (Message, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        headers = f", headers={self.headers!r}" if self.headers else ''
+        return f"Message({self.request!r}, {self.sender_pid!r}, {self.recipient_pid!r}, {self.data!r}{headers})"
+
+    def encode(self, serializer=serializers.PICKLE, compressor=None, threshold=compression.COMPRESSION_THRESHOLD):
+        '''Return the message packed as it travels down the wire, its data serialized with the given serializer. Batch
+        frames are always pickled as they carry a list of frames. Payloads of at least 'threshold' bytes are compressed
+        with the given compressor - if any - as long as that makes them smaller, which the 'compression' header tells
+        '''
+        headers = self.headers
+        code = VERB_CODES.get(self.request, CUSTOM_VERB)
+        verb = self.request.encode() if code == CUSTOM_VERB else b''
+        if len(verb) > 0xFF:
+            raise errors.ProtocolError(f"Request {self.request!r} is longer than {0xFF} bytes")
+        if code == VERB_CODES[REQ_BATCH]:
+            serializer = serializers.PICKLE
+        payload = b'' if self.data is None else serializer.dumps(self.data)
+        if compressor and len(payload) >= threshold:
+            compressed = compressor.compress(payload)
+            if len(compressed) < len(payload):
+                payload, headers = compressed, {**headers, 'compression': compressor.codec}
+        flags = (FLAG_SENDER if self.sender_pid is not None else 0) | \
+                (FLAG_RECIPIENT if self.recipient_pid is not None else 0) | \
+                (FLAG_HEADERS if headers else 0) | \
+                serializer.codec << CODEC_SHIFT
+        header = HEADER.pack(WIRE_VERSION, code, len(verb), flags, self.sender_pid or 0, self.recipient_pid or 0,
+                             len(payload))
+        return b''.join((header, verb, pack_headers(headers) if headers else b'', payload))
+
+    @classmethod
+    def decode(cls, frame, serializer=serializers.PICKLE):
+        '''Build the message back from its wire format, decompressing its payload if needed. A ProtocolError is raised
+        if its data was serialized with other serializer than the given one
+        '''
+        return MessageView(frame, serializer).message()
+
+
+class MessageView(Message):
+    '''Message read straight from its frame. Its request, pids and headers are unpacked up front but its data is only
+    deserialized - and decompressed - when first accessed, so that a message can be checked, and passed on as the very
+    same frame, without paying for its payload. The ProtocolError of a serializer mismatch is raised at that point
+    '''
+
+    __slots__ = ('frame', 'serializer', 'offset', 'length', 'codec', 'loaded', 'payload')
+
+    def __init__(self, frame, serializer=serializers.PICKLE):
+        self.request, self.sender_pid, self.recipient_pid, self.offset, self.length = read_header(frame)
+        self.headers = read_headers(frame)
+        self.codec = self.headers.pop('compression', None)
+        self.frame = frame
+        self.serializer = serializer
+        self.loaded = False
+        self.payload = None
+
+    @property
+    def data(self):
+        if not self.loaded:
+            self.payload = self.load()
+            self.loaded = True
+        return self.payload
+
+    def load(self):
+        '''Deserialize the payload of the frame, decompressing it if needed
+        '''
+        if not self.length:
+            return None
+        serializer = serializers.PICKLE if self.request == REQ_BATCH else self.serializer
+        codec = self.frame[FLAGS_OFFSET] >> CODEC_SHIFT
+        if codec != serializer.codec:
+            raise errors.ProtocolError(f"Message {self.request!r} from {self.sender_pid} was serialized with codec "
+                                       f"{codec} but {serializer.name!r} - codec {serializer.codec} - is in use")
+        payload = memoryview(self.frame)[self.offset:self.offset + self.length]
+        if self.codec is not None:
+            payload = compression.decompress(self.codec, payload)
+        return serializer.loads(payload)
+
+    def message(self):
+        '''Return the message with its data deserialized, no longer holding the frame
+        '''
+        return Message(self.request, self.sender_pid, self.recipient_pid, self.data, self.headers)
+
+
+def read_header(frame):
+    '''Unpack the header of a frame without touching its payload. It returns the request, sender pid, recipient pid and
+    the offset and length of the payload within the frame
+    '''
+    try:
+        version, code, verb_length, flags, sender_pid, recipient_pid, length = HEADER.unpack_from(frame)
+    except struct.error as ex:
+        raise errors.ProtocolError(f"Frame of {len(frame)} bytes is too short to be a message") from ex
+    if version != WIRE_VERSION:
+        raise errors.ProtocolError(f"Wire format version {version} is not supported")
+    offset = HEADER.size + verb_length
+    if flags & FLAG_HEADERS:
+        offset += HEADERS_LENGTH.size + HEADERS_LENGTH.unpack_from(frame, offset)[0]
+    if code == CUSTOM_VERB:
+        request = bytes(frame[HEADER.size:HEADER.size + verb_length]).decode()
+    else:
+        try:
+            request = VERBS[code]
+        except KeyError as ex:
+            raise errors.ProtocolError(f"Unknown verb code {code}") from ex
+    return (request,
+            sender_pid if flags & FLAG_SENDER else None,
+            recipient_pid if flags & FLAG_RECIPIENT else None,
+            offset,
+            length)
+
+
+def readdress(frame, recipient_pid):
+    '''Return a copy of the frame addressed to other recipient, without touching the rest of it
+    '''
+    frame = bytearray(frame)
+    struct.pack_into('!i', frame, RECIPIENT_OFFSET, recipient_pid)
+    frame[FLAGS_OFFSET] |= FLAG_RECIPIENT
+    return bytes(frame)
+
+
+def expired(headers, now=None):
+    '''Tell whether the deadline among the given headers - if any - has passed
+    '''
+    deadline = headers.get('deadline')
+    return deadline is not None and deadline <= (time.time() if now is None else now)
+
+
+def read_headers(frame):
+    '''Return the optional headers of a frame as a dictionary, without touching its payload. Unknown headers are
+    skipped so that newer peers can talk to older ones
+    '''
+    if not frame[FLAGS_OFFSET] & FLAG_HEADERS:
+        return {}
+    offset = HEADER.size + frame[2]  # the verb length
+    end = offset + HEADERS_LENGTH.size + HEADERS_LENGTH.unpack_from(frame, offset)[0]
+    offset += HEADERS_LENGTH.size
+    headers = {}
+    while offset < end:
+        code, length = HEADER_ENTRY.unpack_from(frame, offset)
+        offset += HEADER_ENTRY.size
+        if code in HEADER_NAMES:
+            name, kind = HEADER_NAMES[code]
+            value = frame[offset:offset + length]
+            headers[name] = bytes(value).decode() if kind is str else NUMBERS[kind].unpack(value)[0]
+        offset += length
+    return headers
@@ -1,4 +1,11 @@
-from pymulproc import mpq_protocol, interfaces
+import multiprocessing
+import multiprocessing.connection
+
+from pymulproc import errors
+from pymulproc import metrics, mpq_protocol, interfaces
+
+RECV_BUFFER_SIZE = 64 * 1024  # initial size of the buffer frames are read into
+MAX_RECV_BUFFER_SIZE = 16 * 1024 * 1024  # the buffer grows to fit larger frames up to this size
 
 
 class PipeCommunicationApi(interfaces.CommunicationApiInterface):
@@ -7,22 +14,77 @@ class PipeCommunicationApi(interfaces.CommunicationApiInterface):
     '''
 
     def __init__(self, *args, **kwargs):
-        super().__init__(*args)
+        super().__init__(*args, **kwargs)
+        self.inbox = bytearray(RECV_BUFFER_SIZE)
 
-    def send(self, request, sender_pid=None, recipient_pid=None, data=None):
+    @metrics.timed('send_latency')
+    def send(self, request, sender_pid=None, recipient_pid=None, data=None, headers=None):
         '''sends a message down the PIPE
         '''
-        message = [request, self.pid, recipient_pid, data]
-        self.conn.send(message)
+        message = mpq_protocol.Message(request, self.pid, recipient_pid, data, headers)
+        if self.batch_size > 1:
+            return self.buffer(message)
+        self.write(self.conn, self.encode(message))
         return message
 
+    def send_many(self, messages):
+        '''sends all messages down the PIPE as a single frame
+        '''
+        messages = [self.as_message(message) for message in messages]
+        for frame, count in self.coalesce(messages):
+            self.write(self.conn, frame, count)
+        return messages
+
+    def coalesce(self, messages):
+        '''Return the frame the messages travel in as a (frame, amount of messages carried) tuple within a list - empty
+        if there are no messages
+        '''
+        if len(messages) == 1:
+            return [(self.encode(messages[0]), 1)]
+        return [(self.encode(self.build_batch([self.encode(message) for message in messages])), len(messages))] \
+            if messages else []
+
+    def write(self, conn, frame, messages=1):
+        '''writes a frame carrying the given amount of messages down the PIPE
+        '''
+        conn.send_bytes(frame)
+        if self.metrics:
+            self.metrics.sent(messages, len(frame))
+
+    def read(self, conn):
+        '''reads the next frame from the PIPE into the buffer of the peer, rather than into newly allocated bytes. The
+        view returned is only valid until the next read, so the frame must be decoded straight away
+        '''
+        try:
+            size = conn.recv_bytes_into(self.inbox)
+        except multiprocessing.BufferTooShort as ex:
+            frame = ex.args[0]
+            if len(frame) <= MAX_RECV_BUFFER_SIZE:
+                self.inbox = bytearray(len(frame))
+            return frame
+        return memoryview(self.inbox)[:size]
+
+    @metrics.timed('receive_latency')
     def receive(self, **kwargs):
         '''Check if a message is ready to be caught from the PIPE
+
+        By default it returns False straight away if nothing is ready. If 'block' is passed as True it sleeps until a
+        message arrives, or for 'timeout' seconds at most if such parameter is also provided.
         '''
-        if self.conn.poll():
-            return self.conn.recv()
+        if self.outbox:  # Async peers flush - a coroutine - before getting here
+            self.flush()
+        if self.pending:
+            return self.pending.popleft()
+        timeout = kwargs.get('timeout', None if kwargs.get('block', 'timeout' in kwargs) else 0)
+        if self.conn.poll(timeout):
+            return self.unpack(self.read(self.conn))
         return False
 
+    def readers(self):
+        '''The PIPE end itself becomes readable when a message arrives
+        '''
+        return [self.conn]
+
 
 class Parent(PipeCommunicationApi):
     '''Class that will instantiate the parent process' peer - It's PIPE communication end
@@ -40,3 +102,91 @@ class Child(PipeCommunicationApi):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.peer = mpq_protocol.CHILD_COMM_INTERFACE
+
+
+class HubParent(PipeCommunicationApi):
+    '''Class that will instantiate the parent process' peer of a PIPE hub, that is one PIPE per child in a 1 to N
+    pattern. 'conn' is the list of the parent's ends and 'registry' tells which child is at the other end of each.
+
+    Messages addressed to a child are written only into its PIPE, while those with no recipient are broadcast to all
+    registered children. 'receive' fans in from all PIPEs, taking turns among those ready so that no child is starved.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.peer = mpq_protocol.PARENT_COMM_INTERFACE
+        self.registry = kwargs.get('registry', None)
+        self.cursor = 0  # index of the PIPE to be checked first in the next 'receive'
+
+    def route(self, recipient_pid):
+        '''Return the PIPEs a message addressed to recipient_pid should be written into
+        '''
+        if recipient_pid is None:
+            return [self.conn[slot] for slot in sorted(self.registry.slots().values())]
+        slot = self.registry.slot_of(recipient_pid)
+        if slot is None:
+            raise errors.PipeHubCommunicationError(f"Process {recipient_pid} is not connected to the hub")
+        return [self.conn[slot]]
+
+    @metrics.timed('send_latency')
+    def send(self, request, sender_pid=None, recipient_pid=None, data=None, headers=None):
+        '''sends a message down the PIPE of its recipient or down all PIPEs if there is no recipient
+        '''
+        message = mpq_protocol.Message(request, self.pid, recipient_pid, data, headers)
+        if self.batch_size > 1:
+            return self.buffer(message)
+        conns = self.route(recipient_pid)
+        frame = self.encode(message, broadcast=len(conns) > 1)
+        self.deliver({conn: (frame, 1) for conn in conns}, broadcast=recipient_pid is None)
+        return message
+
+    def send_many(self, messages):
+        '''sends the messages coalescing into a single frame all of those going down the same PIPE
+        '''
+        messages = [self.as_message(message) for message in messages]
+        frames = {}
+        for message in messages:
+            conns = self.route(message.recipient_pid)
+            frame = self.encode(message, broadcast=len(conns) > 1)
+            for conn in conns:
+                frames.setdefault(conn, []).append(frame)
+        self.deliver({conn: (batch[0] if len(batch) == 1 else self.encode(self.build_batch(batch)), len(batch))
+                      for conn, batch in frames.items()},
+                     broadcast=all(message.recipient_pid is None for message in messages))
+        return messages
+
+    def deliver(self, frames, broadcast=False):
+        '''writes each frame down its PIPE - 'frames' maps every PIPE to the frame and the amount of messages it
+        carries. 'broadcast' tells whether the frames carry only messages with no recipient: a PIPE hub writes them
+        all the same, but subclasses can use it to tell a broadcast from a message that had to arrive, as the socket
+        hub does to not fail when children it broadcasts to are gone
+        '''
+        for conn, (frame, messages) in frames.items():
+            self.write(conn, frame, messages)
+
+    @metrics.timed('receive_latency')
+    def receive(self, **kwargs):
+        '''Check if a message is ready to be caught from any of the PIPEs, with the same parameters as the 1 to 1
+        PIPE communication
+        '''
+        self.flush()
+        if self.pending:
+            return self.pending.popleft()
+        timeout = kwargs.get('timeout', None if kwargs.get('block', 'timeout' in kwargs) else 0)
+        ready = multiprocessing.connection.wait(self.conn, timeout)
+        for offset in range(len(self.conn) if ready else 0):
+            index = (self.cursor + offset) % len(self.conn)
+            if self.conn[index] in ready:
+                self.cursor = index + 1
+                return self.unpack(self.read(self.conn[index]))
+        return False
+
+    def many_receivers(self):
+        '''Messages with no recipient are broadcast to every child
+        '''
+        return True
+
+    def readers(self):
+        '''All PIPEs of the hub become readable when a child sends a message
+        '''
+        return list(self.conn)
@@ -0,0 +1,90 @@
+import glob
+import multiprocessing
+import os
+
+COMPACT = 'compact'  # one CPU each, filling a NUMA node before moving on to the next one
+SPREAD = 'spread'  # one CPU each, taking turns among the NUMA nodes
+PER_NODE = 'per_node'  # all CPUs of a NUMA node each, taking turns among the nodes
+POLICIES = (COMPACT, SPREAD, PER_NODE)
+
+NODES_PATH = '/sys/devices/system/node'
+
+
+def allowed_cpus():
+    '''Return the CPUs this process may run on
+    '''
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(multiprocessing.cpu_count()))
+
+
+def parse_cpulist(text):
+    '''Return the CPUs of a list such as '0-3,8,10-11' as the kernel writes them
+    '''
+    cpus = []
+    for part in text.strip().split(','):
+        if part:
+            first, _, last = part.partition('-')
+            cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def topology():
+    '''Return the CPUs of each NUMA node this process may run on, as a list of lists. A single node holding them all
+    is returned where the topology cannot be read - anything but Linux
+    '''
+    allowed = allowed_cpus()
+    nodes = []
+    for path in sorted(glob.glob(os.path.join(NODES_PATH, 'node[0-9]*', 'cpulist')),
+                       key=lambda path: int(os.path.basename(os.path.dirname(path))[4:])):
+        with open(path) as cpulist:
+            cpus = [cpu for cpu in parse_cpulist(cpulist.read()) if cpu in allowed]
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [allowed]
+
+
+def plan(processes, policy=COMPACT, nodes=None):
+    '''Return the set of CPUs each of 'processes' processes should be pinned to as the policy says, given the CPUs of
+    each NUMA node - those of this machine by default. CPUs are reused once every one has been given out
+    '''
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown placement policy {policy!r}. Choose one of {POLICIES}")
+    nodes = nodes or topology()
+    if policy == PER_NODE:
+        return [set(nodes[index % len(nodes)]) for index in range(processes)]
+    if policy == COMPACT:
+        cpus = [cpu for node in nodes for cpu in node]
+    else:
+        cpus = [node[index] for index in range(max(map(len, nodes))) for node in nodes if index < len(node)]
+    return [{cpus[index % len(cpus)]} for index in range(processes)]
+
+
+def pin(cpus):
+    '''Pin the calling process to the given CPUs. Return whether it could - only where os.sched_setaffinity exists
+    '''
+    if not hasattr(os, 'sched_setaffinity'):
+        return False
+    os.sched_setaffinity(0, cpus)
+    return True
+
+
+def bootstrap(cpus, target, args):
+    '''Entry point of every placed process: pin itself, if told so, before running target(*args)
+    '''
+    if cpus is not None:
+        pin(cpus)
+    target(*args)
+
+
+def workers(target, args=(), processes=None, policy=COMPACT, nodes=None, context=multiprocessing):
+    '''Return 'processes' processes of the given multiprocessing context - as many as CPUs this process may run on by
+    default - running target(*args), pinned as the policy says. They are not started. None as policy leaves them
+    unpinned.
+
+    Processes pin themselves before running target, so that the memory they touch first - such as the peer target
+    creates and its receive buffers - is allocated by the kernel on their own NUMA node.
+    '''
+    processes = processes or len(allowed_cpus())
+    cpus = plan(processes, policy, nodes) if policy is not None else [None] * processes
+    return [context.Process(target=bootstrap, args=(cpu_set, target, args)) for cpu_set in cpus]
@@ -0,0 +1,234 @@
+import concurrent.futures
+import importlib
+import itertools
+import math
+import multiprocessing.connection
+import threading
+import time
+
+from pymulproc import errors, factory, mpq_protocol, placement, routing
+
+COLLECT_INTERVAL = 0.05  # seconds the result collector sleeps on the results queue before checking whether to stop
+CHUNK_SIZE = 1
+IDLE = -1  # task ID a worker running no task is shown with
+
+
+def chunks(iterable, chunksize):
+    '''Split the iterable into lists of at most 'chunksize' argument tuples - one per item
+    '''
+    iterator = iter(iterable)
+    while True:
+        chunk = [(item, ) for item in itertools.islice(iterator, chunksize)]
+        if not chunk:
+            return
+        yield chunk
+
+
+def work(tasks_factory, results_factory, preload=(), ready=None, registry=None, running=None):
+    '''Loop of each worker process: import the modules to preload and tell the pool it is ready, then run every REQ_DO
+    task fetched from the tasks queue and send back a REQ_FINISHED message with the results - or the exception raised -
+    until a REQ_DIE message arrives. The ID of the task being run is kept in 'running', at the slot the worker
+    registers at, so that the pool can tell which one was lost if the worker dies
+    '''
+    for module in preload:
+        importlib.import_module(module)
+    tasks = tasks_factory.child()
+    results = results_factory.child()
+    slot = registry.register(tasks.pid) if registry else None
+    if ready:
+        ready.release()
+    while True:
+        message = tasks.receive(block=True)
+        if not message:  # The task expired => the pool hears of it through the dead letters
+            continue
+        if message.request == mpq_protocol.REQ_DIE:
+            break
+        task_id, func, items = message.data
+        if slot is not None:
+            running[slot] = task_id
+        try:
+            outcome = (task_id, True, [func(*args) for args in items])
+        except Exception as ex:
+            outcome = (task_id, False, ex)
+        try:
+            results.send(mpq_protocol.REQ_FINISHED, recipient_pid=message.sender_pid, data=outcome)
+        except errors.QueuesCommunicationError:
+            raise
+        except Exception as ex:  # The results - or the exception raised - can not be serialized
+            error = errors.ProtocolError(f"The outcome of task {task_id} can not be sent back: {ex!r}")
+            results.send(mpq_protocol.REQ_FINISHED, recipient_pid=message.sender_pid, data=(task_id, False, error))
+        if slot is not None:
+            running[slot] = IDLE
+
+
+class WorkerPool:
+    '''Pool of 'processes' worker processes - as many as CPUs this process may run on by default - fed through a
+    QUEUE with the tasks and answering through another QUEUE with their results. In routed mode the QUEUEs have room
+    for a mailbox per worker, unless 'max_peers' says otherwise.
+
+    Each task is given an ID that its REQ_FINISHED reply carries back so that it resolves the right future. A
+    background thread collects the replies. 'map' and 'imap_unordered' send the items in chunks of 'chunksize' so that
+    the cost of a round trip is shared among many small tasks. Workers are pinned to CPUs as the 'affinity' policy says
+    - see placement.POLICIES - if given. Any keyword parameter left is passed to both QueueCommunication factories,
+    such as the multiprocessing 'context' workers are started from.
+
+    Workers live as long as the pool, so tasks only pay for a round trip: starting the interpreter, importing modules
+    and creating the peers is paid once per worker, up front. Workers import the 'preload' modules before taking tasks
+    and 'warm_up' waits until they all have. The fork server is left alone: its preload list is process-wide state, so
+    setting it would affect every other user of the 'forkserver' context - call set_forkserver_preload for that.
+
+    Futures of tasks that are lost fail with errors.WorkerPoolError: those of the task a worker was running when it
+    died, and those of every task left once no worker is. With a 'ttl' or a 'backpressure' policy, tasks and results
+    may also be dead-lettered, so the pool reads the 'dead_letters' channel of its QUEUEs - one of its own unless
+    given - and fails their futures too.
+    '''
+
+    def __init__(self, processes=None, affinity=None, preload=(), **kwargs):
+        processes = processes or len(placement.allowed_cpus())
+        if kwargs.get('routed', False) or kwargs.get('distribution', None):
+            kwargs.setdefault('max_peers', processes + 1)  # A mailbox per worker plus the pool's
+        if 'ttl' in kwargs or 'backpressure' in kwargs:
+            kwargs.setdefault('dead_letters', True)
+        self.tasks_factory = factory.QueueCommunication(**kwargs)
+        self.results_factory = factory.QueueCommunication(**kwargs)
+        self.tasks = self.tasks_factory.parent()
+        self.results = self.results_factory.parent()
+        self.futures = {}
+        self.task_ids = itertools.count()
+        context = self.tasks_factory.context
+        self.ready = context.Semaphore(0)
+        self.registry = routing.PeerRegistry(processes, context)
+        self.running = context.Array('q', [IDLE] * processes, lock=False)  # Each worker only writes its own slot
+        self.workers = placement.workers(work, (self.tasks_factory, self.results_factory, tuple(preload), self.ready,
+                                                self.registry, self.running), processes, affinity, context=context)
+        self.warming = len(self.workers)
+        for worker in self.workers:
+            worker.start()
+        self.alive = {worker.sentinel: worker for worker in self.workers}
+        self.closing = threading.Event()
+        self.collector = threading.Thread(target=self.collect, daemon=True)
+        self.collector.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def warm_up(self, timeout=None):
+        '''Wait until every worker is ready to run tasks, for 'timeout' seconds at most. Return whether they all are
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.warming:
+            if not self.ready.acquire(timeout=None if deadline is None else max(0, deadline - time.monotonic())):
+                return False
+            self.warming -= 1
+        return True
+
+    def submit_chunk(self, func, items):
+        '''Send a REQ_DO task running 'func' on every tuple of arguments in 'items' and return the future of the list of
+        results
+        '''
+        if self.closing.is_set():
+            raise RuntimeError('cannot submit tasks to a closed pool')
+        if not self.alive:
+            raise errors.WorkerPoolError('no worker is left to run tasks')
+        task_id = next(self.task_ids)
+        future = self.futures[task_id] = concurrent.futures.Future()
+        self.tasks.send(mpq_protocol.REQ_DO, data=(task_id, func, items))
+        return future
+
+    def submit(self, func, *args):
+        '''Run func(*args) on a worker and return a future of its result
+        '''
+        chunk = self.submit_chunk(func, [args])
+        future = concurrent.futures.Future()
+        chunk.add_done_callback(lambda done: future.set_exception(done.exception()) if done.exception()
+                                else future.set_result(done.result()[0]))
+        return future
+
+    def map(self, func, iterable, chunksize=CHUNK_SIZE):
+        '''Return the list of results of applying func to every item, in order
+        '''
+        futures = [self.submit_chunk(func, chunk) for chunk in chunks(iterable, chunksize)]
+        return [result for future in futures for result in future.result()]
+
+    def imap_unordered(self, func, iterable, chunksize=CHUNK_SIZE):
+        '''Yield the results of applying func to every item as soon as the chunk they are in is done
+        '''
+        futures = [self.submit_chunk(func, chunk) for chunk in chunks(iterable, chunksize)]
+        for future in concurrent.futures.as_completed(futures):
+            yield from future.result()
+
+    def collect(self):
+        '''Resolve the future of each task whose results arrive until the pool is closed and no result is left. Futures
+        of the tasks that are lost fail on the way - see 'bury'
+        '''
+        while True:
+            message = self.results.receive(timeout=COLLECT_INTERVAL)
+            if message:
+                self.resolve(message)
+                continue
+            self.bury()
+            if self.closing.is_set():
+                break
+
+    def resolve(self, message):
+        '''Resolve the future of the task whose results the message carries. Those of tasks deemed lost are dropped
+        '''
+        task_id, succeeded, outcome = message.data
+        future = self.futures.pop(task_id, None)
+        if future is None:
+            return
+        if succeeded:
+            future.set_result(outcome)
+        else:
+            future.set_exception(outcome)
+
+    def fail(self, task_id, reason):
+        '''Fail the future of a task, if still pending, with a WorkerPoolError telling the reason why
+        '''
+        future = self.futures.pop(task_id, None)
+        if future is not None:
+            future.set_exception(errors.WorkerPoolError(f"Task {task_id} was lost: {reason}"))
+
+    def bury(self):
+        '''Fail the futures of the tasks whose message - or results - were dead-lettered and of the tasks the workers
+        that died were running. Once no worker is left, every pending future fails
+        '''
+        for channel in {id(letters): letters for letters in (self.tasks_factory.dead_letters,
+                                                            self.results_factory.dead_letters) if letters}.values():
+            for reason, letter in channel.messages(self.tasks.serializer):
+                batch = letter.data if letter.request == mpq_protocol.REQ_BATCH else None
+                for message in [self.tasks.decode(item) for item in batch] if batch is not None else [letter]:
+                    if message.request in (mpq_protocol.REQ_DO, mpq_protocol.REQ_FINISHED):
+                        self.fail(message.data[0], reason)
+        dead = multiprocessing.connection.wait(list(self.alive), 0) if self.alive else []
+        if not dead:
+            return
+        for message in iter(self.results.receive, False):  # The results they sent before dying still count
+            self.resolve(message)
+        slots = self.registry.slots()
+        for sentinel in dead:
+            worker = self.alive.pop(sentinel)
+            if worker.pid in slots and self.running[slots[worker.pid]] != IDLE:
+                self.fail(self.running[slots[worker.pid]], f"worker {worker.pid} died running it")
+        if not self.alive:
+            for task_id in list(self.futures):
+                self.fail(task_id, 'no worker is left')
+
+    def close(self):
+        '''Ask every worker to die once the tasks already sent are done, wait for them and for the last results
+        '''
+        if self.closing.is_set():
+            return
+        for _ in self.workers:
+            self.tasks.send(mpq_protocol.REQ_DIE, headers={'deadline': math.inf})  # Never expires, whatever the ttl
+        for worker in self.workers:
+            worker.join()
+        self.closing.set()
+        self.collector.join()
+        for conn in self.tasks.queues():  # What workers that died left behind
+            routing.drain(conn)
+        self.tasks.queue_join()
+        self.results.queue_join()
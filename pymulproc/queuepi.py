@@ -1,43 +1,199 @@
 import queue
+import time
 
 from pymulproc import errors
-from pymulproc import mpq_protocol, interfaces
+from pymulproc import backpressure, deadletter, metrics, mpq_protocol, interfaces, routing
 
 QUEUE_PUT_TIMEOUT_OP = 0.1
 NUM_ATTEMPTS = 10
+STARVATION_TURNS = 8  # every such amount of receives, lanes are checked starting from a lower priority one
+STEAL_INTERVAL = 0.005  # seconds an idle worker sleeps on its own queues before trying to steal work again
+REQUEUE_BACKOFF = 0.0001  # seconds a blocking receive first waits after requeuing a message, doubled each time
 
 
 class QueueCommunicationApi(interfaces.CommunicationApiInterface):
     '''Class that implements the CommunicationApi interface for JOINED QUEUE communication between two process in a
         1 to N pattern
+
+    If 'lanes' - a list of JOINED QUEUES ordered by priority, the highest first - is given, each message goes into the
+    lane of its priority and is received before those waiting in lower priority lanes. 'conn' is the last lane.
+
+    If the router has a distribution, peers created with 'worker' as True get a work inbox, while the rest dispatch
+    the messages they send with no recipient into the inboxes of the workers. Idle workers steal work from the inboxes
+    of their siblings.
+
+    A peer finding every slot of the router taken first reclaims those of the processes that are gone. If none is, it
+    goes without a mailbox - or inbox - and gets its messages through the shared queue as in unrouted mode.
     '''
 
     def __init__(self, *args, **kwargs):
-        super().__init__(*args)
+        super().__init__(*args, **kwargs)
         self.timeout = kwargs.get('timeout', QUEUE_PUT_TIMEOUT_OP)
         self.loops = kwargs.get('loops', NUM_ATTEMPTS)
+        self.router = kwargs.get('router', None)
+        self.lanes = kwargs.get('lanes', None) or [self.conn]
+        # Messages sent are handed to the backpressure policy, which decides what to do when the queue is full. The
+        # legacy retry loop is used when none is given and always for requeuing messages that were not for us
+        self.retry = backpressure.Retry(self.timeout, self.loops)
+        self.backpressure = backpressure.get_policy(kwargs.get('backpressure', None)) or self.retry
+        self.watermarks = kwargs.get('watermarks', None)
+        self.mailbox = self.register() if self.router else None
+        self.mailboxes = [self.router.mailbox_of(self.pid, lane) for lane in range(len(self.lanes))] \
+            if self.mailbox else []
+        self.turn = 0  # number of receives so far, used to give lower priority lanes their turn
+        distributed = self.router is not None and self.router.distribution is not None
+        self.inbox = self.router.register_worker(self.pid) if distributed and kwargs.get('worker', False) else None
+        self.dispatcher = routing.Dispatcher(self.router) if distributed and not self.inbox else None
+        self.siblings = routing.Dispatcher(self.router) if self.inbox else None  # whose inboxes work is stolen from
+
+    def register(self):
+        '''Register this process with the router and return its mailbox - None if every slot is taken. When the table
+        is full the slots of the processes that are gone are reclaimed first: what was left in their mailboxes is
+        dead-lettered and the work left in their inboxes goes back to the shared queue
+        '''
+        mailbox = self.router.register(self.pid)
+        if mailbox is None:
+            letters, work = self.router.reclaim()
+            for frame in letters:
+                self.dead_letter(frame, deadletter.DEAD_RECIPIENT)
+            for frame in work:
+                self.put(self.lanes[-1], frame)
+            mailbox = self.router.register(self.pid)
+        return mailbox
+
+    def route(self, recipient_pid, lane=-1):
+        '''Return the queue a message addressed to recipient_pid should be put into: the recipient's own mailbox when
+        the factory works in routed mode and the recipient is registered, the shared queue otherwise - both in the
+        given priority lane. Messages with no recipient go into the inbox of a worker if there is any to dispatch to.
+        Inboxes have a single lane, so those of a higher priority lane go through the shared queue, which workers check
+        first
+        '''
+        if self.router:
+            dispatched = recipient_pid is None and self.dispatcher and lane % len(self.lanes) == len(self.lanes) - 1
+            mailbox = self.dispatcher.pick() if dispatched else self.router.mailbox_of(recipient_pid, lane)
+            if mailbox:
+                return mailbox
+        return self.lanes[lane]
 
-    def send(self, request, sender_pid=None, recipient_pid=None, data=None):
+    def lane_of(self, request, priority=None):
+        '''Return the lane of a message given its priority, 0 being the highest. With no priority, control requests go
+        into the first lane and any other into the last one
+        '''
+        if priority is None:
+            return 0 if request in mpq_protocol.CONTROL_REQUESTS else len(self.lanes) - 1
+        return min(priority, len(self.lanes) - 1)
+
+    @metrics.timed('send_latency')
+    def send(self, request, sender_pid=None, recipient_pid=None, data=None, priority=None, headers=None):
         '''sends a message down the JOINED QUEUE
 
-        it will try to put a message into the QUEUE for a few attempts before raising an exception
+        it will try to put a message into the QUEUE for a few attempts before raising an exception - unless a
+        different 'backpressure' policy was given to the peer. In routed mode the message goes straight into the
+        mailbox of the recipient process if this one is registered. With priority lanes, messages that do not go into
+        the last lane are never batched so that they are not held back.
         '''
 
-        message = [request, self.pid if not sender_pid else sender_pid, recipient_pid, data]
-        stop = False
-        loops = self.loops
-        while not stop:
-            try:
-                self.conn.put(message, timeout=self.timeout)
-            except queue.Full as ex:
-                loops -= 1
-                if not loops:
-                    raise errors.QueuesCommunicationError(f"Process {self.pid} tried unsuccessfully to put the "
-                                                          f"following {message} in the queue") from ex
-            else:
-                stop = True
+        message = self.build_message(request, sender_pid, recipient_pid, data, headers)
+        lane = self.lane_of(request, priority)
+        if self.batch_size > 1 and lane == len(self.lanes) - 1:
+            return self.buffer(message)
+        self.put(self.route(recipient_pid, lane), self.encode(message))
         return message
 
+    def try_send(self, request, sender_pid=None, recipient_pid=None, data=None, priority=None, headers=None):
+        '''sends a message down the JOINED QUEUE only if there is room for it straight away, bypassing both batching
+        and the backpressure policy. Messages waiting in the outbox are flushed first so that order is kept. Return
+        backpressure.SEND_OK or backpressure.SEND_FULL
+        '''
+
+        if self.outbox:  # Messages buffered before go first
+            self.flush()
+        message = self.build_message(request, sender_pid, recipient_pid, data, headers)
+        conn = self.route(recipient_pid, self.lane_of(request, priority))
+        frame = self.encode(message)
+        status = backpressure.try_put(conn, frame)
+        self.sent(conn, frame, 1 if status == backpressure.SEND_OK else 0)
+        return status
+
+    def send_many(self, messages):
+        '''puts the messages in the JOINED QUEUE coalescing into a single frame all of those going to the same queue -
+        in routed mode each recipient with a mailbox gets its own frame and so does each priority lane
+        '''
+        messages = [self.as_message(message) for message in messages]
+        for conn, frame, count in self.coalesce(messages):
+            self.put(conn, frame, count)
+        return messages
+
+    def coalesce(self, messages):
+        '''Return the frames the messages travel in as (QUEUE, frame, amount of messages carried) tuples, with a single
+        frame per QUEUE
+        '''
+        frames = {}
+        for message in messages:
+            conn = self.route(message.recipient_pid, self.lane_of(message.request))
+            frames.setdefault(id(conn), (conn, []))[1].append(self.encode(message))
+        return [(conn, batch[0] if len(batch) == 1 else self.encode(self.build_batch(batch)), len(batch))
+                for conn, batch in frames.values()]
+
+    def subscribe(self, topic):
+        '''Subscribe this process to a topic so that every message published on it is delivered to its mailbox
+        '''
+        self.topics().subscribe(self.pid, topic)
+
+    def unsubscribe(self, topic):
+        '''Stop getting the messages published on a topic
+        '''
+        self.topics().unsubscribe(self.pid, topic)
+
+    def publish(self, topic, data=None):
+        '''sends a REQ_PUBLISH message carrying the data and the topic to every process subscribed to the topic. The
+        message is encoded once and a copy of its frame is put straight into the mailbox of each subscriber, so that
+        no other process has to fetch it. Return the number of subscribers
+        '''
+        mailboxes = self.topics().subscribers(topic)
+        frame = self.encode(mpq_protocol.Message(mpq_protocol.REQ_PUBLISH, self.pid, None, data, {'topic': topic}),
+                            broadcast=len(mailboxes) > 1)
+        for mailbox in mailboxes:
+            self.put(mailbox, frame)
+        return len(mailboxes)
+
+    def topics(self):
+        '''Return the router keeping the subscriptions, which only exists in routed mode
+        '''
+        if not self.router:
+            raise errors.QueuesCommunicationError("Topics are only supported by QUEUE peers in routed mode")
+        return self.router
+
+    def put(self, conn, frame, messages=1):
+        '''puts a frame carrying the given amount of messages into the given QUEUE as the backpressure policy of the
+        peer dictates. Return the status of the operation
+        '''
+        status = self.backpressure.put(self, conn, frame)
+        self.sent(conn, frame, messages if status == backpressure.SEND_OK else 0)
+        return status
+
+    def sent(self, conn, frame, messages):
+        '''Update metrics and check the watermarks once a frame carrying the given amount of messages - if any made it -
+        has been put into the QUEUE
+        '''
+        if self.metrics and messages:
+            self.metrics.sent(messages, len(frame))
+            if self.metrics.depth_due():
+                try:
+                    self.metrics.observe('queue_depth', conn.qsize())
+                except NotImplementedError:
+                    pass
+        if self.watermarks:
+            self.watermarks.check(self, conn)
+
+    def fetched(self, conn):
+        '''Check the low watermark once a frame has been taken out of the QUEUE, so that it is noticed as soon as the
+        QUEUE drains rather than on the next put
+        '''
+        if self.watermarks:
+            self.watermarks.check(self, conn, filling=False)
+
+    @metrics.timed('receive_latency')
     def receive(self, **kwargs):
         '''High Order function that checks if a message is ready to be fetched from a JOINED QUEUE and if it is whether
         is for the process doing the enquiry or not.
@@ -47,39 +203,209 @@ class QueueCommunicationApi(interfaces.CommunicationApiInterface):
         2) If by contrary a 'func' parameter is associated to a function, such function is applied to the message
         at the front of the queue and if the result is True the the process will fetch the message from the queue.
         Otherwise it will reinsert the message at the back of it.
+
+        In routed mode the own mailbox of the process is checked first. Messages found there were addressed to this
+        process so they are returned without applying 'func'. The shared queue and its requeue behaviour described
+        above are only used as a fallback when the mailbox is empty.
+
+        With priority lanes, lanes are checked in order of priority - mailbox first and shared queue next within each
+        lane. Every few receives the check starts from a lower priority lane so that bulk traffic is never starved.
+
+        Workers check their work inbox after that, and steal from their siblings when it is empty. Work is not subject
+        to 'func' either.
+
+        If 'block' is passed as True the process sleeps until a message is ready, or for 'timeout' seconds at most if
+        such parameter is also provided. Passing 'timeout' alone implies blocking. A blocking receive goes on waiting
+        after requeuing a message that does not meet 'func', backing off a little longer each time, until one that does
+        arrives or the timeout expires.
+        '''
+
+        if self.outbox:  # Async peers flush - a coroutine - before getting here
+            self.flush()
+        if self.pending:
+            return self.pending.popleft()
+
+        block = kwargs.get('block', 'timeout' in kwargs)
+        timeout = kwargs.get('timeout', None)
+        func = kwargs.get('func', lambda x: True)
+        if not self.mailbox and len(self.lanes) == 1:
+            return self._receive_shared(block, timeout, func)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = 0
+        while True:
+            requeued = False
+            for lane in self.lane_order():
+                if self.mailboxes:
+                    frame = routing.get_nowait(self.mailboxes[lane])
+                    if frame:
+                        self.mailboxes[lane].task_done()
+                        self.fetched(self.mailboxes[lane])
+                        return self.unpack(frame)
+                frame = routing.get_nowait(self.lanes[lane])
+                if frame:
+                    message = self._filter(frame, func, lane)
+                    if message or not block:
+                        return message
+                    requeued = True
+                    break
+            if self.inbox:
+                message = self.take_work()
+                if message:
+                    return message
+            # Nothing for us yet => when blocking, sleep until something lands either in our mailbox or in the shared
+            # queue. Another process may fetch the shared message first, in which case we go back to sleep. Workers
+            # wake up every now and then to look for work to steal
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not block or remaining == 0:
+                return False
+            if requeued:
+                delay = self.back_off(delay, remaining)
+            elif self.inbox:
+                routing.wait_readable(self.mailboxes + self.lanes + [self.inbox],
+                                      STEAL_INTERVAL if remaining is None else min(STEAL_INTERVAL, remaining))
+            elif not routing.wait_readable(self.mailboxes + self.lanes, remaining):
+                return False
+
+    def take_work(self):
+        '''Fetch the next piece of work from our own inbox or, if empty, from the inbox of a sibling that has any. Each
+        time siblings are checked starting from a different one so that thieves do not all go after the same
+        '''
+        siblings = [inbox for inbox in self.siblings.workers() if inbox is not self.inbox]
+        offset = self.turn % len(siblings) if siblings else 0
+        for inbox in [self.inbox] + siblings[offset:] + siblings[:offset]:
+            frame = routing.get_nowait(inbox)
+            if frame:
+                inbox.task_done()
+                self.fetched(inbox)
+                if inbox is not self.inbox and self.metrics:
+                    self.metrics.count('stolen')
+                return self.unpack(frame)
+        return False
+
+    def lane_order(self):
+        '''Return the order in which lanes are checked in this turn: by priority, except every STARVATION_TURNS turns,
+        when a different lane goes first each time
+        '''
+        self.turn += 1
+        if len(self.lanes) == 1 or self.turn % STARVATION_TURNS:
+            return range(len(self.lanes))
+        first = self.turn // STARVATION_TURNS % len(self.lanes)
+        return [(first + offset) % len(self.lanes) for offset in range(len(self.lanes))]
+
+    def back_off(self, delay, remaining):
+        '''Wait after requeuing a message that was not for us rather than fetching it straight back, as the shared
+        queue may hold nothing but messages for others. Each time the wait doubles, from REQUEUE_BACKOFF up to
+        STEAL_INTERVAL, and it ends early if something lands in our own queues. Return the wait done
         '''
+        delay = min(max(2 * delay, REQUEUE_BACKOFF), STEAL_INTERVAL)
+        timeout = delay if remaining is None else min(delay, remaining)
+        own = self.mailboxes + ([self.inbox] if self.inbox else [])
+        if own:
+            routing.wait_readable(own, timeout)
+        else:
+            time.sleep(timeout)
+        return delay
 
-        try:
-            message = self.conn.get(block=kwargs.get('block', False))
-        except queue.Empty:  # Is the queue empty?...
+    def _receive_shared(self, block, timeout, func):
+        '''Fetch the message at the front of the shared queue and requeue it if it does not meet 'func' criteria. When
+        blocking, go on until a message that does arrives or the timeout expires
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = 0
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                frame = self.conn.get(block=block, timeout=remaining)
+            except queue.Empty:  # Is the queue empty?...
+                return False
+            message = self._filter(frame, func)
+            if message or not block:
+                return message
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if remaining == 0:
+                return False
+            delay = self.back_off(delay, remaining)
+
+    def _filter(self, frame, func, lane=-1):
+        '''Check if the message fetched from the shared queue - the given lane of it - meets the criteria of the
+        function passed as parameter and requeue it otherwise. Messages that expired are dead-lettered instead, whoever
+        they were for.
+
+        The function is given a view of the message: its data is only deserialized once accepted - or if the function
+        looks at it - and rejected messages are requeued as the very same frame they arrived in
+        '''
+
+        if self.expire(frame):
+            self.lanes[lane].task_done()
+            self.fetched(self.lanes[lane])
+            return False
+        message = self.view(frame)
+        if message.request == mpq_protocol.REQ_BATCH:
+            # Each message in a batch frame is checked on its own. Those that are not for us are requeued one by one
+            for item in message.data:
+                if self.expire(item):
+                    continue
+                item_message = self.view(item)
+                if func(item_message):
+                    self.pending.append(self.load(item_message.message()))
+                    if self.metrics:
+                        self.metrics.received(1, len(item))
+                else:
+                    self.requeue(item_message, item, lane)
+            message = self.pending.popleft() if self.pending else False
+        elif func(message):
+            message = self.load(message.message())
+            if self.metrics:
+                self.metrics.received(1, len(frame))
+        else:
+            self.requeue(message, frame, lane)  # We put the message again back into the queue as it was not for us
             message = False
-        else:  # ... Otherwise check if this message meets the criteria of the function passed as parameter
-            func = kwargs.get('func', lambda x: True)
-            if not func(message):
-                args = [message[mpq_protocol.S_PID_OFFSET - 1]]
-                # As the message isn't for us
-                kwargs = {
-                    'sender_pid': message[mpq_protocol.S_PID_OFFSET],
-                    'recipient_pid': message[mpq_protocol.S_PID_OFFSET + 1]
-                }
-                if len(message) == 4:
-                    kwargs['data'] = message[mpq_protocol.S_PID_OFFSET + 2]
-                self.send(*args, **kwargs)  # We put the message again back into the queue as it was not for us
-                message = False
-            # conn.get() did actually remove a message from the queue needs to be aware of such removal
-            self.conn.task_done()
+        # conn.get() did actually remove a message from the queue needs to be aware of such removal
+        self.lanes[lane].task_done()
+        self.fetched(self.lanes[lane])
 
         return message
 
+    def requeue(self, message, frame, lane=-1):
+        '''Put back a message that was not for us, as the very same frame it arrived in and into the same lane, so that
+        its recipient can fetch it later on
+        '''
+        conn = self.route(message.recipient_pid, lane)
+        self.retry.put(self, conn, frame)
+        if self.metrics:
+            self.metrics.count('requeued')
+        if self.watermarks:
+            self.watermarks.check(self, conn)
+
+    def many_receivers(self):
+        '''Any process sharing the QUEUE may take a message with no recipient
+        '''
+        return True
+
+    def readers(self):
+        '''Return the reading ends of the mailboxes, in routed mode, and of the shared queue - of every lane
+        '''
+        return [conn._reader for conn in self.mailboxes + self.lanes + ([self.inbox] if self.inbox else [])]
+
+    def queues(self):
+        '''Return all queues this peer can reach: the shared queue followed by every mailbox in routed mode - of every
+        lane
+        '''
+        return self.lanes + ([mailbox for lane in self.router.lanes for mailbox in lane] + self.router.inboxes
+                             if self.router else [])
+
     def queue_empty(self):
-        '''Wrapper method for the queue.emtpy() that check if the queue is empty
+        '''Wrapper method for the queue.emtpy() that check if the queue is empty - and all mailboxes in routed mode
         '''
-        return self.conn.empty()
+        return all(conn.empty() for conn in self.queues())
 
     def queue_join(self):
-        '''Wrapper method for the queue.join() that wait until all tasks have been done
+        '''Wrapper method for the queue.join() that wait until all tasks have been done - and all mailboxes in routed
+        mode
         '''
-        self.conn.join()
+        for conn in self.queues():
+            conn.join()
 
 
 class Parent(QueueCommunicationApi):
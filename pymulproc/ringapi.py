@@ -0,0 +1,40 @@
+from pymulproc import mpq_protocol, pipeapi, streams
+
+
+class RingBufferCommunicationApi(pipeapi.PipeCommunicationApi):
+    '''Class that implements the CommunicationApi interface over a pair of shared memory rings. It behaves as the PIPE
+    communication it is built upon, with the connection replaced by a RingConnection
+    '''
+
+    def read(self, conn):
+        '''Records are copied out of the ring as they are read, so there is no buffer to read them into
+        '''
+        return conn.recv_bytes()
+
+    def readers(self):
+        '''The bell of the inbound ring becomes readable once a record is ready, and is only rung once armed here
+        '''
+        return [self.conn.inbound.waitable()]
+
+    def max_chunk_size(self):
+        '''A chunk must fit in a record of the outbound ring along with the rest of its message
+        '''
+        return self.conn.outbound.max_record() - streams.ENVELOPE
+
+
+class Parent(RingBufferCommunicationApi):
+    '''Class that will instantiate the parent process' peer - It's ring buffer communication end
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.peer = mpq_protocol.PARENT_COMM_INTERFACE
+
+
+class Child(RingBufferCommunicationApi):
+    '''Class that will instantiate the child process' peer - It's ring buffer communication end
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.peer = mpq_protocol.CHILD_COMM_INTERFACE
@@ -0,0 +1,186 @@
+import multiprocessing
+import struct
+import time
+
+from pymulproc import errors
+
+DEFAULT_CAPACITY = 1024 * 1024  # bytes of each ring
+
+RECORD_HEADER = struct.Struct('<I')  # length of the record that follows
+WRAP_MARKER = 0xFFFFFFFF  # written instead of a length when the next record starts back at the beginning of the ring
+
+# Offsets in the shared counters array. Head and tail live in different cache lines so that producer and consumer do
+# not keep invalidating each other's cache
+HEAD = 0  # bytes ever read
+TAIL = 8  # bytes ever written
+PRODUCER_WAITING = 16  # set while a producer is sleeping until the consumer frees some space
+READER_WAITING = 17  # set while the consumer waits on the bell of the ring - see 'RingBuffer.waitable'
+COUNTERS = 24
+
+
+class RingBuffer:
+    '''Single consumer ring of variable length records living in shared memory.
+
+    Records are written and read with a plain memory copy. A record, header included, may take half the ring at most:
+    the space left at the end of the ring when a record does not fit there is wasted, and such limit guarantees that
+    the record always fits once the consumer has caught up. The only kernel round trips are a semaphore release per
+    record written - to wake up the consumer - and, only when the ring is full, a semaphore the producer sleeps on
+    until the consumer frees enough space. If 'multi_producer' is passed as True producers serialize their writes
+    through a lock, otherwise a single producer is assumed.
+
+    Both ends update the head or tail and check whether the other end is waiting under 'guard', so that neither can
+    go to sleep right after the other end has looked. For multiprocessing.connection.wait the ring also has a bell: a
+    PIPE the producer only writes into after the consumer armed it - see 'waitable'.
+    '''
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, multi_producer=False, context=multiprocessing):
+        self.capacity = capacity
+        self.storage = context.RawArray('B', capacity)
+        self.counters = context.RawArray('Q', COUNTERS)
+        self.items = context.Semaphore(0)
+        self.space = context.Semaphore(0)
+        self.lock = context.Lock() if multi_producer else None
+        self.guard = context.Lock()
+        self.bell, self.ring_bell = context.Pipe(duplex=False)
+        self.buf = memoryview(self.storage).cast('B')
+
+    def max_record(self):
+        '''Return the largest record the ring takes, in bytes
+        '''
+        return self.capacity // 2 - RECORD_HEADER.size
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['buf']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.buf = memoryview(self.storage).cast('B')
+
+    def put(self, data, timeout=None):
+        '''Write a record. If the ring is full wait for the consumer to free enough space for 'timeout' seconds at
+        most, after which an exception is thrown. None means waiting for ever
+        '''
+        size = RECORD_HEADER.size + len(data)
+        if len(data) > self.max_record():
+            raise errors.RingBufferCommunicationError(f"A record of {len(data)} bytes is larger than half a ring of "
+                                                      f"{self.capacity} bytes")
+        if self.lock:
+            if not self.lock.acquire(True, timeout):
+                raise errors.RingBufferCommunicationError("Timed out waiting for other producers to write")
+            try:
+                self._put(data, size, timeout)
+            finally:
+                self.lock.release()
+        else:
+            self._put(data, size, timeout)
+
+    def _put(self, data, size, timeout):
+        counters = self.counters
+        deadline = None if timeout is None else time.monotonic() + timeout
+        tail = counters[TAIL]
+        while True:
+            position = tail % self.capacity
+            contiguous = self.capacity - position
+            # If the record does not fit before the end of the ring, the space left there is wasted
+            needed = size if contiguous >= size else contiguous + size
+            if needed <= self.capacity - (tail - counters[HEAD]):
+                break
+            with self.guard:  # The consumer either moved on already or will see the flag
+                full = needed > self.capacity - (tail - counters[HEAD])
+                counters[PRODUCER_WAITING] = int(full)
+            if not full:
+                continue
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not self.space.acquire(True, remaining):
+                raise errors.RingBufferCommunicationError(f"Ring of {self.capacity} bytes remained full for "
+                                                          f"{timeout} seconds")
+
+        if contiguous < size:
+            if contiguous >= RECORD_HEADER.size:
+                RECORD_HEADER.pack_into(self.buf, position, WRAP_MARKER)
+            tail += contiguous
+            position = 0
+        RECORD_HEADER.pack_into(self.buf, position, len(data))
+        start = position + RECORD_HEADER.size
+        self.buf[start:start + len(data)] = data
+        with self.guard:
+            counters[TAIL] = tail + size
+            reader_waiting, counters[READER_WAITING] = counters[READER_WAITING], 0
+        self.items.release()
+        if reader_waiting:
+            self.ring_bell.send_bytes(b'')
+
+    def get(self):
+        '''Read the oldest record. The caller must have acquired 'items' beforehand, which guarantees that such record
+        has been fully written
+        '''
+        counters = self.counters
+        head = counters[HEAD]
+        position = head % self.capacity
+        contiguous = self.capacity - position
+        if contiguous < RECORD_HEADER.size or RECORD_HEADER.unpack_from(self.buf, position)[0] == WRAP_MARKER:
+            head += contiguous
+            position = 0
+        length = RECORD_HEADER.unpack_from(self.buf, position)[0]
+        start = position + RECORD_HEADER.size
+        data = bytes(self.buf[start:start + length])
+        with self.guard:
+            counters[HEAD] = head + RECORD_HEADER.size + length
+            producer_waiting, counters[PRODUCER_WAITING] = counters[PRODUCER_WAITING], 0
+        if producer_waiting:
+            self.space.release()
+        return data
+
+    def waitable(self):
+        '''Return the bell of the ring armed, so that it becomes readable once there is a record to be read. Only the
+        consumer should call it, right before waiting on the bell
+        '''
+        while self.bell.poll():
+            self.bell.recv_bytes()
+        with self.guard:
+            ready = self.counters[TAIL] != self.counters[HEAD]
+            self.counters[READER_WAITING] = int(not ready)
+        if ready:
+            self.ring_bell.send_bytes(b'')
+        return self.bell
+
+
+class RingConnection:
+    '''One end of a duplex channel made of two rings, offering the subset of multiprocessing.connection.Connection
+    used by the PIPE-based peers
+    '''
+
+    def __init__(self, inbound, outbound, timeout=None):
+        self.inbound = inbound
+        self.outbound = outbound
+        self.timeout = timeout
+        self.ready = False  # whether a record signalled by 'poll' is still to be read
+
+    def send_bytes(self, data):
+        self.outbound.put(data, self.timeout)
+
+    def poll(self, timeout=0.0):
+        '''Return whether there is a record to be read, waiting for it for 'timeout' seconds at most. None means
+        waiting for ever
+        '''
+        if not self.ready:
+            self.ready = self.inbound.items.acquire(True, timeout)
+        return self.ready
+
+    def recv_bytes(self):
+        '''Read a record waiting for it if none is ready
+        '''
+        if not self.ready:
+            self.inbound.items.acquire()
+        self.ready = False
+        return self.inbound.get()
+
+
+def RingPipe(capacity=DEFAULT_CAPACITY, multi_producer=False, timeout=None, context=multiprocessing):
+    '''Return a pair of connected RingConnection objects as multiprocessing.Pipe() does. 'multi_producer' applies to
+    the ring the second end writes into, so that many processes can share such end to talk to the first one
+    '''
+    to_first, to_second = RingBuffer(capacity, multi_producer, context), RingBuffer(capacity, context=context)
+    return RingConnection(to_first, to_second, timeout), RingConnection(to_second, to_first, timeout)
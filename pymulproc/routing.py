@@ -0,0 +1,317 @@
+import hashlib
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+
+from pymulproc import errors, placement
+
+EMPTY_SLOT = 0
+
+ROUND_ROBIN = 'round_robin'  # work is dispatched to each worker in turn
+LEAST_LOADED = 'least_loaded'  # work is dispatched to the worker with fewer messages waiting in its inbox
+DISTRIBUTIONS = (ROUND_ROBIN, LEAST_LOADED)
+WORKERS_REFRESH = 64  # the list of workers is read again from the shared table once every such amount of lookups
+MAX_SUBSCRIPTIONS = 32  # topics each peer can be subscribed to at once
+NO_TOPIC = 0
+
+
+class PeerRegistry:
+    '''Table living in shared memory that maps the PID of every registered peer to the slot it was given. The slot
+    is the index each peer uses to find its own inbound channel.
+    '''
+
+    def __init__(self, max_peers, context=multiprocessing):
+        self.pids = context.Array('i', max_peers)
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.pids)
+
+    def register(self, pid):
+        '''Claim a slot for the given PID. Registering the same PID twice returns the slot claimed the first time
+        '''
+        with self.pids.get_lock():
+            table = self.pids.get_obj()
+            if pid in table:
+                slot = list(table).index(pid)
+            else:
+                try:
+                    slot = list(table).index(EMPTY_SLOT)
+                except ValueError as ex:
+                    raise errors.QueuesCommunicationError(f"Process {pid} could not be registered as all "
+                                                          f"{len(table)} slots are taken") from ex
+                table[slot] = pid
+        self._cache[pid] = slot
+        return slot
+
+    def replace(self, old_pid, new_pid):
+        '''Give the slot of a PID to another one - a process taking over from a dead one. Return the slot or None if
+        the old PID was not registered
+        '''
+        with self.pids.get_lock():
+            table = self.pids.get_obj()
+            if old_pid not in table:
+                return None
+            slot = list(table).index(old_pid)
+            table[slot] = new_pid
+        self._cache.pop(old_pid, None)
+        self._cache[new_pid] = slot
+        return slot
+
+    def unregister(self, pid):
+        '''Free the slot of a PID so that other process can claim it. Return the slot or None if the PID was not
+        registered
+        '''
+        with self.pids.get_lock():
+            table = self.pids.get_obj()
+            if pid not in table:
+                return None
+            slot = list(table).index(pid)
+            table[slot] = EMPTY_SLOT
+        self._cache.pop(pid, None)
+        return slot
+
+    def slot_of(self, pid):
+        '''Return the slot of a registered PID or None if the PID has not been registered
+
+        Slots are cached locally so that only the first lookup for a given PID touches the shared table
+        '''
+        try:
+            return self._cache[pid]
+        except KeyError:
+            pass
+        self._cache = self.slots()
+        return self._cache.get(pid)
+
+    def slots(self):
+        '''Return the slot of every registered PID
+        '''
+        with self.pids.get_lock():
+            table = list(self.pids.get_obj())
+        return {pid: slot for slot, pid in enumerate(table) if pid != EMPTY_SLOT}
+
+    def dead(self):
+        '''Return the registered PIDs whose process is gone
+        '''
+        return [pid for pid in self.slots() if not is_alive(pid)]
+
+
+class MailboxRouter:
+    '''Give each registered peer its own inbound JOINED QUEUE so that a message addressed to a PID is put straight
+    into the recipient's mailbox instead of circulating through the shared queue until the right process fetches it.
+
+    With more than one priority lane each peer gets a mailbox per lane, the first one being the highest priority one.
+    'mailboxes' are those of the last lane, where messages with no particular priority go.
+
+    If a 'distribution' - ROUND_ROBIN or LEAST_LOADED - is given, peers may also register as workers, getting a work
+    inbox each. Messages with no recipient are then dispatched into the inboxes rather than into the shared queue.
+
+    Every mailbox and inbox is created up front, so that children inherit them, and each one holds a PIPE. 'max_peers'
+    should hence be the number of processes that are going to talk at once - as many as CPUs this process may run on
+    plus the parent by default. Slots of processes that are gone are reclaimed when the table fills up, and processes
+    finding it full anyway get their messages through the shared queue.
+    '''
+
+    def __init__(self, max_peers=None, max_size=0, lanes=1, distribution=None, context=multiprocessing):
+        if distribution is not None and distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution {distribution!r}. Choose among {DISTRIBUTIONS}")
+        max_peers = max_peers or default_max_peers()
+        self.registry = PeerRegistry(max_peers, context)
+        self.lanes = [[context.JoinableQueue(max_size) for _ in range(max_peers)] for _ in range(lanes)]
+        self.mailboxes = self.lanes[-1]
+        self.distribution = distribution
+        self.workers = PeerRegistry(max_peers, context) if distribution else None
+        self.inboxes = [context.JoinableQueue(max_size) for _ in range(max_peers)] if distribution else []
+        # Row of topic keys each peer is subscribed to, one row per slot
+        self.subscriptions = context.Array('q', max_peers * MAX_SUBSCRIPTIONS)
+
+    def register(self, pid):
+        '''Register a PID and return the mailbox the process should read from, or None if every slot is taken
+        '''
+        try:
+            return self.mailboxes[self.registry.register(pid)]
+        except errors.QueuesCommunicationError:
+            return None
+
+    def reclaim(self):
+        '''Free the slots of the registered processes that are gone. Return the frames left in their mailboxes and
+        those left in their work inboxes, as two lists
+        '''
+        letters, work = [], []
+        for pid in self.registry.dead():
+            mailboxes, inbox = self.unregister(pid)
+            for mailbox in mailboxes:
+                letters.extend(drain(mailbox))
+            work.extend(drain(inbox) if inbox else [])
+        return letters, work
+
+    def unregister(self, pid):
+        '''Free the slot of a PID, dropping its subscriptions. Return the mailboxes of the PID - one per lane - and its
+        work inbox, if any, so that whatever is left in them can be dealt with
+        '''
+        slot = self.registry.unregister(pid)
+        if slot is None:
+            return [], None
+        with self.subscriptions.get_lock():
+            table = self.subscriptions.get_obj()
+            for index in range(slot * MAX_SUBSCRIPTIONS, (slot + 1) * MAX_SUBSCRIPTIONS):
+                table[index] = NO_TOPIC
+        worker_slot = self.workers.unregister(pid) if self.workers else None
+        return [lane[slot] for lane in self.lanes], None if worker_slot is None else self.inboxes[worker_slot]
+
+    def mailbox_of(self, pid, lane=-1):
+        '''Return the mailbox of the process identified by pid in the given lane or None if such process has not been
+        registered
+        '''
+        if pid is None:
+            return None
+        slot = self.registry.slot_of(pid)
+        return None if slot is None else self.lanes[lane][slot]
+
+    def subscribe(self, pid, topic):
+        '''Subscribe the registered PID to a topic. Subscribing twice to the same topic has no effect
+        '''
+        slot, key = self.registry.slot_of(pid), topic_key(topic)
+        if slot is None:
+            raise errors.QueuesCommunicationError(f"Process {pid} can not subscribe to topics as it has no mailbox")
+        with self.subscriptions.get_lock():
+            row = self.subscriptions.get_obj()[slot * MAX_SUBSCRIPTIONS:(slot + 1) * MAX_SUBSCRIPTIONS]
+            if key in row:
+                return
+            try:
+                column = row.index(NO_TOPIC)
+            except ValueError as ex:
+                raise errors.QueuesCommunicationError(f"Process {pid} is already subscribed to {MAX_SUBSCRIPTIONS} "
+                                                      f"topics") from ex
+            self.subscriptions.get_obj()[slot * MAX_SUBSCRIPTIONS + column] = key
+
+    def unsubscribe(self, pid, topic):
+        '''Unsubscribe the registered PID from a topic
+        '''
+        slot, key = self.registry.slot_of(pid), topic_key(topic)
+        if slot is None:
+            return
+        with self.subscriptions.get_lock():
+            table = self.subscriptions.get_obj()
+            for index in range(slot * MAX_SUBSCRIPTIONS, (slot + 1) * MAX_SUBSCRIPTIONS):
+                if table[index] == key:
+                    table[index] = NO_TOPIC
+
+    def subscribers(self, topic):
+        '''Return the mailboxes of all peers subscribed to a topic
+        '''
+        key = topic_key(topic)
+        with self.subscriptions.get_lock():
+            table = self.subscriptions.get_obj()[:]
+        return [self.mailboxes[index // MAX_SUBSCRIPTIONS] for index, value in enumerate(table) if value == key]
+
+    def register_worker(self, pid):
+        '''Register a PID as a worker and return its work inbox, or None if every slot is taken
+        '''
+        try:
+            return self.inboxes[self.workers.register(pid)]
+        except errors.QueuesCommunicationError:
+            return None
+
+    def worker_inboxes(self):
+        '''Return the work inboxes of all registered workers
+        '''
+        return [self.inboxes[slot] for slot in sorted(self.workers.slots().values())]
+
+
+class Dispatcher:
+    '''Pick the work inbox each message with no recipient is put into, as the distribution of the router dictates.
+    The list of workers is cached and refreshed every WORKERS_REFRESH picks
+    '''
+
+    def __init__(self, router):
+        self.router = router
+        self.inboxes = []
+        self.picks = 0
+
+    def workers(self):
+        '''Return the inboxes of the workers, reading them again from the shared table every now and then
+        '''
+        if not self.inboxes or not self.picks % WORKERS_REFRESH:
+            self.inboxes = self.router.worker_inboxes()
+        self.picks += 1
+        return self.inboxes
+
+    def pick(self):
+        '''Return the inbox the next piece of work should go to, or None if no worker has registered yet
+        '''
+        inboxes = self.workers()
+        if not inboxes:
+            return None
+        offset = self.picks % len(inboxes)
+        if self.router.distribution == LEAST_LOADED:
+            # Ties are broken in turns so that idle workers do not all wait behind the first one
+            try:
+                return min(inboxes[offset:] + inboxes[:offset], key=lambda inbox: inbox.qsize())
+            except NotImplementedError:  # macOS => round robin
+                pass
+        return inboxes[offset]
+
+
+def default_max_peers():
+    '''Return the number of peers routing tables have room for by default: one per CPU this process may run on plus
+    the parent
+    '''
+    return len(placement.allowed_cpus()) + 1
+
+
+def is_alive(pid):
+    '''Return whether the process with the given PID still runs. Processes that exited but have not been waited for
+    yet count as gone. Only known on POSIX systems: elsewhere every process is deemed alive
+    '''
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # It exists but belongs to someone else
+        return True
+    try:
+        with open(f'/proc/{pid}/stat') as stat:
+            return stat.read().rpartition(')')[2].split()[0] != 'Z'
+    except (OSError, IndexError):  # No procfs => zombies can not be told apart
+        return True
+
+
+def topic_key(topic):
+    '''Return the 64 bits key a topic is stored as in the subscription table. The chances of two topics getting the
+    same key are negligible
+    '''
+    key = int.from_bytes(hashlib.blake2b(topic.encode(), digest_size=8).digest(), 'big', signed=True)
+    return key or 1  # 0 stands for an empty entry
+
+
+def get_nowait(conn):
+    '''Fetch the message at the front of the queue without blocking. False is returned if the queue is empty
+    '''
+    try:
+        return conn.get(block=False)
+    except queue.Empty:
+        return False
+
+
+def drain(conn):
+    '''Fetch every frame waiting in a queue without blocking
+    '''
+    frames = []
+    frame = get_nowait(conn)
+    while frame:
+        conn.task_done()
+        frames.append(frame)
+        frame = get_nowait(conn)
+    return frames
+
+
+def wait_readable(queues, timeout=None):
+    '''Block until at least one of the queues has a message ready to be fetched or the timeout expires. The queues
+    that are ready are returned
+    '''
+    readers = {q._reader: q for q in queues}
+    return [readers[reader] for reader in multiprocessing.connection.wait(list(readers), timeout)]
@@ -0,0 +1,140 @@
+import collections
+import concurrent.futures
+import itertools
+import time
+
+from pymulproc import mpq_protocol
+
+POLL_INTERVAL = 0.05  # max seconds a blocked call sleeps on the peer before checking the deadlines of the others
+
+
+class Future(concurrent.futures.Future):
+    '''Future of a call. Waiting for its result receives on the peer of the client that made the call, so that no
+    background thread is needed: replies to other calls arriving in the meantime resolve their own futures
+    '''
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    def result(self, timeout=None):
+        self.client.wait_for(self, timeout)
+        return super().result(0)
+
+    def exception(self, timeout=None):
+        self.client.wait_for(self, timeout)
+        return super().exception(0)
+
+
+class Client:
+    '''Make calls to a process serving them - see 'serve' - through any peer, matching each reply with its call by
+    the 'correlation_id' header they both carry. Calls are pipelined: many can be in flight at once over the same PIPE
+    or QUEUE and each returns a Future straight away.
+
+    'timeout' is the default amount of seconds a call may take, None meaning waiting for ever. Calls whose deadline
+    expires are resolved with concurrent.futures.TimeoutError and their late replies are dropped.
+
+    Futures are only resolved while the client receives, that is while waiting on any of them or when 'pump' is
+    called, so the peer must not be used to receive from elsewhere meanwhile. Messages arriving that are not replies
+    are kept in 'others'.
+    '''
+
+    def __init__(self, peer, recipient_pid=None, timeout=None):
+        self.peer = peer
+        self.recipient_pid = recipient_pid
+        self.timeout = timeout
+        self.calls = {}  # correlation id => (future, deadline)
+        self.ids = itertools.count(1)
+        self.others = collections.deque()
+
+    def call(self, data=None, request=mpq_protocol.REQ_DO, recipient_pid=None, timeout=None):
+        '''Send a request carrying the data to the serving process and return the Future of its reply. 'timeout'
+        overrides the default of the client
+        '''
+        correlation_id = next(self.ids)
+        timeout = self.timeout if timeout is None else timeout
+        future = Future(self)
+        self.calls[correlation_id] = (future, None if timeout is None else time.monotonic() + timeout)
+        self.peer.send(request, recipient_pid=self.recipient_pid if recipient_pid is None else recipient_pid,
+                       data=data, headers={'correlation_id': correlation_id})
+        return future
+
+    def pump(self, timeout=0):
+        '''Resolve the futures of every reply ready - waiting 'timeout' seconds at most for the first one - and those
+        whose deadline has expired. Return the number of calls still in flight
+        '''
+        message = self.peer.receive(timeout=timeout, func=self.is_reply)
+        while message:
+            self.resolve(message)
+            message = self.peer.receive(func=self.is_reply)
+        self.expire()
+        return len(self.calls)
+
+    def wait_for(self, future, timeout=None):
+        '''Pump replies until the future is resolved or 'timeout' seconds elapse, in which case
+        concurrent.futures.TimeoutError is raised
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not future.done():
+            remaining = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, deadline - time.monotonic())
+            if remaining <= 0:
+                raise concurrent.futures.TimeoutError()
+            self.pump(remaining)
+
+    def is_reply(self, message):
+        return message.recipient_pid == self.peer.pid
+
+    def resolve(self, message):
+        '''Resolve the future of the call the message replies to
+        '''
+        if message.correlation_id is None or message.request != mpq_protocol.REQ_FINISHED:
+            self.others.append(message)
+            return
+        future, _ = self.calls.pop(message.correlation_id, (None, None))
+        if future is None:  # Its deadline expired already
+            return
+        succeeded, outcome = message.data
+        if succeeded:
+            future.set_result(outcome)
+        else:
+            future.set_exception(outcome)
+
+    def expire(self):
+        '''Resolve with concurrent.futures.TimeoutError the futures of the calls whose deadline has expired
+        '''
+        now = time.monotonic()
+        for correlation_id, (future, deadline) in list(self.calls.items()):
+            if deadline is not None and deadline <= now:
+                del self.calls[correlation_id]
+                future.set_exception(concurrent.futures.TimeoutError(f"Call {correlation_id} got no reply in time"))
+
+
+def reply(peer, message, outcome, succeeded=True):
+    '''Send the reply to the call carried by the message: the outcome of the call - or the exception raised by it if
+    it did not succeed
+    '''
+    peer.send(mpq_protocol.REQ_FINISHED, recipient_pid=message.sender_pid, data=(succeeded, outcome),
+              headers={'correlation_id': message.correlation_id})
+
+
+def serve(peer, handler):
+    '''Answer every call received by the peer, in order of arrival, with what handler(message) returns - or the
+    exception it raises - until a REQ_DIE message arrives. Messages that are not calls are passed to the handler too
+    but get no reply
+    '''
+    def is_call(message):
+        return message.recipient_pid in (None, peer.pid)
+
+    while True:
+        message = peer.receive(block=True, func=is_call)
+        if not message:
+            continue
+        if message.request == mpq_protocol.REQ_DIE:
+            peer.flush()
+            return
+        try:
+            outcome, succeeded = handler(message), True
+        except Exception as ex:
+            outcome, succeeded = ex, False
+        if message.correlation_id is not None:
+            reply(peer, message, outcome, succeeded)
@@ -0,0 +1,119 @@
+import abc
+import json
+import pickle
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from pymulproc import errors
+
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL  # 5 from Python 3.8 onwards
+
+
+class Serializer(abc.ABC):
+    '''Turn the data of a message into the payload of its frame and back. 'codec' identifies the serializer in the
+    header of the frame so that a peer fails loudly when it gets a payload it can not read
+    '''
+
+    codec = None
+    name = None
+
+    @abc.abstractmethod
+    def dumps(self, data):
+        '''Return the payload the data is turned into
+        '''
+        pass
+
+    @abc.abstractmethod
+    def loads(self, payload):
+        '''Return the data a payload was made from
+        '''
+        pass
+
+
+class PickleSerializer(Serializer):
+    '''Any picklable Python object. This is the default one
+    '''
+
+    codec = 0
+    name = 'pickle'
+
+    def __init__(self, protocol=PICKLE_PROTOCOL):
+        self.protocol = protocol
+
+    def dumps(self, data):
+        return pickle.dumps(data, self.protocol)
+
+    def loads(self, payload):
+        return pickle.loads(payload)
+
+
+class RawSerializer(Serializer):
+    '''bytes, bytearray or memoryview sent as they are, with no serialization at all. They are received as bytes
+    '''
+
+    codec = 1
+    name = 'raw'
+
+    def dumps(self, data):
+        try:
+            return memoryview(data).cast('B')
+        except TypeError as ex:
+            raise errors.ProtocolError(f"The raw serializer only sends bytes-like data, not {type(data)}") from ex
+
+    def loads(self, payload):
+        return bytes(payload)
+
+
+class JsonSerializer(Serializer):
+    '''Plain data - dicts, lists, strings, numbers, booleans and None - encoded as UTF-8 JSON. Tuples are received as
+    lists
+    '''
+
+    codec = 2
+    name = 'json'
+
+    def dumps(self, data):
+        return json.dumps(data, separators=(',', ':')).encode()
+
+    def loads(self, payload):
+        return json.loads(bytes(payload))
+
+
+class MsgpackSerializer(Serializer):
+    '''Plain data, as the JSON one, plus bytes encoded with MessagePack. It needs the 'msgpack' package
+    '''
+
+    codec = 3
+    name = 'msgpack'
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("The msgpack serializer needs the 'msgpack' package to be installed")
+
+    def dumps(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, payload):
+        return msgpack.unpackb(payload, raw=False)
+
+
+PICKLE = PickleSerializer()
+SERIALIZERS = {serializer.name: serializer for serializer in (PickleSerializer, RawSerializer, JsonSerializer,
+                                                               MsgpackSerializer)}
+
+
+def get_serializer(serializer):
+    '''Return a serializer given its name. Serializer instances are returned as they are and None stands for the
+    default one
+    '''
+    if serializer is None:
+        return PICKLE
+    if isinstance(serializer, Serializer):
+        return serializer
+    try:
+        return PICKLE if serializer == PICKLE.name else SERIALIZERS[serializer]()
+    except KeyError as ex:
+        raise ValueError(f"Unknown serializer {serializer!r}. Choose among {sorted(SERIALIZERS)}") from ex
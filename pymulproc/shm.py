@@ -0,0 +1,124 @@
+import mmap
+import os
+
+from pymulproc import serializers
+
+try:
+    import _posixshmem
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # Python < 3.8 or not a POSIX system
+    shared_memory = None
+
+SUPPORTED = shared_memory is not None
+SHM_THRESHOLD = 1024 * 1024  # suggested amount of bytes from which sending through shared memory pays off
+BUFFER_TYPES = (bytes, bytearray, memoryview)
+
+
+class SharedMemoryHandle:
+    '''Small picklable reference to a payload left in a shared memory segment
+    '''
+
+    __slots__ = ('name', 'nbytes', 'dtype', 'shape')
+
+    def __init__(self, name, nbytes, dtype=None, shape=None):
+        self.name = name
+        self.nbytes = nbytes
+        self.dtype = dtype
+        self.shape = shape
+
+    def __getstate__(self):
+        return self.name, self.nbytes, self.dtype, self.shape
+
+    def __setstate__(self, state):
+        self.name, self.nbytes, self.dtype, self.shape = state
+
+    def attach(self):
+        '''Map the segment, unlink it and return a zero-copy view of the payload: a memoryview, or a numpy array with
+        the original dtype and shape if a numpy array was sent. The memory is given back to the system as soon as the
+        last view is garbage collected
+        '''
+        # shared_memory.SharedMemory can not be used here: closing it - as its finalizer does - fails while views of
+        # its buffer are alive, so the segment is mapped by hand and the view alone keeps the mapping alive
+        fd = _posixshmem.shm_open(self.name, os.O_RDWR, mode=0o600)
+        try:
+            segment = mmap.mmap(fd, os.fstat(fd).st_size)
+        finally:
+            os.close(fd)
+        _posixshmem.shm_unlink(self.name)
+        resource_tracker.unregister(self.name, 'shared_memory')
+        # The view keeps the mapping alive for as long as it - or anything built on it - is referenced
+        view = memoryview(segment)[:self.nbytes]
+        if self.dtype is None:
+            return view
+        import numpy
+        return numpy.frombuffer(view, dtype=self.dtype).reshape(self.shape)
+
+    def release(self):
+        '''Unlink the segment without mapping its payload, for messages that are discarded rather than received
+        '''
+        try:
+            segment = shared_memory.SharedMemory(self.name.lstrip('/'))
+        except FileNotFoundError:  # Someone else released it already
+            return
+        segment.close()
+        segment.unlink()
+
+
+def prepare():
+    '''Start multiprocessing's resource tracker, if not yet running, so that processes forked from now on share it with
+    this one. Otherwise segments created by a child and released by its parent would be tracked by different trackers
+    '''
+    if SUPPORTED:
+        resource_tracker.ensure_running()
+
+
+def export(data, threshold):
+    '''Return a handle to a new shared memory segment holding a copy of data if this one is a contiguous buffer of at
+    least 'threshold' bytes. Otherwise data is returned as it is.
+
+    The segment is unlinked by the receiver when it attaches to it. Segments that never get received are reclaimed by
+    multiprocessing's resource tracker when the program ends. Only POSIX systems running Python 3.8 onwards are
+    supported - elsewhere data is always returned as it is
+    '''
+    if not SUPPORTED or not isinstance(data, BUFFER_TYPES) and not hasattr(data, '__array_interface__'):
+        return data
+    try:
+        view = memoryview(data)
+    except (TypeError, ValueError):  # e.g. numpy arrays of python objects
+        return data
+    if not view.nbytes or view.nbytes < threshold or not view.c_contiguous:
+        return data
+
+    segment = shared_memory.SharedMemory(create=True, size=view.nbytes)
+    try:
+        segment.buf[:view.nbytes] = view.cast('B')
+    finally:
+        segment.close()
+    is_array = not isinstance(data, BUFFER_TYPES)
+    return SharedMemoryHandle('/' + segment.name,
+                              view.nbytes,
+                              data.dtype.str if is_array else None,
+                              data.shape if is_array else None)
+
+
+def check_serializer(serializer):
+    '''Raise a ValueError if payloads can not be sent through shared memory along with the given serializer: only
+    pickle can carry the handles to the segments
+    '''
+    if serializer.codec != serializers.PICKLE.codec:
+        raise ValueError(f"Payloads can only be sent through shared memory with the pickle serializer, not "
+                         f"{serializer.name!r}")
+
+
+def release(data):
+    '''Unlink the shared memory segment if data is a handle to one that is never going to be attached
+    '''
+    if isinstance(data, SharedMemoryHandle):
+        data.release()
+
+
+def attach(data):
+    '''Return the view of the payload if data is a handle to a shared memory segment. Otherwise data is returned as it
+    is
+    '''
+    return data.attach() if isinstance(data, SharedMemoryHandle) else data
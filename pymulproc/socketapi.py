@@ -0,0 +1,231 @@
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import socket
+import threading
+import time
+
+from pymulproc import errors
+from pymulproc import metrics, mpq_protocol, pipeapi
+
+REQ_CONNECT = 'CONNECT'  # first message a child sends on every new connection so that the parent learns its peer id
+RECONNECT_ATTEMPTS = 5
+RECONNECT_DELAY = 0.05  # seconds waited before the first attempt to reconnect, doubled on each attempt
+
+_pool = {}  # connections open in this process: (address, pid) => connection
+
+
+def connect(address, family=None, authkey=None):
+    '''Return the connection of this process to the given address, opening it if there is none yet or it was closed.
+    It also returns whether the connection was opened by this call
+    '''
+    key = (address, os.getpid())  # connections are not shared with forked children
+    conn = _pool.get(key)
+    if conn is not None and not conn.closed:
+        return conn, False
+    conn = _pool[key] = multiprocessing.connection.Client(address, family, authkey=authkey)
+    return conn, True
+
+
+def disconnect(address, conn):
+    '''Close a connection and forget it so that the next 'connect' opens a new one
+    '''
+    key = (address, os.getpid())
+    if _pool.get(key) is conn:
+        del _pool[key]
+    conn.close()
+
+
+class Parent(pipeapi.HubParent):
+    '''Class that will instantiate the parent process' peer over sockets. It accepts children as they connect to the
+    listener and behaves as the parent of a PIPE hub: messages addressed to a child are written only into its
+    connection and those with no recipient are broadcast to all children connected.
+
+    Children are known by their peer id - the host and PID they send first - since PIDs alone may repeat across
+    hosts. Connections are accepted and authenticated with 'authkey' on background threads, so that a slow client
+    never holds up 'receive'.
+    '''
+
+    def __init__(self, listener, **kwargs):
+        super().__init__([], **kwargs)
+        self.listener = listener
+        self.authkey = kwargs.get('authkey', None)
+        self.peers = {}  # (host, pid) => connection
+        self.arrivals = queue.SimpleQueue()  # (peer id, connection) of the children done with the handshake
+        self.arrived, self.announce = multiprocessing.Pipe(duplex=False)  # readable once a child has arrived
+        self.announcing = threading.Lock()
+        threading.Thread(target=self.listen, daemon=True).start()
+
+    def route(self, recipient_pid):
+        '''Return the connections a message addressed to recipient_pid should be written into
+        '''
+        if recipient_pid is None:
+            return list(self.peers.values())
+        conns = [conn for (host, pid), conn in self.peers.items() if pid == recipient_pid]
+        if not conns:
+            raise errors.SocketCommunicationError(f"Process {recipient_pid} is not connected")
+        if len(conns) > 1:
+            raise errors.SocketCommunicationError(f"Process {recipient_pid} is connected from {len(conns)} hosts")
+        return conns
+
+    def write(self, conn, frame, messages=1):
+        '''writes a frame down a connection, forgetting the connection if the child at the other end is gone
+        '''
+        try:
+            super().write(conn, frame, messages)
+        except OSError as ex:
+            self.drop(conn)
+            raise errors.SocketCommunicationError("Child process disconnected") from ex
+
+    def deliver(self, frames, broadcast=False):
+        '''writes each frame down its connection, going on with the rest when a child has gone. Children gone are
+        forgotten, and SocketCommunicationError is raised once all frames are written unless they were broadcast
+        '''
+        error = None
+        for conn, (frame, messages) in frames.items():
+            try:
+                self.write(conn, frame, messages)
+            except errors.SocketCommunicationError as ex:
+                error = error or ex
+        if error and not broadcast:
+            raise error
+
+    def listen(self):
+        '''Accept connections for as long as the listener is open, each one shaking hands on a thread of its own so
+        that a client slow to authenticate or to say hello does not hold up the others
+        '''
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.handshake, args=(conn, ), daemon=True).start()
+
+    def handshake(self, conn):
+        '''Authenticate a new connection and learn the peer id of the child at the other end from its first message.
+        Connections failing to do either are closed
+        '''
+        try:
+            if self.authkey is not None:
+                multiprocessing.connection.deliver_challenge(conn, self.authkey)
+                multiprocessing.connection.answer_challenge(conn, self.authkey)
+            host, pid = mpq_protocol.Message.decode(conn.recv_bytes()).data
+        except (multiprocessing.AuthenticationError, errors.ProtocolError, EOFError, OSError, TypeError, ValueError):
+            conn.close()
+            return
+        self.arrivals.put(((host, pid), conn))
+        with self.announcing:
+            self.announce.send_bytes(b'')
+
+    def admit(self):
+        '''Register the children done with the handshake under their peer id
+        '''
+        while self.arrived.poll():
+            self.arrived.recv_bytes()
+        while True:
+            try:
+                peer_id, conn = self.arrivals.get_nowait()
+            except queue.Empty:
+                return
+            if peer_id in self.peers:  # The child reconnected
+                self.drop(self.peers[peer_id])
+            self.peers[peer_id] = conn
+            self.conn.append(conn)
+
+    def drop(self, conn):
+        '''Forget a connection whose child has gone
+        '''
+        if conn in self.conn:
+            self.conn.remove(conn)
+        self.peers = {peer_id: peer_conn for peer_id, peer_conn in self.peers.items() if peer_conn is not conn}
+        conn.close()
+
+    @metrics.timed('receive_latency')
+    def receive(self, **kwargs):
+        '''Check if a message is ready to be caught from any of the children, admitting those connecting meanwhile.
+        It takes the same parameters as the PIPE communication
+        '''
+        self.flush()
+        if self.pending:
+            return self.pending.popleft()
+        timeout = kwargs.get('timeout', None if kwargs.get('block', 'timeout' in kwargs) else 0)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            ready = multiprocessing.connection.wait(self.readers(), remaining)
+            if self.arrived in ready:
+                self.admit()
+            for offset in range(len(self.conn)):
+                index = (self.cursor + offset) % len(self.conn)
+                conn = self.conn[index]
+                if conn in ready:
+                    self.cursor = index + 1
+                    try:
+                        return self.unpack(self.read(conn))
+                    except (EOFError, OSError):
+                        self.drop(conn)
+                        break
+            if not ready or remaining == 0:
+                return False
+
+    def readers(self):
+        '''The parent is woken up when a child has connected and each connection when its child sends a message
+        '''
+        return [self.arrived] + list(self.conn)
+
+
+class Child(pipeapi.Child):
+    '''Class that will instantiate the child process' peer over sockets. Connections are pooled per process and
+    address. If the connection breaks, sending reconnects - up to RECONNECT_ATTEMPTS times - and sends again, while
+    receiving reconnects and returns False
+    '''
+
+    def __init__(self, address, **kwargs):
+        self.address = address
+        self.family = kwargs.get('family', None)
+        self.authkey = kwargs.get('authkey', None)
+        conn, opened = connect(address, self.family, self.authkey)
+        super().__init__(conn, **kwargs)
+        if opened:
+            self.hello()
+
+    def hello(self):
+        '''Tell the parent the peer id of this process - its host and PID - on a new connection
+        '''
+        hello = mpq_protocol.Message(REQ_CONNECT, self.pid, data=(socket.gethostname(), self.pid))
+        self.conn.send_bytes(hello.encode())
+
+    def reconnect(self):
+        '''Open a new connection, waiting longer after each failed attempt
+        '''
+        disconnect(self.address, self.conn)
+        delay = RECONNECT_DELAY
+        for attempt in range(RECONNECT_ATTEMPTS):
+            try:
+                self.conn, _ = connect(self.address, self.family, self.authkey)
+                self.hello()
+                return
+            except OSError as ex:
+                error = ex
+            time.sleep(delay)
+            delay *= 2
+        raise errors.SocketCommunicationError(f"Process {self.pid} could not reconnect to {self.address}") from error
+
+    def write(self, conn, frame, messages=1):
+        '''writes a frame down the connection, reconnecting first if it is broken
+        '''
+        try:
+            super().write(self.conn, frame, messages)
+        except OSError:
+            self.reconnect()
+            super().write(self.conn, frame, messages)
+
+    def receive(self, **kwargs):
+        '''Check if a message is ready to be caught from the parent, reconnecting if the connection is broken
+        '''
+        try:
+            return super().receive(**kwargs)
+        except (EOFError, OSError):
+            self.reconnect()
+            return False
@@ -0,0 +1,236 @@
+import functools
+import itertools
+import time
+
+from pymulproc import errors, mpq_protocol
+
+CHUNK_SIZE = 1024 * 1024  # bytes read from a file object - or sliced from a buffer - into each chunk
+WINDOW = 8  # max chunks of a stream in flight that the receiver has not taken yet
+ENVELOPE = 4096  # bytes the message carrying a chunk may take besides the chunk itself
+
+stream_ids = itertools.count(1)  # together with the PID of the sender they identify a stream
+
+
+def chunks(source, chunk_size=CHUNK_SIZE):
+    '''Yield the chunks a stream is made of: slices of 'chunk_size' bytes of a buffer, reads of 'chunk_size' bytes of
+    a file object or the items of any other iterable
+    '''
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source).cast('B')
+        for offset in range(0, len(view), chunk_size):
+            yield bytes(view[offset:offset + chunk_size])
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from source
+
+
+def fit(peer, chunk_size):
+    '''Return the chunk size to be used by the peer: the one given unless its transport can not carry such chunks
+    '''
+    limit = peer.max_chunk_size()
+    return chunk_size if limit is None else min(chunk_size, limit)
+
+
+def is_stream(peer, message):
+    '''Tell whether the message belongs to a stream sent to the peer
+    '''
+    return message.request in (mpq_protocol.REQ_STREAM, mpq_protocol.REQ_STREAM_END) and \
+        message.stream_id is not None and message.recipient_pid in (None, peer.pid)
+
+
+def is_ack(peer, stream_id, message):
+    '''Tell whether the message acknowledges chunks of the given stream sent by the peer
+    '''
+    return message.request == mpq_protocol.REQ_STREAM_ACK and message.recipient_pid == peer.pid and \
+        message.stream_id == stream_id
+
+
+class Aside:
+    '''Receive only the messages meeting some criteria while a stream is in progress, setting aside those that do not
+    but the peer could not reject - mailboxes and PIPEs ignore 'func'. They are handed back to the peer as pending
+    once done, ahead of anything received later
+    '''
+
+    def __init__(self, peer, timeout):
+        self.peer = peer
+        self.timeout = timeout
+        self.messages = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.peer.pending.extendleft(reversed(self.messages))
+        self.messages = []
+
+    def deadline(self):
+        '''Return the time by which the message about to be waited for must arrive - None meaning no deadline
+        '''
+        return None if self.timeout is None else time.monotonic() + self.timeout
+
+    def remaining(self, deadline):
+        '''Return the seconds left until the deadline. StreamCommunicationError is raised once it has passed
+        '''
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            raise errors.StreamCommunicationError(f"Process {self.peer.pid} got no stream message in "
+                                                  f"{self.timeout} seconds")
+        return remaining
+
+    def keep(self, message, func):
+        '''Return the message received if it meets func criteria. Otherwise it is set aside and None is returned
+        '''
+        if message and func(message):
+            return message
+        if message:
+            self.messages.append(message)
+        return None
+
+
+# Operations the stream protocol - 'sender' and 'receiver' - asks the peer for. The protocol is written once as a
+# generator of such operations, which 'drive' carries out with synchronous peers and 'drive_async' with asyncio ones
+SEND = 'send'  # send the message (request, recipient_pid, data, headers)
+RECEIVE = 'receive'  # receive the next message meeting the given criteria, which is sent back into the protocol
+FLUSH = 'flush'  # flush the messages buffered by the peer
+YIELD = 'yield'  # hand the given value out to the caller
+
+
+def sender(peer, source, recipient_pid, chunk_size, window):
+    '''Protocol of the sending end of a stream - see 'send'. The number of chunks sent is handed out last
+    '''
+    if recipient_pid is None and peer.many_receivers():
+        raise ValueError(f"Streams sent by a {type(peer).__name__} peer need a recipient, as otherwise their chunks "
+                         f"may be taken by many processes")
+    stream_id = next(stream_ids)
+    acknowledges = functools.partial(is_ack, peer, stream_id)
+
+    # The receiver acknowledges every message of the stream once. Acknowledgements may overtake each other, so the
+    # highest one tells how many were taken and all of them are waited for before returning, so that none is left
+    sent = acked = acks = 0
+    for chunk in chunks(source, fit(peer, chunk_size)):
+        while sent - acked >= window:
+            acked, acks = max(acked, (yield RECEIVE, acknowledges).data), acks + 1
+        yield SEND, (mpq_protocol.REQ_STREAM, recipient_pid, chunk, {'stream_id': stream_id, 'sequence': sent})
+        sent += 1
+    yield SEND, (mpq_protocol.REQ_STREAM_END, recipient_pid, None, {'stream_id': stream_id, 'sequence': sent})
+    while acks <= sent:
+        yield RECEIVE, acknowledges
+        acks += 1
+    yield YIELD, sent
+
+
+def receiver(peer):
+    '''Protocol of the receiving end of a stream - see 'receive'. Chunks are handed out in order
+    '''
+    def is_next(message):
+        return is_stream(peer, message) and message.sender_pid == first.sender_pid and \
+            message.stream_id == first.stream_id
+
+    def ack(taken):
+        return SEND, (mpq_protocol.REQ_STREAM_ACK, first.sender_pid, taken, {'stream_id': first.stream_id})
+
+    first = message = yield RECEIVE, functools.partial(is_stream, peer)
+    arrived, taken = {}, 0
+    while True:
+        arrived[message.headers['sequence']] = message
+        while taken in arrived:
+            message = arrived.pop(taken)
+            if message.request == mpq_protocol.REQ_STREAM_END:
+                yield ack(taken + 1)
+                yield FLUSH, None
+                return
+            yield YIELD, message.data
+            taken += 1
+            yield ack(taken)
+        message = yield RECEIVE, is_next
+
+
+def drive(peer, protocol, timeout):
+    '''Carry out the operations of the protocol with a synchronous peer, yielding the values it hands out
+    '''
+    with Aside(peer, timeout) as aside:
+        reply = None
+        while True:
+            try:
+                operation, argument = protocol.send(reply)
+            except StopIteration:
+                return
+            reply = None
+            if operation == SEND:
+                request, recipient_pid, data, headers = argument
+                peer.send(request, recipient_pid=recipient_pid, data=data, headers=headers)
+            elif operation == RECEIVE:
+                deadline = aside.deadline()
+                while not reply:
+                    reply = aside.keep(peer.receive(block=True, timeout=aside.remaining(deadline), func=argument),
+                                       argument)
+            elif operation == FLUSH:
+                peer.flush()
+            else:
+                yield argument
+
+
+async def drive_async(peer, protocol, timeout):
+    '''Carry out the operations of the protocol with an asyncio peer, yielding the values it hands out
+    '''
+    with Aside(peer, timeout) as aside:
+        reply = None
+        while True:
+            try:
+                operation, argument = protocol.send(reply)
+            except StopIteration:
+                return
+            reply = None
+            if operation == SEND:
+                request, recipient_pid, data, headers = argument
+                await peer.send(request, recipient_pid=recipient_pid, data=data, headers=headers)
+            elif operation == RECEIVE:
+                deadline = aside.deadline()
+                while not reply:
+                    reply = aside.keep(await peer.receive(block=True, timeout=aside.remaining(deadline),
+                                                          func=argument), argument)
+            elif operation == FLUSH:
+                await peer.flush()
+            else:
+                yield argument
+
+
+def send(peer, source, recipient_pid=None, chunk_size=CHUNK_SIZE, window=WINDOW, timeout=None):
+    '''Send the chunks of 'source' as REQ_STREAM messages followed by a REQ_STREAM_END one, never letting more than
+    'window' of them in flight before the receiver acknowledges taking them. It returns once the receiver has taken
+    the whole stream. StreamCommunicationError is raised if no acknowledgement arrives in 'timeout' seconds. Return
+    the number of chunks sent. Chunks are made smaller than 'chunk_size' if the transport of the peer can not carry
+    them. Peers whose messages with no recipient may be taken by many processes - QUEUEs and hubs - must be given a
+    'recipient_pid': ValueError is raised otherwise
+    '''
+    for sent in drive(peer, sender(peer, source, recipient_pid, chunk_size, window), timeout):
+        pass
+    return sent
+
+
+async def send_async(peer, source, recipient_pid=None, chunk_size=CHUNK_SIZE, window=WINDOW, timeout=None):
+    '''Coroutine counterpart of 'send' for asyncio peers
+    '''
+    async for sent in drive_async(peer, sender(peer, source, recipient_pid, chunk_size, window), timeout):
+        pass
+    return sent
+
+
+def receive(peer, timeout=None):
+    '''Yield the chunks of the next stream sent to the peer in order, acknowledging each one once the next is asked
+    for so that the sender never gets further ahead than its window. Chunks overtaking others - when requeued by other
+    processes sharing the QUEUE - wait for them, 'window' of them at most. StreamCommunicationError is raised if a
+    chunk does not arrive in 'timeout' seconds
+    '''
+    return drive(peer, receiver(peer), timeout)
+
+
+def receive_async(peer, timeout=None):
+    '''Asynchronous iterator counterpart of 'receive' for asyncio peers
+    '''
+    return drive_async(peer, receiver(peer), timeout)
@@ -0,0 +1,241 @@
+import multiprocessing
+import multiprocessing.connection
+import queue
+import time
+
+from pymulproc import deadletter, mpq_protocol, routing
+
+HEARTBEAT_INTERVAL = 1  # seconds between the heartbeats a supervised process sends
+STOP_TIMEOUT = 5  # seconds 'stop' waits for the children to die once asked to before terminating them
+# Seconds a blocking 'receive' waits on the peer before going back to watch the children too. Long enough for the
+# parent to take turns reading the shared QUEUE with children blocked on it
+RECEIVE_SLICE = 0.01
+SWEEP_TIMEOUT = 0.1  # seconds the sweep waits for a frame still on its way into the shared QUEUE
+
+
+def registries(comm_factory):
+    '''Return the shared tables the children of a factory register in, so that a process replacing a dead one can
+    take its slot - and with it its mailbox, work inbox or PIPE
+    '''
+    router = getattr(comm_factory, 'router', None)
+    if router:
+        return [router.registry] + ([router.workers] if router.workers else [])
+    registry = getattr(comm_factory, 'registry', None)
+    return [registry] if registry else []
+
+
+def bootstrap(comm_factory, dead_pid, target, args):
+    '''Entry point of every supervised process: take over the slots of the dead process it replaces, if any, and run
+    target(comm_factory, *args)
+    '''
+    if dead_pid is not None:
+        for registry in registries(comm_factory):
+            registry.replace(dead_pid, multiprocessing.current_process().pid)
+    target(comm_factory, *args)
+
+
+class Heartbeat:
+    '''Tell the supervisor that the process is alive by sending it a REQ_HEARTBEAT message. 'beat' should be called
+    often from the loop of the process, but only sends a heartbeat once every 'interval' seconds
+    '''
+
+    def __init__(self, peer, recipient_pid=None, interval=HEARTBEAT_INTERVAL):
+        self.peer = peer
+        self.recipient_pid = multiprocessing.parent_process().pid if recipient_pid is None else recipient_pid
+        self.interval = interval
+        self.last = None
+
+    def beat(self):
+        '''Send a heartbeat if the last one was sent more than 'interval' seconds ago. Return whether it was sent
+        '''
+        now = time.monotonic()
+        if self.last is not None and now - self.last < self.interval:
+            return False
+        self.peer.send(mpq_protocol.REQ_HEARTBEAT, recipient_pid=self.recipient_pid)
+        self.last = now
+        return True
+
+
+class Supervisor:
+    '''Run 'processes' children - target(comm_factory, *args) - talking to the parent peer of the factory, and watch
+    them while receiving: a child dying is noticed straight away through its process sentinel.
+
+    If 'restart' is True the dead child is replaced by a new process that takes over its mailbox - or PIPE - so that
+    messages waiting for it are not lost, and messages addressed to it in the shared QUEUE are readdressed to the new
+    one. Otherwise they are handed to 'dead_letter' - if given, as messages - and dropped, so that they do not circulate
+    through the shared QUEUE for ever and 'queue_join' does not hang. Work left in the inbox of a dead worker goes
+    back to the shared QUEUE.
+
+    If 'heartbeat_timeout' is given children must send heartbeats - see Heartbeat - at least that often, from the
+    moment they start: a child silent for longer is deemed hung and terminated. Any keyword parameter left is passed
+    to the factory's 'parent'.
+    '''
+
+    def __init__(self, comm_factory, target, args=(), processes=1, restart=True, heartbeat_timeout=None,
+                 dead_letter=None, **kwargs):
+        self.factory = comm_factory
+        self.target = target
+        self.args = args
+        self.processes = processes
+        self.restart = restart
+        self.heartbeat_timeout = heartbeat_timeout
+        self.dead_letter = dead_letter
+        self.peer = comm_factory.parent(**kwargs)
+        self.pid = self.peer.pid
+        self.children = {}  # pid => process
+        self.last_seen = {}  # pid => time of the last heartbeat
+        self.restarts = 0
+        self.stopping = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        '''Start the children
+        '''
+        for _ in range(self.processes - len(self.children)):
+            self.spawn()
+
+    def spawn(self, dead_pid=None):
+        '''Start a child, replacing the given dead one if any
+        '''
+        process = self.factory.Process(target=bootstrap, args=(self.factory, dead_pid, self.target, self.args))
+        process.start()
+        self.children[process.pid] = process
+        self.last_seen[process.pid] = time.monotonic()
+        return process
+
+    def receive(self, **kwargs):
+        '''Receive a message from the children, with the same parameters as the peer's 'receive'. Heartbeats are taken
+        in on the way, and children that died are dealt with - see 'check' - even while sleeping
+        '''
+        block = kwargs.pop('block', 'timeout' in kwargs)
+        timeout = kwargs.pop('timeout', None)
+        if 'func' in kwargs:
+            func = kwargs['func']
+            kwargs['func'] = lambda message: message.request == mpq_protocol.REQ_HEARTBEAT or func(message)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.check()
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if block:
+                message = self.peer.receive(timeout=RECEIVE_SLICE if remaining is None else
+                                            min(RECEIVE_SLICE, remaining), **kwargs)
+            else:
+                message = self.peer.receive(**kwargs)
+            if message and message.request == mpq_protocol.REQ_HEARTBEAT:
+                if message.sender_pid in self.children:
+                    self.last_seen[message.sender_pid] = time.monotonic()
+                continue
+            if message:
+                return message
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not block or remaining == 0:
+                return False
+            if self.heartbeat_timeout is not None:
+                remaining = self.heartbeat_timeout if remaining is None else min(remaining, self.heartbeat_timeout)
+            multiprocessing.connection.wait(self.peer.readers() + [process.sentinel for process in
+                                                                   self.children.values()], remaining)
+
+    def check(self):
+        '''Terminate the children that have not sent a heartbeat in time, and bury those that died. Return the PIDs
+        of the latter
+        '''
+        if self.heartbeat_timeout is not None:
+            now = time.monotonic()
+            for pid, process in self.children.items():
+                if now - self.last_seen[pid] > self.heartbeat_timeout and process.is_alive():
+                    process.terminate()
+        sentinels = {process.sentinel: pid for pid, process in self.children.items()}
+        dead = [sentinels[sentinel] for sentinel in multiprocessing.connection.wait(list(sentinels), 0)] \
+            if sentinels else []
+        for pid in dead:
+            self.bury(pid)
+        return dead
+
+    def bury(self, pid):
+        '''Deal with a dead child: replace it if restarting and get rid of its slots and messages otherwise
+        '''
+        self.children.pop(pid).join()
+        del self.last_seen[pid]
+        if self.restart and not self.stopping:
+            self.restarts += 1
+            self.sweep(pid, self.spawn(pid).pid)
+        else:
+            self.sweep(pid)
+            self.evict(pid)
+
+    def sweep(self, pid, heir_pid=None):
+        '''Go through the shared QUEUE once, readdressing to the heir the messages addressed to the dead process - or
+        dead-lettering them if it has no heir. Messages within batch frames are dealt with one by one, and frames are
+        put back through the peer so that its backpressure policy and metrics apply
+        '''
+        for lane in getattr(self.factory, 'lanes', []):
+            try:
+                count = lane.qsize()
+            except NotImplementedError:  # macOS => such messages are left where they are
+                continue
+            for _ in range(count):
+                try:
+                    frame = lane.get(timeout=SWEEP_TIMEOUT)
+                except queue.Empty:
+                    break
+                batch = mpq_protocol.read_header(frame)[0] == mpq_protocol.REQ_BATCH
+                items = self.peer.decode(frame).data if batch else [frame]
+                kept = []
+                for item in items:
+                    if mpq_protocol.read_header(item)[2] != pid:
+                        kept.append(item)
+                    elif heir_pid is not None:
+                        kept.append(mpq_protocol.readdress(item, heir_pid))
+                    else:
+                        self.bury_message(item)
+                if kept == items:
+                    self.peer.put(lane, frame, len(items))
+                elif len(kept) == 1:
+                    self.peer.put(lane, kept[0])
+                elif kept:
+                    self.peer.put(lane, self.peer.encode(self.peer.build_batch(kept)), len(kept))
+                lane.task_done()
+
+    def evict(self, pid):
+        '''Free the slots of a dead process that has no heir, dead-lettering what is left in its mailboxes and putting
+        the work left in its inbox back into the shared QUEUE
+        '''
+        router = getattr(self.factory, 'router', None)
+        if router:
+            mailboxes, inbox = router.unregister(pid)
+            for mailbox in mailboxes:
+                for frame in routing.drain(mailbox):
+                    self.bury_message(frame)
+            for frame in routing.drain(inbox) if inbox else []:
+                self.peer.put(self.factory.lanes[-1], frame)
+        for registry in registries(self.factory) if not router else []:
+            registry.unregister(pid)
+
+    def bury_message(self, frame):
+        '''Hand a message addressed to a dead process to 'dead_letter', if any, and to the peer's dead letter channel
+        '''
+        if self.dead_letter:
+            self.dead_letter(self.peer.decode(frame))
+        self.peer.dead_letter(frame, deadletter.DEAD_RECIPIENT)
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        '''Ask every child to die and wait for them, for 'timeout' seconds at most before terminating them
+        '''
+        self.stopping = True
+        for pid in self.children:
+            self.peer.send(mpq_protocol.REQ_DIE, recipient_pid=pid)
+        self.peer.flush()
+        deadline = time.monotonic() + timeout
+        for process in self.children.values():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.children.clear()
+        self.last_seen.clear()
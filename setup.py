@@ -17,16 +17,18 @@ setuptools.setup(
     long_description_content_type="text/x-rst",
     url="https://github.com/d2gex/pymulproc",
     packages=['pymulproc'],
-    python_requires='>=3.6',
-    tests_require=['pytest>=4.4.0'],
+    python_requires='>=3.8',
+    tests_require=['pytest>=7.4.4'],
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Environment :: Console',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
-        'Programming Language :: Python :: 3.6',
-        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Topic :: Software Development :: Libraries :: Python Modules'
     ]
 )
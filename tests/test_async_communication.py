@@ -0,0 +1,181 @@
+import asyncio
+import pytest
+import time
+import multiprocessing
+
+from pymulproc import errors
+from pymulproc import backpressure, mpq_protocol, factory, pipeapi
+
+
+def send_after_delay(pipe_factory, delay, data):
+    '''A synchronous child on the other end of the async PIPE
+    '''
+    time.sleep(delay)
+    pipeapi.Child(pipe_factory.child_conn).send(mpq_protocol.REQ_FINISHED, data=data)
+
+
+def test_one_event_loop_drives_many_pipes():
+    '''Check that a single event loop can wait on many PIPEs at once and that every coroutine wakes up with the
+    message sent by its own child, while the loop remains free to run other coroutines
+    '''
+
+    num_children = 20
+    pipe_factories = [factory.AsyncPipeCommunication() for _ in range(num_children)]
+    child_processes = [multiprocessing.Process(target=send_after_delay, args=(pipe_factory, 0.2, offset))
+                       for offset, pipe_factory in enumerate(pipe_factories)]
+    for child_process in child_processes:
+        child_process.start()
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker_task = asyncio.ensure_future(ticker())
+        parents = [pipe_factory.parent() for pipe_factory in pipe_factories]
+        messages = await asyncio.gather(*(parent.receive(timeout=5) for parent in parents))
+        ticker_task.cancel()
+        return messages, ticks
+
+    messages, ticks = asyncio.run(main())
+    for child_process in child_processes:
+        child_process.join()
+    assert [message.data for message in messages] == list(range(num_children))
+    assert ticks > 5
+
+
+def test_async_receive_timeout_and_send():
+    '''Check that an async receive gives up after the timeout and that async peers can talk to each other
+    '''
+
+    async def main():
+        pipe_factory = factory.AsyncPipeCommunication()
+        parent, child = pipe_factory.parent(), pipe_factory.child()
+        start = time.monotonic()
+        assert await parent.receive(timeout=0.2) is False
+        assert time.monotonic() - start >= 0.2
+        assert await parent.receive() is False
+
+        await child.send(mpq_protocol.REQ_DO, data=1)
+        await child.send(mpq_protocol.REQ_DO, data=2)
+        messages = await parent.receive_many(5, timeout=1)
+        return [message.data for message in messages]
+
+    assert asyncio.run(main()) == [1, 2]
+
+
+def test_writing_into_a_full_pipe_leaves_the_loop_free():
+    '''Check that a frame larger than the PIPE can take at once is written without blocking the event loop, and that
+    the messages sent after it are written in order once it is done
+    '''
+
+    async def main():
+        pipe_factory = factory.AsyncPipeCommunication()
+        parent, child = pipe_factory.parent(), pipe_factory.child()
+        payload = b'x' * 8 * 1024 * 1024
+        sending = asyncio.ensure_future(parent.send(mpq_protocol.REQ_DO, data=payload))
+        following = asyncio.ensure_future(parent.send(mpq_protocol.REQ_DO, data=1))
+        for _ in range(5):  # Nobody reads the PIPE meanwhile, yet the loop goes on
+            await asyncio.sleep(0.01)
+        assert not sending.done() and not following.done()
+        received = [(await child.receive(timeout=5)).data for _ in range(2)]
+        await asyncio.gather(sending, following)
+        return received
+
+    assert asyncio.run(main()) == [b'x' * 8 * 1024 * 1024, 1]
+
+
+def test_many_coroutines_wait_on_the_same_queue():
+    '''Check that several coroutines of the same event loop waiting on the same shared queue all get a message
+    '''
+
+    queue_factory = factory.AsyncQueueCommunication()
+
+    async def main():
+        peers = [queue_factory.parent() for _ in range(3)]
+        receivers = asyncio.gather(*(peer.receive(timeout=5) for peer in peers))
+        await asyncio.sleep(0.1)
+        for value in range(3):
+            await peers[0].send(mpq_protocol.REQ_DO, data=value)
+        return await receivers
+
+    messages = asyncio.run(main())
+    assert sorted(message.data for message in messages) == [0, 1, 2]
+
+
+def test_async_send_backs_off_while_queue_is_full():
+    '''Check that an async send does not block the event loop while the queue is full and eventually raises
+    '''
+
+    queue_factory = factory.AsyncQueueCommunication(max_size=1)
+
+    async def main():
+        parent = queue_factory.parent(timeout=0.05, loops=4)
+        await parent.send(mpq_protocol.REQ_DO)
+        await asyncio.sleep(0.1)
+        await parent.send(mpq_protocol.REQ_DO)
+
+    with pytest.raises(errors.QueuesCommunicationError):
+        asyncio.run(main())
+
+
+def test_async_send_goes_through_the_backpressure_policy():
+    '''Check that:
+
+    (1) An async send hands the message to the backpressure policy of the peer when the queue is full
+    (2) A batch flushed into a full queue waits for room without blocking the event loop, so that a coroutine of the
+        same loop can make room
+    '''
+
+    dropped = []
+    drop_factory = factory.AsyncQueueCommunication(max_size=1, backpressure=backpressure.DropNewest(dropped.append))
+    block_factory = factory.AsyncQueueCommunication(max_size=1, batch_size=2, backpressure=backpressure.Block(5))
+
+    async def main():
+        # (1)
+        parent, child = drop_factory.parent(), drop_factory.child()
+        await parent.send(mpq_protocol.REQ_DO, data=1)
+        await parent.send(mpq_protocol.REQ_DO, data=2)
+        assert len(dropped) == 1 and (await child.receive(timeout=1)).data == 1
+
+        # (2)
+        parent, child = block_factory.parent(), block_factory.child()
+        assert await parent.try_send(mpq_protocol.REQ_DO, data=0) == backpressure.SEND_OK
+
+        async def make_room():
+            await asyncio.sleep(0.1)
+            return (await child.receive(timeout=1)).data
+
+        async def send_batch():
+            await parent.send(mpq_protocol.REQ_DO, data=1)
+            await parent.send(mpq_protocol.REQ_DO, data=2)
+
+        first, _ = await asyncio.gather(make_room(), send_batch())
+        return [first] + [message.data for message in await child.receive_many(2, timeout=1)]
+
+    assert asyncio.run(main()) == [0, 1, 2]
+
+
+def test_async_peers_stream():
+    '''Check that an async peer streams to another one, both ends running on the same event loop
+    '''
+
+    payload = bytes(range(256)) * 1024
+    queue_factory = factory.AsyncQueueCommunication()
+
+    async def main():
+        parent, child = queue_factory.parent(), queue_factory.child()
+        parent.pid, child.pid = parent.pid, parent.pid + 1
+
+        async def collect():
+            return b''.join([chunk async for chunk in child.receive_stream(timeout=5)])
+
+        sent, received = await asyncio.gather(
+            parent.send_stream(payload, recipient_pid=child.pid, chunk_size=16 * 1024, window=2, timeout=5), collect())
+        return sent, received
+
+    assert asyncio.run(main()) == (16, payload)
@@ -0,0 +1,147 @@
+import multiprocessing
+import pytest
+import time
+
+from pymulproc import backpressure, errors, factory, mpq_protocol
+
+DATA = mpq_protocol.S_PID_OFFSET + 2
+
+
+def test_try_send_never_blocks():
+    '''Check that 'try_send' reports a full queue instead of waiting for room in it
+    '''
+
+    queue_factory = factory.QueueCommunication(max_size=2)
+    parent = queue_factory.parent()
+    child = queue_factory.child()
+
+    assert parent.try_send(mpq_protocol.REQ_DO, data=1) == backpressure.SEND_OK
+    assert parent.try_send(mpq_protocol.REQ_DO, data=2) == backpressure.SEND_OK
+    start = time.monotonic()
+    assert parent.try_send(mpq_protocol.REQ_DO, data=3) == backpressure.SEND_FULL
+    assert time.monotonic() - start < 0.05
+
+    assert [child.receive(timeout=1)[DATA] for _ in range(2)] == [1, 2]
+    assert parent.try_send(mpq_protocol.REQ_DO, data=3) == backpressure.SEND_OK
+
+
+def test_block_and_backoff_give_up_after_deadline():
+    '''Check that 'block' and 'backoff' wait for room for as long as their deadline and then raise an exception
+    '''
+
+    for policy in (backpressure.Block(0.2), backpressure.Backoff(0.2)):
+        queue_factory = factory.QueueCommunication(max_size=1, backpressure=policy)
+        parent = queue_factory.parent()
+        parent.send(mpq_protocol.REQ_DO, data=1)
+        start = time.monotonic()
+        with pytest.raises(errors.QueuesCommunicationError):
+            parent.send(mpq_protocol.REQ_DO, data=2)
+        assert 0.2 <= time.monotonic() - start < 1
+
+
+def test_drop_policies():
+    '''Check that when the queue is full:
+
+    1) 'drop_newest' discards the message being sent
+    2) 'drop_oldest' discards the message at the front of the queue to make room for the one being sent
+    '''
+
+    # (1)
+    dropped = []
+    queue_factory = factory.QueueCommunication(max_size=2, backpressure=backpressure.DropNewest(dropped.append))
+    parent = queue_factory.parent()
+    child = queue_factory.child()
+    assert [parent.put(parent.conn, parent.encode(parent.build_message(mpq_protocol.REQ_DO, data=value)))
+            for value in range(3)] == [backpressure.SEND_OK, backpressure.SEND_OK, backpressure.SEND_DROPPED]
+    assert [mpq_protocol.Message.decode(frame).data for frame in dropped] == [2]
+    assert [child.receive(timeout=1)[DATA] for _ in range(2)] == [0, 1]
+
+    # (2)
+    queue_factory = factory.QueueCommunication(max_size=2, backpressure='drop_oldest')
+    parent = queue_factory.parent()
+    child = queue_factory.child()
+    for value in range(4):
+        parent.send(mpq_protocol.REQ_DO, data=value)
+    assert [child.receive(timeout=1)[DATA] for _ in range(2)] == [2, 3]
+    assert child.receive() is False
+    parent.queue_join()
+
+    with pytest.raises(ValueError):
+        factory.QueueCommunication(backpressure='wait').parent()
+
+
+def test_try_send_flushes_the_outbox_first():
+    '''Check that messages buffered for a batch are sent before the one passed to 'try_send'
+    '''
+
+    queue_factory = factory.QueueCommunication(batch_size=10)
+    parent = queue_factory.parent()
+    child = queue_factory.child()
+
+    parent.send(mpq_protocol.REQ_DO, data=1)
+    assert parent.try_send(mpq_protocol.REQ_DO, data=2) == backpressure.SEND_OK
+    assert [child.receive(timeout=1)[DATA] for _ in range(2)] == [1, 2]
+    parent.queue_join()
+
+
+def test_watermarks_fire_once_per_crossing():
+    '''Check that the high watermark callback fires once when the queue fills up and the low one once after it has
+    been drained
+    '''
+
+    events = []
+    watermarks = backpressure.Watermarks(3, 1, on_high=lambda peer, depth: events.append(('high', depth)),
+                                         on_low=lambda peer, depth: events.append(('low', depth)))
+    queue_factory = factory.QueueCommunication(watermarks=watermarks)
+    parent = queue_factory.parent()
+    child = queue_factory.child()
+    try:
+        parent.conn.qsize()
+    except NotImplementedError:
+        pytest.skip('Queue.qsize is not available on this platform')
+
+    for value in range(5):
+        parent.send(mpq_protocol.REQ_DO, data=value)
+    assert events == [('high', 3)]
+    for _ in range(3):
+        child.receive(timeout=1)
+    assert events == [('high', 3)]
+    child.receive(timeout=1)  # The queue drains to the low watermark as the message is fetched
+    assert events == [('high', 3), ('low', 1)]
+    child.receive(timeout=1)
+    assert events == [('high', 3), ('low', 1)]
+
+
+def drain_queue(q_factory, messages):
+    child = q_factory.child()
+    for _ in range(messages):
+        child.receive(timeout=5)
+
+
+def test_producer_hears_of_a_queue_drained_by_another_process():
+    '''Check that a producer that stops sending once the high watermark is reached is told when the queue falls to the
+    low watermark, even though another process drains it
+    '''
+
+    events = []
+    watermarks = backpressure.Watermarks(3, 1, on_high=lambda peer, depth: events.append('high'),
+                                         on_low=lambda peer, depth: events.append('low'))
+    queue_factory = factory.QueueCommunication(watermarks=watermarks)
+    parent = queue_factory.parent()
+    try:
+        parent.conn.qsize()
+    except NotImplementedError:
+        pytest.skip('Queue.qsize is not available on this platform')
+
+    for value in range(3):
+        parent.send(mpq_protocol.REQ_DO, data=value)
+    assert events == ['high']
+    process = multiprocessing.Process(target=drain_queue, args=(queue_factory, 3))
+    process.start()
+    process.join()
+    loops = 100
+    while loops and events == ['high']:
+        loops -= 1
+        time.sleep(0.01)
+    assert events == ['high', 'low']
+    parent.queue_join()
@@ -0,0 +1,86 @@
+import time
+
+from pymulproc import mpq_protocol, factory
+
+REQUEST = mpq_protocol.S_PID_OFFSET - 1
+DATA = mpq_protocol.S_PID_OFFSET + 2
+
+
+def test_pipe_send_many_travels_as_a_single_frame():
+    '''Check that send_many puts a single frame down the PIPE and that the other end gets back every message in order
+    '''
+
+    pipe_factory = factory.PipeCommunication()
+    parent = pipe_factory.parent()
+    child = pipe_factory.child()
+
+    child.send_many([(mpq_protocol.REQ_DO, None, None, value) for value in range(5)])
+    frame = mpq_protocol.Message.decode(parent.conn.recv_bytes())
+    assert frame.request == mpq_protocol.REQ_BATCH
+    assert [mpq_protocol.Message.decode(item).data for item in frame.data] == list(range(5))
+    assert parent.conn.poll() is False
+
+    child.send_many([(mpq_protocol.REQ_DO, None, None, value) for value in range(5)])
+    messages = parent.receive_many(10, timeout=1)
+    assert [message[DATA] for message in messages] == list(range(5))
+    assert parent.receive() is False
+
+
+def test_send_buffers_until_batch_is_full():
+    '''Check that with a batch size:
+
+    1) 'send' buffers messages until the batch is full and then sends them as one frame
+    2) a buffered message is flushed by the next 'send' once the linger window has elapsed
+    3) 'receive' flushes whatever is buffered before checking for messages
+    '''
+
+    pipe_factory = factory.PipeCommunication(batch_size=3, linger=10)
+    parent = pipe_factory.parent()
+    child = pipe_factory.child()
+
+    # (1)
+    child.send(mpq_protocol.REQ_DO, data=1)
+    child.send(mpq_protocol.REQ_DO, data=2)
+    assert not parent.conn.poll()
+    child.send(mpq_protocol.REQ_DO, data=3)
+    assert [message[DATA] for message in parent.receive_many(3, timeout=1)] == [1, 2, 3]
+
+    # (2)
+    child = pipe_factory.child(linger=0.1)
+    child.send(mpq_protocol.REQ_DO, data=1)
+    time.sleep(0.1)
+    child.send(mpq_protocol.REQ_DO, data=2)
+    assert [message[DATA] for message in parent.receive_many(3, timeout=1)] == [1, 2]
+
+    # (3)
+    child = pipe_factory.child()
+    child.send(mpq_protocol.REQ_DO, data=1)
+    assert child.receive() is False
+    assert parent.receive(timeout=1)[DATA] == 1
+
+
+def test_queue_send_many_groups_messages_per_mailbox():
+    '''Check that in routed mode send_many puts one frame per destination queue and that the shared queue frame is
+    filtered message by message: those rejected by 'func' are requeued on their own
+    '''
+
+    queue_factory = factory.QueueCommunication(routed=True, max_peers=1)
+    parent = queue_factory.parent()
+    parent.send_many([
+        (mpq_protocol.REQ_DO, None, parent.pid, 1),
+        (mpq_protocol.REQ_DO, None, None, 2),
+        (mpq_protocol.REQ_DO, None, parent.pid, 3),
+        (mpq_protocol.REQ_DO, None, None, 4),
+    ])
+    time.sleep(0.1)
+    frame = mpq_protocol.Message.decode(parent.mailbox.get(timeout=1))
+    parent.mailbox.task_done()
+    assert frame.request == mpq_protocol.REQ_BATCH
+    assert [mpq_protocol.Message.decode(item).data for item in frame.data] == [1, 3]
+
+    messages = parent.receive_many(10, func=lambda message: message[DATA] == 2)
+    assert [message[DATA] for message in messages] == [2]
+    time.sleep(0.1)
+    message = parent.receive(timeout=1)
+    assert message[REQUEST] == mpq_protocol.REQ_DO and message[DATA] == 4
+    parent.queue_join()
@@ -0,0 +1,67 @@
+import os
+import pytest
+
+from pymulproc import compression, errors, factory, mpq_protocol
+
+DATA = mpq_protocol.S_PID_OFFSET + 2
+TEXT = {'rows': [{'name': f"row {value}", 'tags': ['alpha', 'beta']} for value in range(500)]}
+
+
+@pytest.mark.parametrize('codec', [
+    'zlib',
+    'lzma',
+    pytest.param('lz4', marks=pytest.mark.skipif(compression.lz4 is None, reason='lz4 is not installed')),
+    pytest.param('zstd', marks=pytest.mark.skipif(compression.zstandard is None, reason='zstandard is not installed')),
+])
+def test_compressed_payloads_round_trip_on_both_backends(codec):
+    '''Check that payloads above the threshold are compressed, flagged in the frame and decompressed by a receiving
+    end that was not told about compression, batches and requeued messages included
+    '''
+
+    for comm_factory in (factory.PipeCommunication(), factory.QueueCommunication()):
+        parent = comm_factory.parent()
+        child = comm_factory.child(compression=codec, compression_threshold=1024)
+        child.send(mpq_protocol.REQ_DO, data=TEXT)
+        assert parent.receive(timeout=1)[DATA] == TEXT
+        child.send_many([(mpq_protocol.REQ_DO, None, None, TEXT)] * 2)
+        assert [message[DATA] for message in parent.receive_many(2, timeout=1)] == [TEXT] * 2
+
+    queue_factory = factory.QueueCommunication()
+    parent = queue_factory.parent()
+    child = queue_factory.child(compression=codec, compression_threshold=1024)
+    child.send(mpq_protocol.REQ_DO, recipient_pid=child.pid + 1, data=TEXT)
+    assert not parent.receive(timeout=1, func=lambda message: message.recipient_pid == parent.pid)
+    message = child.receive(timeout=1, func=lambda message: message.recipient_pid == child.pid + 1)
+    assert message[DATA] == TEXT and not message.headers
+
+    compressor = compression.get_compressor(codec)
+    frame = mpq_protocol.Message(mpq_protocol.REQ_DO, 1, None, TEXT).encode(compressor=compressor)
+    assert mpq_protocol.read_headers(frame) == {'compression': compressor.codec}
+    assert len(frame) < len(mpq_protocol.Message(mpq_protocol.REQ_DO, 1, None, TEXT).encode())
+
+
+def test_compression_only_applies_when_it_pays_off():
+    '''Check that:
+
+    1) payloads below the threshold travel as they are
+    2) payloads that do not get smaller travel as they are
+    3) unknown compressors are rejected, and so are frames flagged with an unknown codec
+    '''
+
+    compressor = compression.get_compressor('zlib')
+
+    # (1)
+    frame = mpq_protocol.Message(mpq_protocol.REQ_DO, data='small').encode(compressor=compressor)
+    assert not mpq_protocol.read_headers(frame)
+
+    # (2)
+    frame = mpq_protocol.Message(mpq_protocol.REQ_DO, data=os.urandom(10000)).encode(compressor=compressor,
+                                                                                      threshold=0)
+    assert not mpq_protocol.read_headers(frame)
+
+    # (3)
+    with pytest.raises(ValueError):
+        compression.get_compressor('brotli')
+    frame = mpq_protocol.Message(mpq_protocol.REQ_DO, data=TEXT, headers={'compression': 99}).encode()
+    with pytest.raises(errors.ProtocolError):
+        mpq_protocol.Message.decode(frame)
@@ -0,0 +1,103 @@
+import os
+import time
+
+from pymulproc import deadletter, factory, mpq_protocol, supervisor
+
+DATA = mpq_protocol.S_PID_OFFSET + 2
+
+
+def idle(comm_factory):
+    '''Die straight away'''
+    pass
+
+
+def test_ttl_sets_deadline_unless_given():
+    '''Check that the ttl of a peer only applies to messages that have no deadline of their own
+    '''
+
+    pipe_factory = factory.PipeCommunication(ttl=60)
+    parent, child = pipe_factory.parent(), pipe_factory.child()
+    parent.send(mpq_protocol.REQ_DO, data='ttl')
+    parent.send(mpq_protocol.REQ_DO, data='own', headers={'deadline': time.time() + 3600})
+    first, second = child.receive(), child.receive()
+    assert time.time() < first.deadline <= time.time() + 60
+    assert second.deadline > time.time() + 60
+    assert not first.expired() and first.expired(now=first.deadline)
+
+
+def test_expired_messages_are_dead_lettered():
+    '''Check that a message received after its deadline is never returned but put into the dead letter channel
+    '''
+
+    pipe_factory = factory.PipeCommunication(dead_letters=True)
+    parent, child = pipe_factory.parent(), pipe_factory.child()
+    parent.send(mpq_protocol.REQ_DO, data='late', headers={'deadline': time.time() - 1})
+    parent.send(mpq_protocol.REQ_DO, data='on time', headers={'deadline': time.time() + 60})
+    assert child.receive() is False
+    assert child.receive()[DATA] == 'on time'
+    [(reason, message)] = pipe_factory.dead_letters.messages(timeout=1)
+    assert reason == deadletter.EXPIRED and message[DATA] == 'late'
+
+
+def test_expired_messages_are_not_requeued():
+    '''Check that an expired message in the shared queue is dead-lettered by whoever fetches it, rather than put back
+    for its recipient, so that the queue can be joined
+    '''
+
+    queue_factory = factory.QueueCommunication(ttl=0, dead_letters=True, batch_size=2)
+    parent, child = queue_factory.parent(), queue_factory.child()
+    parent.send(mpq_protocol.REQ_DO, recipient_pid=os.getpid() + 1, data='first')
+    parent.send(mpq_protocol.REQ_DO, recipient_pid=os.getpid() + 1, data='second')
+    parent.send(mpq_protocol.REQ_DO, recipient_pid=os.getpid() + 1, data='third')
+    parent.flush()
+    func = lambda message: message.recipient_pid == os.getpid()
+    letters = []
+    start = time.monotonic()
+    while len(letters) < 3 and time.monotonic() - start < 5:
+        assert child.receive(timeout=0.1, func=func) is False
+        letters += queue_factory.dead_letters.messages(timeout=0.1)
+    child.queue_join()
+    assert [(reason, message[DATA]) for reason, message in letters] == [(deadletter.EXPIRED, data) for data in
+                                                                        ('first', 'second', 'third')]
+
+
+def test_dropped_messages_are_dead_lettered():
+    '''Check that messages discarded by a backpressure policy end up in the dead letter channel
+    '''
+
+    queue_factory = factory.QueueCommunication(max_size=1, backpressure='drop_newest', dead_letters=True)
+    parent = queue_factory.parent()
+    parent.send(mpq_protocol.REQ_DO, data='kept')
+    parent.send(mpq_protocol.REQ_DO, data='dropped')
+    [(reason, message)] = queue_factory.dead_letters.messages(timeout=1)
+    assert reason == deadletter.DROPPED and message[DATA] == 'dropped'
+    assert queue_factory.child().receive(timeout=1)[DATA] == 'kept'
+
+
+def test_messages_to_dead_recipient_are_dead_lettered():
+    '''Check that the supervisor puts the messages addressed to a child that died into the dead letter channel
+    '''
+
+    queue_factory = factory.QueueCommunication(dead_letters=True)
+    parent = supervisor.Supervisor(queue_factory, idle, restart=False)
+    parent.start()
+    dead_pid = next(iter(parent.children))
+    parent.peer.send(mpq_protocol.REQ_DO, recipient_pid=dead_pid, data='orphan')
+    start = time.monotonic()
+    while parent.children and time.monotonic() - start < 5:
+        parent.receive(timeout=0.1, func=lambda message: False)
+    [(reason, message)] = queue_factory.dead_letters.messages(timeout=1)
+    assert reason == deadletter.DEAD_RECIPIENT and message[DATA] == 'orphan'
+    parent.peer.queue_join()
+
+
+def test_dead_letter_channel_is_bounded():
+    '''Check that once the channel is full new dead letters are discarded
+    '''
+
+    channel = deadletter.DeadLetterChannel(max_size=2)
+    frames = [mpq_protocol.Message(mpq_protocol.REQ_DO, 1, None, data).encode() for data in range(3)]
+    for frame in frames:
+        channel.put(frame, deadletter.DROPPED)
+    assert [message[DATA] for _, message in channel.messages(timeout=1)] == [0, 1]
+    assert channel.get() is None
@@ -0,0 +1,71 @@
+import os
+
+from pymulproc import factory, mpq_protocol, routing
+
+DATA = mpq_protocol.S_PID_OFFSET + 2
+
+loads = []
+
+
+class Payload:
+    '''Payload that records each time it is unpickled'''
+
+    def __init__(self, value):
+        self.value = value
+
+    def __setstate__(self, state):
+        loads.append(state['value'])
+        self.__dict__.update(state)
+
+
+def test_view_unpacks_data_on_access():
+    '''Check that a view exposes the header fields of a frame and only deserializes its data when accessed
+    '''
+
+    loads.clear()
+    frame = mpq_protocol.Message(mpq_protocol.REQ_DO, 1, 2, Payload('view'), {'topic': 'orders'}).encode()
+    view = mpq_protocol.MessageView(frame)
+    assert (view.request, view.sender_pid, view.recipient_pid, view.topic) == (mpq_protocol.REQ_DO, 1, 2, 'orders')
+    assert not loads
+    assert view.data.value == 'view' and view[DATA] is view.data
+    assert loads == ['view']
+    assert mpq_protocol.Message.decode(frame).data.value == 'view'
+
+
+def test_rejected_messages_are_requeued_untouched():
+    '''Check that filtered receive only deserializes the payload of the message it accepts, and puts back the rejected
+    one as the very same frame
+    '''
+
+    loads.clear()
+    queue_factory = factory.QueueCommunication(batch_size=2)
+    parent, child = queue_factory.parent(), queue_factory.child()
+    parent.send(mpq_protocol.REQ_DO, recipient_pid=os.getpid() + 1, data=Payload('other'))
+    parent.send(mpq_protocol.REQ_DO, recipient_pid=os.getpid(), data=Payload('ours'))
+    parent.send(mpq_protocol.REQ_DO, recipient_pid=os.getpid() + 1, data=Payload('single'))
+    parent.flush()
+    message = child.receive(timeout=1, func=lambda message: message.recipient_pid == os.getpid())
+    assert message[DATA].value == 'ours' and isinstance(message, mpq_protocol.Message)
+    assert not isinstance(message, mpq_protocol.MessageView)
+    routing.wait_readable(queue_factory.lanes, 1)
+    assert not child.receive(func=lambda message: message.recipient_pid == os.getpid())
+    assert loads == ['ours']
+
+    requeued = [queue_factory.lanes[0].get(timeout=1) for _ in range(2)]
+    for _ in requeued:
+        queue_factory.lanes[0].task_done()
+    expected = [parent.encode(mpq_protocol.Message(mpq_protocol.REQ_DO, os.getpid(), os.getpid() + 1, Payload(data)))
+                for data in ('other', 'single')]
+    assert requeued == expected
+    child.queue_join()
+
+
+def test_predicate_may_look_at_data():
+    '''Check that a predicate looking at the data still gets it
+    '''
+
+    queue_factory = factory.QueueCommunication()
+    parent, child = queue_factory.parent(), queue_factory.child()
+    parent.send(mpq_protocol.REQ_DO, data={'priority': 'high'})
+    message = child.receive(timeout=1, func=lambda message: message.data['priority'] == 'high')
+    assert message[DATA] == {'priority': 'high'}
@@ -0,0 +1,94 @@
+import pytest
+
+from pymulproc import errors, factory, metrics, mpq_protocol, routing
+
+
+def test_metrics_are_disabled_by_default():
+    '''Check that peers keep no metrics unless asked to
+    '''
+
+    pipe_factory = factory.PipeCommunication()
+    parent = pipe_factory.parent()
+    parent.send(mpq_protocol.REQ_DO)
+    assert parent.metrics is None
+    assert parent.stats() == {}
+
+
+def test_pipe_counters_and_latencies():
+    '''Check that messages, frames and bytes are counted on both ends - a batch being a single frame - and that the
+    latency of every send and of every receive returning a message is observed
+    '''
+
+    pipe_factory = factory.PipeCommunication(metrics=True)
+    parent = pipe_factory.parent()
+    child = pipe_factory.child()
+
+    child.send(mpq_protocol.REQ_DO, data=b'x' * 100)
+    child.send_many([(mpq_protocol.REQ_DO, None, None, value) for value in range(4)])
+    assert len(parent.receive_many(10, timeout=1)) == 5
+    assert parent.receive() is False
+
+    sent, received = child.stats(), parent.stats()
+    assert (sent['messages_sent'], sent['frames_sent']) == (5, 2)
+    assert sent['bytes_sent'] == received['bytes_received'] > 100
+    assert received['messages_received'] == 5
+    assert sent['send_latency']['count'] == 1
+    assert received['receive_latency']['count'] == 5
+    assert received['transit_latency']['count'] == 5
+    assert sent['transit_latency']['count'] == 0
+
+
+def test_queue_requeues_and_retries_are_counted():
+    '''Check that messages rejected by 'func' count as requeued and that each failed attempt to put a message into a
+    full queue counts as a retry
+    '''
+
+    queue_factory = factory.QueueCommunication(max_size=1, metrics=True)
+    parent = queue_factory.parent(timeout=0.01, loops=3)
+    child = queue_factory.child()
+
+    parent.send(mpq_protocol.REQ_DO, recipient_pid=child.pid + 1)
+    routing.wait_readable([queue_factory.queue], 1)
+    assert child.receive(func=lambda x: x.recipient_pid == child.pid) is False
+    assert child.stats()['requeued'] == 1
+
+    with pytest.raises(errors.QueuesCommunicationError):
+        parent.send(mpq_protocol.REQ_DO)
+    assert parent.stats()['retries'] == 2
+    assert parent.stats()['queue_depth']['count'] == 1
+
+
+def test_factory_metrics_are_kept_per_peer():
+    '''Check that metrics given to a factory are cloned for each peer, so that peers of the same process do not mix
+    their counts, while metrics given to a peer are its own
+    '''
+
+    events = []
+    template = metrics.PeerMetrics(lambda name, value: events.append(name))
+    pipe_factory = factory.PipeCommunication(metrics=template)
+    parent, child = pipe_factory.parent(), pipe_factory.child()
+    assert parent.metrics is not child.metrics and template not in (parent.metrics, child.metrics)
+
+    child.send(mpq_protocol.REQ_DO)
+    assert parent.receive(timeout=1)
+    assert (child.stats()['messages_sent'], child.stats()['messages_received']) == (1, 0)
+    assert (parent.stats()['messages_sent'], parent.stats()['messages_received']) == (0, 1)
+    assert template.snapshot()['messages_sent'] == 0 and 'messages_sent' in events
+    assert pipe_factory.parent(metrics=template).metrics is template
+
+
+def test_hook_and_prometheus_export():
+    '''Check that the hook gets every observation and that the snapshot renders in the Prometheus text format
+    '''
+
+    events = []
+    pipe_factory = factory.PipeCommunication()
+    parent = pipe_factory.parent(metrics=metrics.PeerMetrics(lambda name, value: events.append(name)))
+    pipe_factory.child().send(mpq_protocol.REQ_DO)
+    parent.receive(timeout=1)
+    assert events == ['messages_received', 'bytes_received', 'receive_latency']
+
+    text = metrics.prometheus(parent.stats(), pid=parent.pid)
+    assert f'pymulproc_messages_received_total{{pid="{parent.pid}"}} 1' in text
+    assert f'pymulproc_receive_latency_bucket{{pid="{parent.pid}",le="+Inf"}} 1' in text
+    assert f'pymulproc_receive_latency_count{{pid="{parent.pid}"}} 1' in text
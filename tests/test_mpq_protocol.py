@@ -0,0 +1,75 @@
+import pytest
+
+from pymulproc import errors
+from pymulproc import mpq_protocol
+
+
+def test_message_behaves_as_the_list_based_structure():
+    '''Check that a Message can still be accessed by position and compared against the list it replaces
+    '''
+
+    message = mpq_protocol.Message(mpq_protocol.REQ_DO, 1234, 12345, {'value': 20})
+    assert len(message) == 4
+    assert message[mpq_protocol.S_PID_OFFSET - 1] == mpq_protocol.REQ_DO
+    assert message[mpq_protocol.S_PID_OFFSET] == 1234
+    assert message[mpq_protocol.R_PID_OFFSET] == 12345
+    assert message[mpq_protocol.S_PID_OFFSET + 2] == {'value': 20}
+    assert message == ['DO', 1234, 12345, {'value': 20}]
+    assert not hasattr(message, '__dict__')
+
+
+@pytest.mark.parametrize('message', [
+    mpq_protocol.Message(mpq_protocol.REQ_DO, 1234, 12345, {'value': 20}),
+    mpq_protocol.Message(mpq_protocol.REQ_DIE, 1234),
+    mpq_protocol.Message('CUSTOM REQUEST', None, 0, b''),
+    mpq_protocol.Message(mpq_protocol.REQ_FINISHED, 1234, None, 0),
+])
+def test_encode_decode_round_trip(message):
+    '''Check that every message, including those with custom requests and falsy fields, survives the wire format
+    '''
+
+    assert mpq_protocol.Message.decode(message.encode()) == message
+
+
+def test_header_is_compact_and_readable_on_its_own():
+    '''Check that standard requests take no room besides the fixed header and that the header can be read without
+    unpickling the payload
+    '''
+
+    frame = mpq_protocol.Message(mpq_protocol.REQ_DIE, 1234).encode()
+    assert len(frame) == mpq_protocol.HEADER.size
+
+    frame = mpq_protocol.Message(mpq_protocol.REQ_DO, 1234, 12345, b'x' * 100).encode()
+    request, sender_pid, recipient_pid, offset, length = mpq_protocol.read_header(frame)
+    assert (request, sender_pid, recipient_pid) == (mpq_protocol.REQ_DO, 1234, 12345)
+    assert offset + length == len(frame)
+
+
+def test_malformed_frames_fail_loudly():
+    '''Check that too short frames, unknown versions and too long requests raise a ProtocolError
+    '''
+
+    with pytest.raises(errors.ProtocolError):
+        mpq_protocol.read_header(b'\x01')
+
+    frame = bytearray(mpq_protocol.Message(mpq_protocol.REQ_DIE, 1234).encode())
+    frame[0] = mpq_protocol.WIRE_VERSION + 1
+    with pytest.raises(errors.ProtocolError):
+        mpq_protocol.read_header(frame)
+
+    with pytest.raises(errors.ProtocolError):
+        mpq_protocol.Message('X' * 256).encode()
+
+
+def test_optional_headers_round_trip():
+    '''Check that optional headers survive the wire format and that the header is read without the payload
+    '''
+
+    message = mpq_protocol.Message(mpq_protocol.REQ_PUBLISH, 1234, None, [1, 2], {'topic': 'prices'})
+    frame = message.encode()
+    assert mpq_protocol.read_headers(frame) == {'topic': 'prices'}
+    assert mpq_protocol.read_header(frame)[:3] == (mpq_protocol.REQ_PUBLISH, 1234, None)
+    decoded = mpq_protocol.Message.decode(frame)
+    assert decoded == message and decoded.topic == 'prices'
+    assert mpq_protocol.Message.decode(mpq_protocol.Message('CUSTOM', 1, headers={'topic': 't'}).encode()).request == \
+        'CUSTOM'
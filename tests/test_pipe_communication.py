@@ -1,7 +1,8 @@
 import multiprocessing
 import sys
+import time
 
-from pymulproc import mpq_protocol, factory
+from pymulproc import mpq_protocol, factory, interfaces
 
 
 def test_local_pipe_communication():
@@ -46,3 +47,49 @@ def test_local_pipe_communication():
     parent.send(mpq_protocol.REQ_TEST_CHILD)
     child_process.join()
     assert child_process.exitcode == 0
+
+
+def test_receive_with_timeout():
+    '''Check that:
+
+    1) receive returns False straight away when nothing is in the PIPE
+    2) receive with a timeout waits for such amount of time before returning False
+    3) a blocking receive wakes up as soon as the other end sends a message
+    '''
+
+    pipe_factory = factory.PipeCommunication()
+    parent = pipe_factory.parent()
+
+    # (1)
+    start = time.monotonic()
+    assert parent.receive() is False
+    assert time.monotonic() - start < 0.1
+
+    # (2)
+    start = time.monotonic()
+    assert parent.receive(timeout=0.2) is False
+    assert time.monotonic() - start >= 0.2
+
+    # (3)
+    def call_child(p_factory):
+        time.sleep(0.2)
+        p_factory.child().send(mpq_protocol.REQ_TEST_PARENT)
+
+    child_process = multiprocessing.Process(target=call_child, args=(pipe_factory,))
+    child_process.start()
+    message = parent.receive(block=True)
+    assert message[mpq_protocol.S_PID_OFFSET - 1] == mpq_protocol.REQ_TEST_PARENT
+    child_process.join()
+
+
+def test_wait_any():
+    '''Check that wait_any returns only the peers with a message ready and an empty list once the timeout expires
+    '''
+
+    pipe_factories = [factory.PipeCommunication() for _ in range(3)]
+    parents = [pipe_factory.parent() for pipe_factory in pipe_factories]
+    assert interfaces.wait_any(parents, timeout=0.1) == []
+
+    pipe_factories[1].child().send(mpq_protocol.REQ_FINISHED)
+    pipe_factories[2].child().send(mpq_protocol.REQ_FINISHED)
+    assert interfaces.wait_any(parents, timeout=1) == parents[1:]
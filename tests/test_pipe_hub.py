@@ -0,0 +1,119 @@
+import pytest
+import multiprocessing
+
+from pymulproc import errors
+from pymulproc import mpq_protocol, factory, shm
+
+
+def call_child(hub, parent_pid):
+    '''Answer every DO request with our own PID until told to die, which is answered too
+    '''
+    child = hub.child()
+    child.send(mpq_protocol.REQ_TEST_CHILD)
+    stop = False
+    while not stop:
+        message = child.receive(timeout=5)
+        if not message:
+            break
+        stop = message.request == mpq_protocol.REQ_DIE
+        child.send(mpq_protocol.REQ_FINISHED, recipient_pid=parent_pid, data=message.request)
+
+
+def measure_broadcast(hub, parent_pid):
+    '''Send back the length of the first message received
+    '''
+    child = hub.child()
+    child.send(mpq_protocol.REQ_TEST_CHILD)
+    message = child.receive(timeout=5)
+    child.send(mpq_protocol.REQ_FINISHED, recipient_pid=parent_pid, data=len(message.data))
+
+
+def test_hub_routes_addressed_messages_and_broadcasts_the_rest():
+    '''Check that:
+
+    1) The parent fans in the messages of all children
+    2) A message addressed to a child goes only down its PIPE
+    3) A message with no recipient reaches every child once
+    '''
+
+    num_children = 4
+    hub = factory.PipeHub(max_children=num_children)
+    parent = hub.parent()
+    child_processes = [multiprocessing.Process(target=call_child, args=(hub, parent.pid))
+                       for _ in range(num_children)]
+    for child_process in child_processes:
+        child_process.start()
+
+    # (1)
+    pids = {parent.receive(timeout=5).sender_pid for _ in child_processes}
+    assert pids == {child_process.pid for child_process in child_processes}
+
+    # (2)
+    target = child_processes[1].pid
+    parent.send(mpq_protocol.REQ_DO, recipient_pid=target)
+    message = parent.receive(timeout=5)
+    assert (message.sender_pid, message.data) == (target, mpq_protocol.REQ_DO)
+    assert parent.receive(timeout=0.2) is False
+
+    # (3)
+    parent.send(mpq_protocol.REQ_DIE)
+    answers = [parent.receive(timeout=5) for _ in child_processes]
+    assert sorted(message.sender_pid for message in answers) == sorted(pids)
+    assert all(message.data == mpq_protocol.REQ_DIE for message in answers)
+    for child_process in child_processes:
+        child_process.join()
+        assert child_process.exitcode == 0
+
+
+def test_hub_takes_turns_among_children():
+    '''Check that a child flooding the hub does not starve another one
+    '''
+
+    hub = factory.PipeHub(max_children=2)
+    parent = hub.parent()
+    first, second = hub.child_conns
+    hub.registry.register(1)
+    hub.registry.register(2)
+    for value in range(10):
+        first.send_bytes(mpq_protocol.Message(mpq_protocol.REQ_DO, 1, None, value).encode())
+    second.send_bytes(mpq_protocol.Message(mpq_protocol.REQ_DO, 2).encode())
+    assert {parent.receive().sender_pid for _ in range(2)} == {1, 2}
+
+
+def test_hub_refuses_unknown_recipients():
+    '''Check that a message can not be sent to a process with no PIPE and that messages batched for several children
+    are split per PIPE
+    '''
+
+    hub = factory.PipeHub(max_children=2)
+    parent = hub.parent()
+    with pytest.raises(errors.PipeHubCommunicationError):
+        parent.send(mpq_protocol.REQ_DO, recipient_pid=1122)
+
+    hub.registry.register(1)
+    hub.registry.register(2)
+    parent.send_many([(mpq_protocol.REQ_DO, None, 1, 'a'), (mpq_protocol.REQ_DO, None, None, 'b')])
+    first, second = hub.child_conns
+    assert mpq_protocol.Message.decode(first.recv_bytes()).request == mpq_protocol.REQ_BATCH
+    assert mpq_protocol.Message.decode(second.recv_bytes()).data == 'b'
+
+
+@pytest.mark.skipif(not shm.SUPPORTED, reason='shared memory is not supported here')
+def test_hub_broadcasts_large_payloads_to_every_child():
+    '''Check that a payload over the shared memory threshold broadcast to several children reaches all of them, rather
+    than a single segment being released by the first one
+    '''
+
+    hub = factory.PipeHub(max_children=2, shm_threshold=1024)
+    parent = hub.parent()
+    child_processes = [multiprocessing.Process(target=measure_broadcast, args=(hub, parent.pid)) for _ in range(2)]
+    for child_process in child_processes:
+        child_process.start()
+    for _ in child_processes:
+        assert parent.receive(timeout=5).request == mpq_protocol.REQ_TEST_CHILD
+
+    parent.send(mpq_protocol.REQ_DO, data=b'x' * 4096)
+    assert [parent.receive(timeout=5).data for _ in child_processes] == [4096, 4096]
+    for child_process in child_processes:
+        child_process.join()
+        assert child_process.exitcode == 0
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+from pymulproc import factory, mpq_protocol, placement, pool
+
+NODES = [[0, 1, 2, 3], [4, 5, 6, 7]]
+
+
+def report_affinity(comm_factory):
+    '''Send the CPUs we may run on to the parent'''
+    comm_factory.child().send(mpq_protocol.REQ_FINISHED, data=sorted(os.sched_getaffinity(0)))
+
+
+def test_parse_cpulist():
+    '''Check that ranges and single CPUs are expanded in order, and that an empty list gives no CPUs
+    '''
+
+    assert placement.parse_cpulist('0-3,8,10-11\n') == [0, 1, 2, 3, 8, 10, 11]
+    assert placement.parse_cpulist('') == []
+
+
+def test_topology_reads_nodes_this_process_may_run_on(tmp_path, monkeypatch):
+    '''Check that the nodes are read in numerical order and only keep the CPUs we are allowed to run on
+    '''
+
+    for node, cpulist in ((0, '0-1'), (1, '2-3'), (10, '4-5')):
+        (tmp_path / f'node{node}').mkdir()
+        (tmp_path / f'node{node}' / 'cpulist').write_text(cpulist + '\n')
+    monkeypatch.setattr(placement, 'NODES_PATH', str(tmp_path))
+    monkeypatch.setattr(placement, 'allowed_cpus', lambda: [0, 1, 2, 4, 5])
+    assert placement.topology() == [[0, 1], [2], [4, 5]]
+    monkeypatch.setattr(placement, 'NODES_PATH', str(tmp_path / 'missing'))
+    assert placement.topology() == [[0, 1, 2, 4, 5]]
+
+
+def test_plan_policies():
+    '''Check that:
+
+    1) each policy hands out the CPUs of the nodes in its own order
+    2) CPUs are reused once every one has been given out
+    3) an unknown policy is rejected
+    '''
+
+    # (1)
+    assert placement.plan(3, placement.COMPACT, NODES) == [{0}, {1}, {2}]
+    assert placement.plan(3, placement.SPREAD, NODES) == [{0}, {4}, {1}]
+    assert placement.plan(3, placement.PER_NODE, NODES) == [set(NODES[0]), set(NODES[1]), set(NODES[0])]
+
+    # (2)
+    assert placement.plan(10, placement.COMPACT, NODES)[8:] == [{0}, {1}]
+
+    # (3)
+    with pytest.raises(ValueError):
+        placement.plan(1, 'scatter', NODES)
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_setaffinity'), reason='CPU affinity is not supported here')
+def test_workers_are_pinned_before_running():
+    '''Check that each worker runs pinned to the CPUs the plan gives it
+    '''
+
+    queue_factory = factory.QueueCommunication()
+    parent = queue_factory.parent()
+    processes = placement.workers(report_affinity, (queue_factory, ), 2, placement.SPREAD)
+    for process in processes:
+        process.start()
+    reported = sorted(parent.receive(timeout=5).data for _ in processes)
+    for process in processes:
+        process.join()
+    assert reported == sorted(sorted(cpus) for cpus in placement.plan(2, placement.SPREAD))
+
+
+def test_workers_default_to_the_cpus_this_process_may_run_on(monkeypatch):
+    '''Check that as many workers as CPUs this process may run on are created when no amount is given
+    '''
+
+    monkeypatch.setattr(placement, 'allowed_cpus', lambda: [1, 3, 5])
+    assert len(placement.workers(abs, policy=None)) == 3
+
+
+def test_pool_with_affinity():
+    '''Check that a pool whose workers are pinned runs tasks as any other pool
+    '''
+
+    with pool.WorkerPool(processes=2, affinity=placement.COMPACT) as workers:
+        assert workers.map(abs, [-1, -2, 3]) == [1, 2, 3]
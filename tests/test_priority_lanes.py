@@ -0,0 +1,67 @@
+import time
+
+from pymulproc import factory, mpq_protocol, queuepi
+
+REQUEST = mpq_protocol.S_PID_OFFSET - 1
+DATA = mpq_protocol.S_PID_OFFSET + 2
+
+
+def test_control_requests_overtake_queued_work():
+    '''Check that a REQ_DIE sent after plenty of REQ_DO work is received first, both through the shared queue and
+    through the mailboxes in routed mode
+    '''
+
+    for queue_factory in (factory.QueueCommunication(lanes=2),
+                          factory.QueueCommunication(lanes=2, routed=True, max_peers=2)):
+        parent = queue_factory.parent()
+        child = queue_factory.child()
+        for value in range(50):
+            parent.send(mpq_protocol.REQ_DO, recipient_pid=child.pid, data=value)
+        parent.send(mpq_protocol.REQ_DIE, recipient_pid=child.pid)
+        time.sleep(0.1)
+
+        assert child.receive(timeout=1)[REQUEST] == mpq_protocol.REQ_DIE
+        assert [child.receive(timeout=1)[DATA] for _ in range(50)] == list(range(50))
+        parent.queue_join()
+
+
+def test_explicit_priorities_and_requeue_keep_their_lane():
+    '''Check that:
+
+    1) messages are received in order of the priority passed to 'send', lowest number first
+    2) a message not meeting the 'func' criteria is requeued into the lane it came from
+    '''
+
+    queue_factory = factory.QueueCommunication(lanes=3)
+    parent = queue_factory.parent()
+    child = queue_factory.child()
+
+    # (1)
+    for priority in (2, 1, 0, 5):
+        parent.send(mpq_protocol.REQ_DO, data=priority, priority=priority)
+    time.sleep(0.1)
+    assert [child.receive(timeout=1)[DATA] for _ in range(4)] == [0, 1, 2, 5]
+
+    # (2)
+    parent.send(mpq_protocol.REQ_DO, recipient_pid=1, data='high', priority=0)
+    time.sleep(0.1)
+    assert child.receive(func=lambda x: x.recipient_pid == child.pid) is False
+    time.sleep(0.1)
+    assert not queue_factory.lanes[0].empty() and queue_factory.lanes[2].empty()
+    assert child.receive()[DATA] == 'high'
+
+
+def test_bulk_traffic_is_not_starved():
+    '''Check that lower priority messages are still received while higher priority ones keep coming
+    '''
+
+    queue_factory = factory.QueueCommunication(lanes=2)
+    parent = queue_factory.parent()
+    child = queue_factory.child()
+    parent.send(mpq_protocol.REQ_DO, data='bulk')
+    received = []
+    for _ in range(queuepi.STARVATION_TURNS * 2):
+        parent.send(mpq_protocol.REQ_FINISHED, data='control')
+        time.sleep(0.01)
+        received.append(child.receive(timeout=1)[DATA])
+    assert 'bulk' in received
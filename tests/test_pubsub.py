@@ -0,0 +1,101 @@
+import multiprocessing
+import pytest
+
+from pymulproc import errors, factory, mpq_protocol, routing, shm
+
+REQUEST = mpq_protocol.S_PID_OFFSET - 1
+DATA = mpq_protocol.S_PID_OFFSET + 2
+
+
+def listen(queue_factory, parent_pid, topics):
+    '''Subscribe to the topics, tell the parent and send back every message published until told to die'''
+    child = queue_factory.child()
+    for topic in topics:
+        child.subscribe(topic)
+    child.send(mpq_protocol.REQ_TEST_CHILD, recipient_pid=parent_pid)
+    received = []
+    while True:
+        message = child.receive(block=True)
+        if message[REQUEST] == mpq_protocol.REQ_DIE:
+            break
+        received.append((message.topic, message[DATA]))
+    child.send(mpq_protocol.REQ_FINISHED, recipient_pid=parent_pid, data=(topics, received))
+
+
+def test_messages_are_delivered_only_to_subscribers():
+    '''Check that each child gets a copy of the messages published on the topics it subscribed to and nothing else
+    '''
+
+    queue_factory = factory.QueueCommunication(routed=True, max_peers=4)
+    parent = queue_factory.parent()
+    subscriptions = [('prices', ), ('prices', 'news'), ()]
+    processes = [multiprocessing.Process(target=listen, args=(queue_factory, parent.pid, topics))
+                 for topics in subscriptions]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        assert parent.receive(timeout=5)[REQUEST] == mpq_protocol.REQ_TEST_CHILD
+
+    assert parent.publish('prices', 10) == 2
+    assert parent.publish('news', 'hello') == 1
+    assert parent.publish('weather', 'sunny') == 0
+    for process in processes:
+        parent.send(mpq_protocol.REQ_DIE, recipient_pid=process.pid)
+    reports = dict(parent.receive(timeout=5)[DATA] for _ in processes)
+    for process in processes:
+        process.join()
+
+    assert reports[('prices', )] == [('prices', 10)]
+    assert reports[('prices', 'news')] == [('prices', 10), ('news', 'hello')]
+    assert reports[()] == []
+    assert queue_factory.queue.empty()
+
+
+def test_subscriptions_are_kept_at_the_router():
+    '''Check that subscribing is idempotent, that unsubscribing stops delivery, that the subscription table is bounded
+    and that topics need routed mode
+    '''
+
+    queue_factory = factory.QueueCommunication(routed=True, max_peers=1)
+    peer = queue_factory.parent()
+    peer.subscribe('a')
+    peer.subscribe('a')
+    assert peer.publish('a', 1) == 1
+    assert peer.receive(timeout=1).topic == 'a'
+    peer.unsubscribe('a')
+    assert peer.publish('a', 1) == 0
+
+    for topic in range(routing.MAX_SUBSCRIPTIONS):
+        peer.subscribe(str(topic))
+    with pytest.raises(errors.QueuesCommunicationError):
+        peer.subscribe('one too many')
+
+    with pytest.raises(errors.QueuesCommunicationError):
+        factory.QueueCommunication().parent().subscribe('a')
+
+
+
+@pytest.mark.skipif(not shm.SUPPORTED, reason='shared memory is not supported here')
+def test_large_payloads_reach_every_subscriber():
+    '''Check that a payload over the shared memory threshold published to several subscribers reaches all of them,
+    rather than a single segment being released by the first one
+    '''
+
+    queue_factory = factory.QueueCommunication(routed=True, max_peers=3, shm_threshold=1024)
+    parent = queue_factory.parent()
+    processes = [multiprocessing.Process(target=listen, args=(queue_factory, parent.pid, ('blobs', )))
+                 for _ in range(2)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        assert parent.receive(timeout=5)[REQUEST] == mpq_protocol.REQ_TEST_CHILD
+
+    payload = b'x' * 4096
+    assert parent.publish('blobs', payload) == 2
+    for process in processes:
+        parent.send(mpq_protocol.REQ_DIE, recipient_pid=process.pid)
+    reports = [parent.receive(timeout=5)[DATA] for _ in processes]
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    assert [received for _, received in reports] == [[('blobs', payload)]] * 2
@@ -2,6 +2,7 @@ import pytest
 import time
 import queue
 import multiprocessing
+import threading
 
 from pymulproc import errors
 from pymulproc import mpq_protocol, factory
@@ -30,8 +31,8 @@ def test_queue_api_params():
     with patch.object(parent.conn, 'put') as mock_put:
         parent.send(mpq_protocol.REQ_TEST_PARENT)
 
-    message = [mpq_protocol.REQ_TEST_PARENT, parent.pid, None, None]
-    mock_put.assert_called_with(message, timeout=timeout)
+    message = mpq_protocol.Message(mpq_protocol.REQ_TEST_PARENT, parent.pid, None, None)
+    mock_put.assert_called_with(message.encode(), timeout=timeout)
 
     # (2)
     parent = queue_factory.parent(timeout=timeout, loops=20)
@@ -147,3 +148,53 @@ def test_receive_blocking_when_block_false():
     message = parent.receive(block=True)  # we block for a while
     parent.queue_join()  # if parent did not block in the queue and pick the message we would wait here indefinitely
     assert message is not False
+
+
+def test_receive_with_timeout(test_comm):
+    '''Check that passing a timeout to .receive makes it wait for a message for that amount of time at most, for both
+    the shared queue and the mailboxes in routed mode
+    '''
+
+    start = time.monotonic()
+    assert test_comm.receive(timeout=0.2) is False
+    assert time.monotonic() - start >= 0.2
+
+    queue_factory = factory.QueueCommunication(routed=True, max_peers=1)
+    parent = queue_factory.parent()
+    start = time.monotonic()
+    assert parent.receive(timeout=0.2) is False
+    assert time.monotonic() - start >= 0.2
+
+    parent.send(mpq_protocol.REQ_FINISHED, recipient_pid=parent.pid)
+    message = parent.receive(timeout=1)
+    assert message[mpq_protocol.S_PID_OFFSET - 1] == mpq_protocol.REQ_FINISHED
+    parent.queue_join()
+
+
+def test_blocking_receive_waits_past_rejected_messages():
+    '''Check that a blocking receive with 'func' goes on waiting after requeuing a message that is not for us, for both
+    the shared queue and priority lanes:
+
+    1) A message for us sent after one that is not is returned, the other one staying in the queue
+    2) With nothing but messages for others, False is returned once the timeout expires and not before
+    '''
+
+    for queue_factory in (factory.QueueCommunication(), factory.QueueCommunication(lanes=2)):
+        parent, child = queue_factory.parent(), queue_factory.child()
+        pid = multiprocessing.current_process().pid
+
+        # (1)
+        parent.send(mpq_protocol.REQ_DO, recipient_pid=pid + 1)
+        sender = threading.Timer(0.2, parent.send, args=(mpq_protocol.REQ_FINISHED, ), kwargs={'recipient_pid': pid})
+        sender.start()
+        message = child.receive(timeout=5, func=lambda x: x.recipient_pid == pid)
+        sender.join()
+        assert message[mpq_protocol.S_PID_OFFSET - 1] == mpq_protocol.REQ_FINISHED
+
+        # (2)
+        start = time.monotonic()
+        assert child.receive(timeout=0.2, func=lambda x: x.recipient_pid == pid) is False
+        assert time.monotonic() - start >= 0.2
+        message = child.receive(timeout=1)
+        assert message[mpq_protocol.R_PID_OFFSET] == pid + 1
+        child.queue_join()
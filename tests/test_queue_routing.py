@@ -0,0 +1,145 @@
+import os
+import time
+import pytest
+import multiprocessing
+
+from pymulproc import errors
+from pymulproc import deadletter, mpq_protocol, factory
+
+
+def test_peers_are_registered_once():
+    '''Check that in routed mode each peer claims a mailbox under its own PID and that creating a second peer within
+    the same process hands back the same mailbox
+    '''
+
+    queue_factory = factory.QueueCommunication(routed=True, max_peers=2)
+    parent = queue_factory.parent()
+    assert parent.mailbox is queue_factory.router.mailboxes[0]
+    assert queue_factory.parent().mailbox is parent.mailbox
+    assert queue_factory.router.registry.slot_of(parent.pid) == 0
+    assert queue_factory.router.registry.slot_of(1122) is None
+
+
+def test_peers_fall_back_to_the_shared_queue_when_no_mailboxes_left():
+    '''Check that a process finding every mailbox taken by live processes gets its messages through the shared queue,
+    and that it can not subscribe to topics
+    '''
+
+    queue_factory = factory.QueueCommunication(routed=True, max_peers=1)
+    queue_factory.router.registry.register(os.getppid())
+    parent = queue_factory.parent()
+    assert parent.mailbox is None and not parent.mailboxes
+    parent.send(mpq_protocol.REQ_DO, recipient_pid=parent.pid, data=1)
+    assert parent.receive(timeout=1).data == 1
+    with pytest.raises(errors.QueuesCommunicationError):
+        parent.subscribe('prices')
+    parent.queue_join()
+
+
+def exit_registered(q_factory):
+    q_factory.child()
+
+
+def test_slots_of_processes_gone_are_reclaimed():
+    '''Check that once every slot is taken, the slots of children that exited are given to new processes and what was
+    left in their mailboxes is dead-lettered
+    '''
+
+    queue_factory = factory.QueueCommunication(routed=True, max_peers=2, dead_letters=True)
+    parent = queue_factory.parent()
+    for value in range(4):
+        child_process = multiprocessing.Process(target=exit_registered, args=(queue_factory, ))
+        child_process.start()
+        child_process.join()
+        assert queue_factory.router.registry.slot_of(child_process.pid) == 1
+        parent.send(mpq_protocol.REQ_DO, recipient_pid=child_process.pid, data=value)
+        time.sleep(0.1)
+
+    letters = queue_factory.dead_letters.messages(timeout=1)
+    assert [message.data for _, message in letters] == [0, 1, 2]
+    assert all(reason == deadletter.DEAD_RECIPIENT for reason, _ in letters)
+    letters, work = queue_factory.router.reclaim()
+    assert [parent.decode(frame).data for frame in letters] == [3] and not work
+    assert queue_factory.router.registry.slot_of(child_process.pid) is None
+    parent.queue_join()
+
+
+def test_addressed_messages_go_straight_to_the_recipient_mailbox():
+    '''Check that:
+
+    1) A message addressed to a registered PID is put in its mailbox and not in the shared queue
+    2) The recipient fetches it even if 'func' would have rejected it
+    3) Messages with no recipient or addressed to an unknown PID fall back to the shared queue
+    '''
+
+    queue_factory = factory.QueueCommunication(routed=True, max_peers=2)
+    parent = queue_factory.parent()
+
+    # (1)
+    parent.send(mpq_protocol.REQ_DO, recipient_pid=parent.pid, data=1)
+    time.sleep(0.1)
+    assert queue_factory.queue.empty()
+    assert not parent.mailbox.empty()
+
+    # (2)
+    message = parent.receive(func=lambda x: False)
+    assert message[mpq_protocol.S_PID_OFFSET + 2] == 1
+    assert parent.queue_empty()
+
+    # (3)
+    parent.send(mpq_protocol.REQ_DIE)
+    parent.send(mpq_protocol.REQ_DO, recipient_pid=1122)
+    time.sleep(0.1)
+    assert parent.mailbox.empty()
+    assert parent.receive()[mpq_protocol.S_PID_OFFSET - 1] == mpq_protocol.REQ_DIE
+    assert parent.receive()[mpq_protocol.R_PID_OFFSET] == 1122
+    parent.queue_join()
+
+
+def call_child(q_factory, parent_pid):
+    child = q_factory.child()
+    stop = False
+    while not stop:
+        message = child.receive(block=True)
+        if message:
+            if message[mpq_protocol.S_PID_OFFSET - 1] == mpq_protocol.REQ_DIE:
+                stop = True
+            else:
+                child.send(mpq_protocol.REQ_FINISHED, recipient_pid=parent_pid, data=child.pid)
+
+
+def test_routed_full_duplex_communication_with_children():
+    '''The parent sends a message to each child through its mailbox and each child, and only such child, answers back
+    to the parent's mailbox with its PID. No message is ever requeued as no 'func' is used at either end.
+    '''
+
+    num_children = 4
+    queue_factory = factory.QueueCommunication(routed=True, max_peers=num_children + 1)
+    parent = queue_factory.parent()
+    child_processes = [multiprocessing.Process(target=call_child, args=(queue_factory, parent.pid))
+                       for _ in range(num_children)]
+    for child_process in child_processes:
+        child_process.start()
+
+    # Wait for all children to be registered before addressing them
+    registry = queue_factory.router.registry
+    loops = 100
+    while loops and any(registry.slot_of(child_process.pid) is None for child_process in child_processes):
+        loops -= 1
+        time.sleep(0.05)
+
+    for child_process in child_processes:
+        parent.send(mpq_protocol.REQ_DO, recipient_pid=child_process.pid)
+
+    pids = set()
+    for _ in child_processes:
+        message = parent.receive(block=True)
+        assert message[mpq_protocol.R_PID_OFFSET] == parent.pid
+        pids.add(message[mpq_protocol.S_PID_OFFSET + 2])
+    assert pids == {child_process.pid for child_process in child_processes}
+
+    for _ in child_processes:
+        parent.send(mpq_protocol.REQ_DIE)
+    for child_process in child_processes:
+        child_process.join()
+    parent.queue_join()
@@ -0,0 +1,131 @@
+import hashlib
+import pytest
+import multiprocessing
+
+from pymulproc import errors
+from pymulproc import mpq_protocol, factory, interfaces, ringbuffer, streams
+
+
+def test_records_survive_wrapping_around_the_ring():
+    '''Check that records of all sizes are read back in order and intact while the ring wraps around many times,
+    including when less room than a record header is left at its end
+    '''
+
+    ring = ringbuffer.RingBuffer(capacity=64)
+    first, second = ringbuffer.RingConnection(ring, ring), ringbuffer.RingConnection(ring, ring)
+    for value in range(500):
+        data = bytes([value % 256]) * (value % 29)
+        first.send_bytes(data)
+        assert second.poll()
+        assert second.recv_bytes() == data
+    assert not second.poll()
+
+
+def test_full_ring_and_oversized_records():
+    '''Check that an exception is thrown when a record can never fit in the ring and when the ring remains full for
+    longer than the timeout
+    '''
+
+    first, second = ringbuffer.RingPipe(capacity=64, timeout=0.1)
+    with pytest.raises(errors.RingBufferCommunicationError):
+        first.send_bytes(b'x' * 29)
+
+    first.send_bytes(b'x' * 28)
+    first.send_bytes(b'y' * 28)
+    with pytest.raises(errors.RingBufferCommunicationError):
+        first.send_bytes(b'z' * 28)
+    assert second.recv_bytes() == b'x' * 28
+    first.send_bytes(b'z' * 28)
+    assert second.recv_bytes() == b'y' * 28
+    assert second.recv_bytes() == b'z' * 28
+
+
+def call_child(r_factory, loops):
+    child = r_factory.child()
+    for _ in range(loops):
+        message = child.receive(block=True)
+        child.send(mpq_protocol.REQ_FINISHED, data=message.data + 1)
+
+
+def test_ring_ping_pong_with_child():
+    '''The parent sends a number to the child which sends it back increased by one. The ring is kept small so that it
+    fills up and wraps around many times
+    '''
+
+    loops = 1000
+    ring_factory = factory.RingBufferCommunication(capacity=128)
+    parent = ring_factory.parent()
+    child_process = multiprocessing.Process(target=call_child, args=(ring_factory, loops))
+    child_process.start()
+    value = 0
+    for _ in range(loops):
+        parent.send(mpq_protocol.REQ_DO, data=value)
+        value = parent.receive(timeout=5).data
+    child_process.join()
+    assert value == loops
+    assert child_process.exitcode == 0
+
+
+def send_numbers(r_factory, numbers):
+    child = r_factory.child()
+    child.send_many([(mpq_protocol.REQ_FINISHED, None, None, number) for number in numbers[:10]])
+    for number in numbers[10:]:
+        child.send(mpq_protocol.REQ_FINISHED, data=number)
+
+
+def test_many_children_send_to_parent():
+    '''Check that with 'multi_producer' many children can write into the same ring without corrupting each other's
+    records
+    '''
+
+    ring_factory = factory.RingBufferCommunication(capacity=1024, multi_producer=True)
+    parent = ring_factory.parent()
+    numbers = [list(range(offset * 100, offset * 100 + 100)) for offset in range(4)]
+    child_processes = [multiprocessing.Process(target=send_numbers, args=(ring_factory, chunk)) for chunk in numbers]
+    for child_process in child_processes:
+        child_process.start()
+    received = [parent.receive(timeout=5).data for _ in range(400)]
+    for child_process in child_processes:
+        child_process.join()
+    assert sorted(received) == list(range(400))
+
+
+def test_ring_peers_can_be_waited_on():
+    '''Check that wait_any wakes up when a record lands in the ring, whether it was written before or while waiting,
+    and that it does not once the record has been received
+    '''
+
+    ring_factory = factory.RingBufferCommunication()
+    parent, child = ring_factory.parent(), ring_factory.child()
+    assert interfaces.wait_any([parent], timeout=0.1) == []
+    child.send(mpq_protocol.REQ_DO, data=1)
+    assert interfaces.wait_any([parent], timeout=1) == [parent]
+    assert parent.receive().data == 1
+    assert interfaces.wait_any([parent], timeout=0.1) == []
+
+    child_process = multiprocessing.Process(target=call_child, args=(ring_factory, 1))
+    child_process.start()
+    parent.send(mpq_protocol.REQ_DO, data=1)
+    assert interfaces.wait_any([parent], timeout=5) == [parent]
+    assert parent.receive().data == 2
+    child_process.join()
+
+
+def digest_stream(r_factory):
+    child = r_factory.child()
+    child.send(mpq_protocol.REQ_FINISHED, data=hashlib.sha256(b''.join(child.receive_stream(timeout=5))).hexdigest())
+
+
+def test_stream_chunks_fit_in_the_ring():
+    '''Check that a stream sent with the default chunk size - larger than a ring record may be - is cut into chunks
+    that fit in the ring
+    '''
+
+    payload = bytes(range(256)) * 4096 * 3
+    ring_factory = factory.RingBufferCommunication(capacity=256 * 1024)
+    parent = ring_factory.parent()
+    child_process = multiprocessing.Process(target=digest_stream, args=(ring_factory, ))
+    child_process.start()
+    assert parent.send_stream(payload, timeout=5) > len(payload) // streams.CHUNK_SIZE
+    assert parent.receive(timeout=5).data == hashlib.sha256(payload).hexdigest()
+    child_process.join()
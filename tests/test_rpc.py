@@ -0,0 +1,72 @@
+import concurrent.futures
+import multiprocessing
+import time
+import pytest
+
+from pymulproc import factory, mpq_protocol, rpc
+
+
+def handle(message):
+    '''Square the number received, fail on negative ones and sleep for as long as asked when given a float'''
+    if isinstance(message.data, float):
+        time.sleep(message.data)
+        return message.data
+    if message.data < 0:
+        raise ValueError(message.data)
+    return message.data * message.data
+
+
+def serve(comm_factory):
+    rpc.serve(comm_factory.child(), handle)
+
+
+@pytest.mark.parametrize('factory_class, options', [
+    (factory.PipeCommunication, {}),
+    (factory.PipeCommunication, {'batch_size': 16}),
+    (factory.QueueCommunication, {}),
+    (factory.QueueCommunication, {'routed': True}),
+], ids=['pipe', 'pipe-batched', 'queue', 'queue-routed'])
+def test_pipelined_calls_resolve_their_own_future(factory_class, options):
+    '''Check that many calls in flight over the same connection get each their own reply - or the exception raised by
+    the handler - whatever the order their futures are waited for
+    '''
+
+    comm_factory = factory_class(**options)
+    parent = comm_factory.parent()
+    process = multiprocessing.Process(target=serve, args=(comm_factory, ))
+    process.start()
+    client = rpc.Client(parent, timeout=5)
+    futures = [client.call(value) for value in range(100)]
+    failing = client.call(-1)
+    parent.flush()
+    assert [future.result() for future in reversed(futures)] == [value * value for value in reversed(range(100))]
+    with pytest.raises(ValueError):
+        failing.result()
+    assert client.pump() == 0 and not client.others
+
+    parent.send(mpq_protocol.REQ_DIE)
+    parent.flush()
+    process.join()
+
+
+def test_deadline_expires_without_blocking_other_calls():
+    '''Check that a call whose deadline expires is resolved with TimeoutError, that its late reply is dropped and that
+    the calls made after it are still answered
+    '''
+
+    comm_factory = factory.PipeCommunication()
+    parent = comm_factory.parent()
+    process = multiprocessing.Process(target=serve, args=(comm_factory, ))
+    process.start()
+    client = rpc.Client(parent, timeout=5)
+    slow = client.call(0.3, timeout=0.1)
+    fast = client.call(3)
+    with pytest.raises(concurrent.futures.TimeoutError):
+        slow.result()
+    assert fast.result() == 9
+    with pytest.raises(concurrent.futures.TimeoutError):
+        client.call(0.3).result(timeout=0.05)
+    assert client.pump(timeout=5) == 0
+
+    parent.send(mpq_protocol.REQ_DIE)
+    process.join()
@@ -0,0 +1,78 @@
+import pytest
+
+from pymulproc import errors, factory, mpq_protocol, pipeapi, serializers
+
+DATA = mpq_protocol.S_PID_OFFSET + 2
+
+
+@pytest.mark.parametrize('serializer, data', [
+    ('pickle', {'value': (1, 2)}),
+    ('raw', b'\x00' * 100),
+    ('json', {'value': [1, 2.5, 'three', None]}),
+    pytest.param('msgpack', {'value': [1, b'two']},
+                 marks=pytest.mark.skipif(serializers.msgpack is None, reason='msgpack is not installed')),
+])
+def test_serializers_round_trip_on_both_backends(serializer, data):
+    '''Check that each serializer gets the data across PIPEs and QUEUEs, batches included, and is recorded in the
+    frame
+    '''
+
+    for comm_factory in (factory.PipeCommunication(serializer=serializer),
+                         factory.QueueCommunication(serializer=serializer)):
+        parent = comm_factory.parent()
+        child = comm_factory.child()
+        child.send(mpq_protocol.REQ_DO, data=data)
+        assert parent.receive(timeout=1)[DATA] == data
+        child.send_many([(mpq_protocol.REQ_DO, None, None, data)] * 2)
+        assert [message[DATA] for message in parent.receive_many(2, timeout=1)] == [data] * 2
+
+    frame = mpq_protocol.Message(mpq_protocol.REQ_DO, 1, None, data).encode(serializers.get_serializer(serializer))
+    assert frame[mpq_protocol.FLAGS_OFFSET] >> mpq_protocol.CODEC_SHIFT == serializers.SERIALIZERS[serializer].codec
+
+
+def test_serializer_mismatch_and_unsupported_data_fail_loudly():
+    '''Check that:
+
+    1) a peer receiving data serialized by other serializer raises a ProtocolError
+    2) the raw serializer refuses data that is not bytes-like
+    3) unknown serializers are rejected
+    '''
+
+    # (1)
+    pipe_factory = factory.PipeCommunication()
+    parent = pipe_factory.parent(serializer='json')
+    child = pipe_factory.child()
+    child.send(mpq_protocol.REQ_DO, data=[1])
+    with pytest.raises(errors.ProtocolError):
+        parent.receive(timeout=1)
+    child.send(mpq_protocol.REQ_DIE)
+    assert parent.receive(timeout=1)[DATA] is None  # No payload, nothing to mismatch
+
+    # (2)
+    with pytest.raises(errors.ProtocolError):
+        pipe_factory.child(serializer='raw').send(mpq_protocol.REQ_DO, data='text')
+
+    # (3)
+    with pytest.raises(ValueError):
+        pipe_factory.child(serializer='yaml')
+
+
+def test_pipe_frames_are_read_into_a_reusable_buffer():
+    '''Check that frames larger than the receive buffer make it grow, up to a limit, and that data received before
+    does not change when the buffer is reused
+    '''
+
+    pipe_factory = factory.PipeCommunication(serializer='raw')
+    parent = pipe_factory.parent()
+    child = pipe_factory.child()
+
+    child.send(mpq_protocol.REQ_DO, data=b'a' * 10)
+    first = parent.receive(timeout=1)[DATA]
+    child.send(mpq_protocol.REQ_DO, data=b'b' * 10)
+    assert parent.receive(timeout=1)[DATA] == b'b' * 10
+    assert first == b'a' * 10
+
+    size = pipeapi.RECV_BUFFER_SIZE * 2
+    child.send(mpq_protocol.REQ_DO, data=b'c' * size)
+    assert parent.receive(timeout=1)[DATA] == b'c' * size
+    assert len(parent.inbox) > size
@@ -0,0 +1,157 @@
+import pytest
+import multiprocessing
+
+from pymulproc import mpq_protocol, factory, shm
+
+pytestmark = pytest.mark.skipif(not shm.SUPPORTED, reason='shared memory is not supported on this platform')
+
+THRESHOLD = 1024
+
+
+def call_child(p_factory, data):
+    p_factory.child().send(mpq_protocol.REQ_FINISHED, data=data)
+
+
+def test_large_payloads_travel_through_shared_memory():
+    '''Check that a buffer over the threshold sent from another process is received as a zero-copy view with the same
+    content, while only a small handle goes down the PIPE
+    '''
+
+    pipe_factory = factory.PipeCommunication(shm_threshold=THRESHOLD)
+    parent = pipe_factory.parent()
+    data = bytes(range(256)) * 64
+    child_process = multiprocessing.Process(target=call_child, args=(pipe_factory, data))
+    child_process.start()
+    assert parent.conn.poll(5)
+    frame = parent.conn.recv_bytes()
+    child_process.join()
+    assert len(frame) < THRESHOLD
+
+    message = parent.load(parent.decode(frame))
+    assert isinstance(message.data, memoryview)
+    assert message.data == data
+
+
+def test_small_and_non_buffer_payloads_are_sent_inline():
+    '''Check that payloads under the threshold or that are not buffers are pickled into the message
+    '''
+
+    pipe_factory = factory.PipeCommunication(shm_threshold=THRESHOLD)
+    child = pipe_factory.child()
+    parent = pipe_factory.parent()
+
+    for data in (b'x' * (THRESHOLD - 1), ['x'] * THRESHOLD, 'x' * THRESHOLD):
+        child.send(mpq_protocol.REQ_DO, data=data)
+        assert parent.receive(timeout=1).data == data
+
+    strided = memoryview(b'x' * THRESHOLD * 2)[::2]
+    assert shm.export(strided, THRESHOLD) is strided
+
+
+def test_segment_is_unlinked_once_received():
+    '''Check that the receiver unlinks the segment and that the view outlives any reference to the segment itself
+    '''
+
+    handle = shm.export(b'x' * THRESHOLD, THRESHOLD)
+    assert isinstance(handle, shm.SharedMemoryHandle)
+    view = handle.attach()
+    with pytest.raises(FileNotFoundError):
+        shm.shared_memory.SharedMemory(handle.name)
+    assert bytes(view) == b'x' * THRESHOLD
+
+
+def test_rejected_messages_keep_their_segment():
+    '''Check that a message rejected by 'func' is requeued without releasing its segment so that the process it is for
+    can still fetch it
+    '''
+
+    queue_factory = factory.QueueCommunication(shm_threshold=THRESHOLD)
+    parent = queue_factory.parent()
+    data = b'y' * THRESHOLD
+    parent.send(mpq_protocol.REQ_DO, data=data)
+    assert parent.receive(func=lambda x: False, timeout=1) is False
+    assert parent.receive(timeout=1).data == data
+    parent.queue_join()
+
+
+def test_numpy_arrays_keep_dtype_and_shape():
+    '''Check that numpy arrays are received as arrays with the same dtype, shape and content
+    '''
+
+    numpy = pytest.importorskip('numpy')
+    data = numpy.arange(THRESHOLD, dtype='float64').reshape(32, -1)
+    handle = shm.export(data, THRESHOLD)
+    array = handle.attach()
+    assert array.dtype == data.dtype and array.shape == data.shape
+    assert (array == data).all()
+
+
+def test_shared_memory_needs_pickle_and_failed_frames_release_their_segment(monkeypatch):
+    '''Check that:
+
+    1) shared memory can not be combined with a serializer unable to carry the handles to the segments
+    2) the segment of a message that fails to be encoded is released
+    3) a released segment can no longer be attached, and releasing it again does nothing
+    '''
+
+    # (1)
+    with pytest.raises(ValueError):
+        factory.QueueCommunication(serializer='raw', shm_threshold=THRESHOLD)
+    with pytest.raises(ValueError):
+        factory.PipeCommunication().parent(serializer='json', shm_threshold=THRESHOLD)
+
+    # (2)
+    exported = []
+    peer = factory.PipeCommunication(shm_threshold=THRESHOLD).parent()
+    peer.compressor, peer.compression_threshold = Failing(), 0
+    export = shm.export
+    monkeypatch.setattr(shm, 'export', lambda data, threshold: exported.append(export(data, threshold)) or exported[-1])
+    with pytest.raises(RuntimeError):
+        peer.encode(mpq_protocol.Message(mpq_protocol.REQ_DO, 1, None, b'x' * THRESHOLD))
+
+    # (3)
+    with pytest.raises(FileNotFoundError):
+        exported[0].attach()
+    exported[0].release()
+
+
+def test_discarded_messages_release_their_segment(monkeypatch):
+    '''Check that the segment of a message is released when:
+
+    1) a backpressure policy drops it
+    2) its deadline passes before it is received, even if it travelled in a batch frame
+    '''
+
+    exported = []
+    export = shm.export
+    monkeypatch.setattr(shm, 'export', lambda data, threshold: exported.append(export(data, threshold)) or exported[-1])
+
+    # (1)
+    queue_factory = factory.QueueCommunication(max_size=1, backpressure='drop_newest', shm_threshold=THRESHOLD)
+    parent = queue_factory.parent()
+    parent.send(mpq_protocol.REQ_DO, data=b'a' * THRESHOLD)
+    parent.send(mpq_protocol.REQ_DO, data=b'b' * THRESHOLD)
+    with pytest.raises(FileNotFoundError):
+        exported[1].attach()
+    assert parent.receive(timeout=1).data == b'a' * THRESHOLD
+    parent.queue_join()
+
+    # (2)
+    queue_factory = factory.QueueCommunication(ttl=0, batch_size=2, shm_threshold=THRESHOLD)
+    parent = queue_factory.parent()
+    parent.send(mpq_protocol.REQ_DO, data=b'c' * THRESHOLD)
+    parent.send(mpq_protocol.REQ_DO, data=b'd' * THRESHOLD)
+    assert parent.receive(timeout=1) is False
+    for handle in exported[2:4]:
+        with pytest.raises(FileNotFoundError):
+            handle.attach()
+    parent.queue_join()
+
+
+class Failing:
+    '''Compressor that always fails'''
+
+    codec = 1
+
+    def compress(self, payload):
+        raise RuntimeError('compression failed')
@@ -0,0 +1,136 @@
+import multiprocessing
+import multiprocessing.connection
+import pytest
+import socket
+import time
+
+from pymulproc import errors, factory, mpq_protocol
+
+REQUEST = mpq_protocol.S_PID_OFFSET - 1
+DATA = mpq_protocol.S_PID_OFFSET + 2
+AUTHKEY = b'secret'
+
+
+def echo(socket_factory):
+    '''Send back the data of every message received until told to die'''
+    child = socket_factory.child()
+    while True:
+        message = child.receive(block=True)
+        if message and message[REQUEST] == mpq_protocol.REQ_DIE:
+            break
+        if message:
+            child.send(mpq_protocol.REQ_FINISHED, data=(child.pid, message[DATA]))
+
+
+@pytest.fixture(params=['tcp', 'unix'])
+def socket_factory(request, tmp_path):
+    if request.param == 'tcp':
+        return factory.SocketCommunication(authkey=AUTHKEY)
+    return factory.SocketCommunication(address=str(tmp_path / 'pymulproc.sock'), family='AF_UNIX', authkey=AUTHKEY)
+
+
+def test_parent_talks_to_children_connected_through_sockets(socket_factory):
+    '''Check that children connect with the authkey and that the parent routes addressed messages to their own
+    connection and broadcasts those with no recipient
+    '''
+
+    parent = socket_factory.parent()
+    processes = [multiprocessing.Process(target=echo, args=(socket_factory, )) for _ in range(3)]
+    for process in processes:
+        process.start()
+    while len(parent.peers) < len(processes):
+        parent.receive(timeout=0.1)
+
+    for process in processes:
+        parent.send(mpq_protocol.REQ_DO, recipient_pid=process.pid, data=process.pid)
+    replies = [parent.receive(timeout=5)[DATA] for _ in processes]
+    assert sorted(replies) == sorted((process.pid, process.pid) for process in processes)
+
+    parent.send_many([(mpq_protocol.REQ_DO, None, None, 'all')])
+    assert sorted(parent.receive(timeout=5)[DATA][0] for _ in processes) == sorted(p.pid for p in processes)
+
+    parent.send(mpq_protocol.REQ_DIE)
+    for process in processes:
+        process.join()
+    while parent.peers:
+        parent.receive(timeout=1)  # Disconnected children are forgotten
+    with pytest.raises(errors.SocketCommunicationError):
+        parent.send(mpq_protocol.REQ_DO, recipient_pid=processes[0].pid)
+
+
+def connect_with_wrong_authkey(address):
+    '''Exit with an error unless connecting with the wrong authkey is refused'''
+    try:
+        factory.SocketCommunication(address=address, authkey=b'wrong').child()
+    except multiprocessing.AuthenticationError:
+        return
+    raise SystemExit(1)
+
+
+def reconnect(socket_factory):
+    '''Break the connection before sending so that the child has to reconnect'''
+    child = socket_factory.child()
+    assert socket_factory.child().conn is child.conn  # Pooled
+    child.conn.close()
+    child.send(mpq_protocol.REQ_DO, data=1)
+    assert child.receive(timeout=5)[REQUEST] == mpq_protocol.REQ_DIE
+
+
+def test_wrong_authkey_is_refused_and_children_reconnect():
+    '''Check that a client with the wrong authkey is not registered and that a child whose connection broke reconnects
+    when sending
+    '''
+
+    socket_factory = factory.SocketCommunication(authkey=AUTHKEY)
+    parent = socket_factory.parent()
+    process = multiprocessing.Process(target=connect_with_wrong_authkey, args=(socket_factory.address, ))
+    process.start()
+    parent.receive(timeout=1)
+    process.join()
+    assert process.exitcode == 0
+    assert parent.peers == {}
+
+    process = multiprocessing.Process(target=reconnect, args=(socket_factory, ))
+    process.start()
+    assert parent.receive(timeout=5)[DATA] == 1
+    assert list(parent.peers) == [(socket.gethostname(), process.pid)]
+    parent.send(mpq_protocol.REQ_DIE)
+    process.join()
+    assert process.exitcode == 0
+
+
+def test_children_are_known_by_host_and_pid_and_slow_clients_do_not_hold_up_the_parent():
+    '''Check that:
+
+    (1) A client that never authenticates does not hold up 'receive' nor the clients connecting after it
+    (2) Children with the same PID on different hosts are kept apart, and addressing that PID is refused
+    (3) A broadcast reaches every child still connected even when one that has gone comes first
+    '''
+
+    socket_factory = factory.SocketCommunication(authkey=AUTHKEY)
+    parent = socket_factory.parent()
+    silent = multiprocessing.connection.Client(socket_factory.address)  # Connects but never answers the challenge
+
+    # (1)
+    clients = {}
+    for host in ('gone', 'host-a', 'host-b'):
+        clients[host] = multiprocessing.connection.Client(socket_factory.address, authkey=AUTHKEY)
+        clients[host].send_bytes(mpq_protocol.Message('CONNECT', 4242, data=(host, 4242)).encode())
+        start = time.monotonic()
+        while (host, 4242) not in parent.peers:
+            assert parent.receive(timeout=0.1) is False
+            assert time.monotonic() - start < 5
+    assert sorted(parent.peers) == [('gone', 4242), ('host-a', 4242), ('host-b', 4242)]
+
+    # (2)
+    with pytest.raises(errors.SocketCommunicationError):
+        parent.send(mpq_protocol.REQ_DO, recipient_pid=4242)
+
+    # (3)
+    clients.pop('gone').close()
+    for count in range(3):  # A write into a connection closed at the other end may only fail after the first one
+        parent.send(mpq_protocol.REQ_DO, data=count)
+    for client in clients.values():
+        assert [mpq_protocol.Message.decode(client.recv_bytes()).data for _ in range(3)] == [0, 1, 2]
+    assert sorted(parent.peers) == [('host-a', 4242), ('host-b', 4242)]
+    silent.close()
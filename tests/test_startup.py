@@ -0,0 +1,67 @@
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+from pymulproc import factory, mpq_protocol, pool
+
+DATA = mpq_protocol.S_PID_OFFSET + 2
+
+FACTORIES = {
+    'pipe': factory.PipeCommunication,
+    'queue': lambda **kwargs: factory.QueueCommunication(routed=True, max_peers=2, **kwargs),
+    'ring': factory.RingBufferCommunication,
+}
+
+
+def echo(comm_factory):
+    '''Send back the first message received'''
+    child = comm_factory.child()
+    message = child.receive(timeout=10)
+    child.send(mpq_protocol.REQ_FINISHED, recipient_pid=message.sender_pid, data=message.data)
+
+
+def loaded(name):
+    return name in sys.modules
+
+
+def test_factory_context():
+    '''Check that factories take either a start method or a context, and the default one otherwise
+    '''
+
+    assert factory.PipeCommunication(context='spawn').context.get_start_method() == 'spawn'
+    context = multiprocessing.get_context('spawn')
+    assert factory.QueueCommunication(context=context).context is context
+    assert factory.PipeCommunication().context is multiprocessing.get_context()
+
+
+@pytest.mark.parametrize('backend', sorted(FACTORIES))
+def test_spawned_child(backend):
+    '''Check that the primitives of each factory work with children started from a 'spawn' context
+    '''
+
+    comm_factory = FACTORIES[backend](context='spawn')
+    parent = comm_factory.parent()
+    process = comm_factory.Process(target=echo, args=(comm_factory, ))
+    process.start()
+    parent.send(mpq_protocol.REQ_DO, recipient_pid=process.pid, data=backend)
+    # Until the child registers its mailbox, the request goes through the shared queue the parent may fetch it from
+    message = False
+    while not message:
+        message = parent.receive(timeout=10, func=lambda message: message.recipient_pid == parent.pid)
+    assert message[DATA] == backend
+    process.join()
+
+
+@pytest.mark.skipif('forkserver' not in multiprocessing.get_all_start_methods(), reason='no fork server here')
+def test_warm_pool_reuses_workers():
+    '''Check that a warmed up pool has its workers ready with the modules preloaded, and runs every task on them
+    '''
+
+    with pool.WorkerPool(processes=2, context='forkserver', preload=['json']) as workers:
+        assert workers.warm_up(timeout=10)
+        assert workers.map(loaded, ['json'] * 4) == [True] * 4
+        pids = {workers.submit(os.getpid).result() for _ in range(8)}
+        assert pids <= {worker.pid for worker in workers.workers}
+        assert workers.warm_up(timeout=0)
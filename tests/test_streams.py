@@ -0,0 +1,98 @@
+import hashlib
+import io
+import multiprocessing
+import time
+import pytest
+
+from pymulproc import errors, factory, mpq_protocol
+
+REQUEST = mpq_protocol.S_PID_OFFSET - 1
+DATA = mpq_protocol.S_PID_OFFSET + 2
+PAYLOAD = bytes(range(256)) * 4096  # 1 MiB
+
+
+def take(peer, timeout=5):
+    '''Wait for the next message addressed to the peer, skipping those addressed to others on the shared QUEUE'''
+    deadline = time.monotonic() + timeout
+    message = False
+    while not message and time.monotonic() < deadline:
+        message = peer.receive(timeout=timeout, func=lambda message: message.recipient_pid == peer.pid)
+    return message
+
+
+def consume(comm_factory, parent_pid):
+    '''Digest every stream received and send back the digest, the amount of chunks and the request of the message
+    sent along with the stream, until such request is REQ_DIE'''
+    child = comm_factory.child()
+    child.send(mpq_protocol.REQ_TEST_CHILD, recipient_pid=parent_pid)
+    while True:
+        digest, count = hashlib.sha256(), 0
+        for chunk in child.receive_stream(timeout=5):
+            digest.update(chunk if isinstance(chunk, bytes) else repr(chunk).encode())
+            count += 1
+        request = take(child)[REQUEST]
+        child.send(mpq_protocol.REQ_FINISHED, recipient_pid=parent_pid, data=(digest.hexdigest(), count, request))
+        if request == mpq_protocol.REQ_DIE:
+            break
+
+
+@pytest.mark.parametrize('factory_class, options', [
+    (factory.PipeCommunication, {}),
+    (factory.QueueCommunication, {}),
+    (factory.QueueCommunication, {'routed': True, 'max_size': 4}),
+], ids=['pipe', 'queue', 'queue-routed'])
+def test_streams_arrive_whole_and_in_order(factory_class, options):
+    '''Check that buffers, file objects and iterables are streamed in order, and that a message sent before a stream
+    is still received once the stream is over
+    '''
+
+    comm_factory = factory_class(**options)
+    parent = comm_factory.parent()
+    process = multiprocessing.Process(target=consume, args=(comm_factory, parent.pid))
+    process.start()
+
+    assert parent.receive(timeout=5)[REQUEST] == mpq_protocol.REQ_TEST_CHILD
+
+    parent.send(mpq_protocol.REQ_TEST_PARENT, recipient_pid=process.pid)
+    assert parent.send_stream(PAYLOAD, recipient_pid=process.pid, chunk_size=64 * 1024, window=4, timeout=5) == 16
+    assert take(parent)[DATA] == (hashlib.sha256(PAYLOAD).hexdigest(), 16, mpq_protocol.REQ_TEST_PARENT)
+
+    parent.send(mpq_protocol.REQ_DO, recipient_pid=process.pid)
+    assert parent.send_stream(io.BytesIO(PAYLOAD), recipient_pid=process.pid, chunk_size=100 * 1000) == 11
+    assert take(parent)[DATA] == (hashlib.sha256(PAYLOAD).hexdigest(), 11, mpq_protocol.REQ_DO)
+
+    parent.send(mpq_protocol.REQ_DIE, recipient_pid=process.pid)
+    parent.send_stream(({'item': value} for value in range(3)), recipient_pid=process.pid, window=1)
+    expected = hashlib.sha256(b''.join(repr({'item': value}).encode() for value in range(3))).hexdigest()
+    assert take(parent)[DATA] == (expected, 3, mpq_protocol.REQ_DIE)
+    process.join()
+
+
+def test_sender_gives_up_when_stream_is_not_taken():
+    '''Check that the sender stops once its window is full and raises an exception if the receiver does not take any
+    chunk in time
+    '''
+
+    comm_factory = factory.PipeCommunication()
+    parent = comm_factory.parent()
+    child = comm_factory.child()
+    with pytest.raises(errors.StreamCommunicationError):
+        parent.send_stream(PAYLOAD, chunk_size=1024, window=2, timeout=0.1)
+    assert child.receive()[REQUEST] == mpq_protocol.REQ_STREAM
+    assert child.receive()[REQUEST] == mpq_protocol.REQ_STREAM
+    assert not child.receive()
+
+
+def test_streams_over_shared_queues_need_a_recipient():
+    '''Check that a stream with no recipient is refused by peers whose messages could be taken by many processes,
+    before any chunk is sent
+    '''
+
+    queue_factory = factory.QueueCommunication()
+    parent = queue_factory.parent()
+    with pytest.raises(ValueError):
+        parent.send_stream(PAYLOAD)
+    assert parent.queue_empty()
+
+    with pytest.raises(ValueError):
+        factory.PipeHub(max_children=1).parent().send_stream(PAYLOAD)
@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import time
+
+from pymulproc import factory, mpq_protocol, supervisor
+
+REQUEST = mpq_protocol.S_PID_OFFSET - 1
+DATA = mpq_protocol.S_PID_OFFSET + 2
+
+
+def echo(comm_factory):
+    '''Tell the parent we are up and send back every message addressed to us until told to die. 'crash' makes the
+    process die abruptly'''
+    child = comm_factory.child()
+    pid = multiprocessing.current_process().pid
+    parent_pid = multiprocessing.parent_process().pid
+    child.send(mpq_protocol.REQ_TEST_CHILD, recipient_pid=parent_pid)
+    while True:
+        message = child.receive(block=True, func=lambda message: message.recipient_pid == pid)
+        if not message:
+            continue
+        if message[REQUEST] == mpq_protocol.REQ_DIE:
+            break
+        if message[DATA] == 'crash':
+            os._exit(1)
+        child.send(mpq_protocol.REQ_FINISHED, recipient_pid=parent_pid, data=message[DATA])
+
+
+def hang(comm_factory):
+    '''Send a single heartbeat and hang'''
+    supervisor.Heartbeat(comm_factory.child()).beat()
+    time.sleep(60)
+
+
+def for_parent(message):
+    return message.recipient_pid == os.getpid()
+
+
+def test_dead_child_is_replaced_with_its_mailbox_intact():
+    '''Check that a child that crashes is replaced straight away by a process that gets the messages left in the
+    mailbox of its predecessor
+    '''
+
+    queue_factory = factory.QueueCommunication(routed=True, max_peers=3)
+    with supervisor.Supervisor(queue_factory, echo) as parent:
+        assert parent.receive(timeout=5, func=for_parent)[REQUEST] == mpq_protocol.REQ_TEST_CHILD
+        dead_pid = next(iter(parent.children))
+        for data in ('crash', 'first', 'second'):
+            parent.peer.send(mpq_protocol.REQ_DO, recipient_pid=dead_pid, data=data)
+
+        assert parent.receive(timeout=5, func=for_parent)[REQUEST] == mpq_protocol.REQ_TEST_CHILD
+        replies = [parent.receive(timeout=5, func=for_parent) for _ in range(2)]
+        assert [reply[DATA] for reply in replies] == ['first', 'second']
+        assert parent.restarts == 1 and dead_pid not in parent.children
+        assert replies[0].sender_pid in parent.children
+    assert not parent.children
+
+
+def test_messages_to_dead_child_are_dead_lettered():
+    '''Check that, with no restart, messages addressed to a dead child are taken out of the shared queue and handed
+    to the dead letter callback, so that joining the queue does not hang
+    '''
+
+    queue_factory = factory.QueueCommunication()
+    dead_letters = []
+    with supervisor.Supervisor(queue_factory, echo, restart=False, dead_letter=dead_letters.append) as parent:
+        assert parent.receive(timeout=5, func=for_parent)[REQUEST] == mpq_protocol.REQ_TEST_CHILD
+        dead_pid = next(iter(parent.children))
+        parent.peer.send(mpq_protocol.REQ_DO, recipient_pid=dead_pid, data='crash')
+        parent.children[dead_pid].join(5)
+        for data in ('first', 'second'):
+            parent.peer.send(mpq_protocol.REQ_DO, recipient_pid=dead_pid, data=data)
+        start = time.monotonic()
+        while parent.children and time.monotonic() - start < 5:
+            parent.receive(timeout=0.1, func=for_parent)
+        assert sorted(message[DATA] for message in dead_letters) == ['first', 'second']
+    parent.peer.queue_join()
+
+
+def test_batched_messages_to_dead_child_are_dead_lettered():
+    '''Check that messages addressed to a dead child are dead-lettered even when they travel in a batch frame, while
+    the other messages of the batch are put back into the shared queue
+    '''
+
+    queue_factory = factory.QueueCommunication()
+    dead_letters = []
+    with supervisor.Supervisor(queue_factory, echo, restart=False, dead_letter=dead_letters.append) as parent:
+        assert parent.receive(timeout=5, func=for_parent)[REQUEST] == mpq_protocol.REQ_TEST_CHILD
+        dead_pid = next(iter(parent.children))
+        parent.peer.send(mpq_protocol.REQ_DO, recipient_pid=dead_pid, data='crash')
+        parent.children[dead_pid].join(5)
+        parent.peer.send_many([(mpq_protocol.REQ_DO, None, dead_pid, 'first'),
+                               (mpq_protocol.REQ_DO, None, parent.pid, 'kept'),
+                               (mpq_protocol.REQ_DO, None, dead_pid, 'second')])
+        message = parent.receive(timeout=5, func=for_parent)
+        assert message[DATA] == 'kept' and not parent.children
+        assert sorted(message[DATA] for message in dead_letters) == ['first', 'second']
+    parent.peer.queue_join()
+
+
+def test_silent_child_is_terminated_and_replaced():
+    '''Check that a child sending no heartbeat for longer than the timeout is deemed hung and replaced
+    '''
+
+    pipe_factory = factory.PipeCommunication()
+    parent = supervisor.Supervisor(pipe_factory, hang, heartbeat_timeout=0.5)
+    parent.start()
+    first_pid = next(iter(parent.children))
+    start = time.monotonic()
+    while not parent.restarts and time.monotonic() - start < 5:
+        assert not parent.receive(timeout=0.1)
+    assert parent.restarts == 1 and first_pid not in parent.children
+    parent.stop(timeout=0.1)
+    assert not parent.children
@@ -0,0 +1,112 @@
+import multiprocessing
+import time
+
+from pymulproc import factory, mpq_protocol, routing
+
+REQUEST = mpq_protocol.S_PID_OFFSET - 1
+DATA = mpq_protocol.S_PID_OFFSET + 2
+
+
+def work(queue_factory, parent_pid, delay):
+    '''Take work until told to die, sleeping 'delay' seconds for each piece of work, and report how much was done'''
+    child = queue_factory.child()
+    child.send(mpq_protocol.REQ_TEST_CHILD, recipient_pid=parent_pid)
+    done = []
+    while True:
+        message = child.receive(block=True)
+        if message[REQUEST] == mpq_protocol.REQ_DIE:
+            break
+        time.sleep(delay)
+        done.append(message[DATA])
+    child.send(mpq_protocol.REQ_FINISHED, recipient_pid=parent_pid, data=(delay, done))
+
+
+def test_work_goes_to_the_inboxes_of_the_workers():
+    '''Check that messages with no recipient are put into a worker's inbox rather than into the shared queue, while
+    those sent by the workers themselves still go through the shared queue
+    '''
+
+    queue_factory = factory.QueueCommunication(distribution=routing.ROUND_ROBIN, max_peers=2)
+    parent = queue_factory.parent()
+    child = queue_factory.child()
+
+    parent.send(mpq_protocol.REQ_DO, data=1)
+    time.sleep(0.1)
+    assert queue_factory.queue.empty() and not child.inbox.empty()
+    assert child.receive(timeout=1)[DATA] == 1
+
+    child.send(mpq_protocol.REQ_DO, data=2)
+    assert parent.receive(timeout=1)[DATA] == 2
+    parent.queue_join()
+
+
+def test_least_loaded_dispatch():
+    '''Check that the worker with less work waiting gets the next piece of work and that ties are broken in turns
+    '''
+
+    router = routing.MailboxRouter(max_peers=2, distribution=routing.LEAST_LOADED)
+    first, second = router.register_worker(1111), router.register_worker(2222)
+    dispatcher = routing.Dispatcher(router)
+    picks = {id(dispatcher.pick()) for _ in range(2)}
+    assert picks == {id(first), id(second)}
+
+    first.put(b'')
+    assert all(dispatcher.pick() is second for _ in range(3))
+
+
+def test_idle_workers_steal_from_busy_siblings():
+    '''Check that all work is done once and that a fast worker steals most of the work dispatched in turns to a slow one
+    '''
+
+    queue_factory = factory.QueueCommunication(distribution=routing.ROUND_ROBIN, max_peers=3)
+    parent = queue_factory.parent()
+    processes = [multiprocessing.Process(target=work, args=(queue_factory, parent.pid, delay)) for delay in (0.3, 0)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        assert parent.receive(timeout=5)[REQUEST] == mpq_protocol.REQ_TEST_CHILD
+
+    for value in range(20):
+        parent.send(mpq_protocol.REQ_DO, data=value)
+    time.sleep(1)
+    for _ in processes:
+        parent.send(mpq_protocol.REQ_DIE)
+    reports = dict(parent.receive(timeout=5)[DATA] for _ in processes)
+    for process in processes:
+        process.join()
+
+    assert sorted(reports[0.3] + reports[0]) == list(range(20))
+    assert len(reports[0]) > 15
+
+
+def test_control_requests_overtake_dispatched_work():
+    '''Check that with priority lanes a REQ_DIE sent with no recipient after plenty of work is not queued behind such
+    work in the inboxes of the workers, which die before getting through it
+    '''
+
+    queue_factory = factory.QueueCommunication(distribution=routing.ROUND_ROBIN, max_peers=3, lanes=2)
+    parent = queue_factory.parent()
+    for_parent = lambda message: message.recipient_pid == parent.pid
+    processes = [multiprocessing.Process(target=work, args=(queue_factory, parent.pid, 0.05)) for _ in range(2)]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        assert parent.receive(timeout=5)[REQUEST] == mpq_protocol.REQ_TEST_CHILD
+
+    for value in range(40):
+        parent.send(mpq_protocol.REQ_DO, data=value)
+    time.sleep(0.2)
+    for _ in processes:
+        parent.send(mpq_protocol.REQ_DIE)
+    start = time.monotonic()
+    reports = []
+    while len(reports) < len(processes) and time.monotonic() - start < 5:
+        message = parent.receive(timeout=0.1, func=for_parent)
+        if message:
+            reports.append(message[DATA])
+    for process in processes:
+        process.join()
+
+    assert time.monotonic() - start < 1
+    done = [value for _, values in reports for value in values]
+    assert len(done) == len(set(done)) and len(done) < 40
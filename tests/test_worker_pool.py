@@ -0,0 +1,95 @@
+import operator
+import os
+import threading
+import time
+
+import pytest
+
+from pymulproc import errors, pool
+
+
+def square(value):
+    return value * value
+
+
+def test_submit_resolves_each_future_with_its_own_result():
+    '''Check that futures get the result of their own task and that a failing task resolves its future with the
+    exception raised by the worker
+    '''
+
+    with pool.WorkerPool(processes=3) as workers:
+        futures = [workers.submit(operator.add, value, 1) for value in range(20)]
+        assert [future.result(timeout=5) for future in futures] == list(range(1, 21))
+
+        future = workers.submit(operator.truediv, 1, 0)
+        with pytest.raises(ZeroDivisionError):
+            future.result(timeout=5)
+
+
+def test_map_and_imap_unordered_in_chunks():
+    '''Check that 'map' keeps the order of the items whatever the chunk size and that 'imap_unordered' yields every
+    result
+    '''
+
+    with pool.WorkerPool(processes=2) as workers:
+        for chunksize in (1, 7, 100):
+            assert workers.map(square, range(50), chunksize=chunksize) == [square(value) for value in range(50)]
+        assert sorted(workers.imap_unordered(square, range(50), chunksize=8)) == [square(value) for value in range(50)]
+
+
+def test_close_waits_for_pending_tasks():
+    '''Check that closing the pool lets the workers finish the tasks already sent before they die
+    '''
+
+    workers = pool.WorkerPool(processes=2)
+    futures = [workers.submit(square, value) for value in range(10)]
+    workers.close()
+    assert all(future.done() for future in futures)
+    assert not any(worker.is_alive() for worker in workers.workers)
+    assert workers.tasks.queue_empty() and workers.results.queue_empty()
+    with pytest.raises(RuntimeError):
+        workers.submit(square, 1)
+
+
+def test_unpicklable_outcome_resolves_its_future():
+    '''Check that a task whose result can not be sent back resolves its future with an error, and that the worker
+    survives it
+    '''
+
+    with pool.WorkerPool(processes=1) as workers:
+        with pytest.raises(errors.ProtocolError):
+            workers.submit(threading.Lock).result(timeout=5)
+        assert workers.submit(square, 3).result(timeout=5) == 9
+
+
+def test_expired_tasks_fail_their_future_and_workers_go_on():
+    '''Check that a task whose deadline passes while it waits for a worker fails its future, and that the worker keeps
+    taking tasks after it
+    '''
+
+    with pool.WorkerPool(processes=1, ttl=0.5) as workers:
+        slow = workers.submit(time.sleep, 1)
+        expired = workers.submit(square, 3)
+        assert slow.result(timeout=5) is None
+        with pytest.raises(errors.WorkerPoolError):
+            expired.result(timeout=5)
+        assert workers.submit(square, 4).result(timeout=5) == 16
+
+
+def test_futures_of_dead_workers_fail():
+    '''Check that:
+
+    1) the future of the task a worker was running when it died fails
+    2) once no worker is left, every pending future fails and no task can be submitted any more
+    '''
+
+    with pool.WorkerPool(processes=1) as workers:
+        # (1)
+        with pytest.raises(errors.WorkerPoolError):
+            workers.submit(os._exit, 1).result(timeout=5)
+
+        # (2)
+        with pytest.raises(errors.WorkerPoolError):
+            workers.submit(square, 3).result(timeout=5)
+        with pytest.raises(errors.WorkerPoolError):
+            workers.submit(square, 3)